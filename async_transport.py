@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+import asyncio
+import atexit
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from storage import READ_BLOCK_SIZE, FTPStorage, LocalStorage, SFTPStorage
+from throttle import default_throttle
+from transport import ConnectionPool, default_pool
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+try:
+    import aioftp
+except ImportError:
+    aioftp = None
+
+MAX_IN_FLIGHT = 16
+# Liczba równoległych żądań odczytu/zapisu jednego pliku SFTP (put/get)
+SFTP_MAX_REQUESTS = 64
+
+
+async def consume_upload(size):
+    # Kubełek żetonów usypia wątek - przy aktywnym limicie czekanie odbywa
+    # się poza pętlą zdarzeń, aby nie wstrzymywać pozostałych operacji
+    default_throttle.refresh()
+    if default_throttle.buckets['upload_kbps'].rate > 0:
+        await asyncio.get_running_loop().run_in_executor(None, default_throttle.consume, 'upload_kbps', size)
+
+
+async def read_local(f, size):
+    return await asyncio.get_running_loop().run_in_executor(None, f.read, size)
+
+
+class AsyncSFTPSession:
+    # Jedno połączenie SSH i jeden kanał SFTP (asyncssh) dla wszystkich
+    # operacji: żądania wielu wysyłań, listowań i usunięć są w locie
+    # jednocześnie (potokowo), bez wątku na połączenie
+    def __init__(self, settings, max_in_flight):
+        self.settings = settings
+        self.limit = asyncio.Semaphore(max_in_flight)
+        self.conn = None
+        self.sftp = None
+        self.broken = False
+
+    async def connect(self):
+        self.conn = await asyncssh.connect(
+            self.settings['host'],
+            port=self.settings['port'],
+            username=self.settings['username'],
+            client_keys=[self.settings['key_path']],
+            known_hosts=None
+        )
+        self.sftp = await self.conn.start_sftp_client()
+
+    def is_open(self):
+        return self.conn is not None and not self.broken
+
+    @staticmethod
+    def is_connection_error(error):
+        return isinstance(error, (asyncssh.DisconnectError, ConnectionError))
+
+    @staticmethod
+    def translate(error):
+        # Błędy zgodne z SFTPStorage (paramiko zgłasza IOError/OSError)
+        if isinstance(error, asyncssh.SFTPNoSuchFile):
+            return FileNotFoundError(str(error))
+        if isinstance(error, asyncssh.Error):
+            return OSError(str(error))
+        return error
+
+    async def makedirs(self, path):
+        current = ''
+        for part in path.split('/'):
+            if not part:
+                continue
+            current = posixpath.join(current, part) if current else part
+            if not await self.sftp.isdir(current):
+                await self.sftp.mkdir(current)
+
+    async def listdir(self, path):
+        try:
+            names = await self.sftp.listdir(path or '.')
+        except asyncssh.SFTPError:
+            return []
+        return [name for name in names if name not in ('.', '..')]
+
+    async def read(self, path, offset=0, length=None):
+        async with self.sftp.open(path, 'rb') as f:
+            return await f.read(-1 if length is None else length, offset)
+
+    async def size(self, path):
+        return (await self.sftp.stat(path)).size
+
+    async def version(self, path):
+        try:
+            attrs = await self.sftp.stat(path)
+        except asyncssh.SFTPError:
+            return None
+        return [attrs.size, attrs.mtime]
+
+    async def write(self, path, data):
+        tmp_path = path + '.tmp'
+        await consume_upload(len(data))
+        async with self.sftp.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        try:
+            await self.sftp.posix_rename(tmp_path, path)
+            return
+        except asyncssh.SFTPError:
+            pass
+        # asyncssh wysyła posix-rename tylko do serwerów, które go ogłaszają;
+        # zwykły rename w SFTP v3 nie nadpisuje istniejącego pliku
+        try:
+            await self.sftp.rename(tmp_path, path)
+        except asyncssh.SFTPError:
+            await self.sftp.remove(path)
+            await self.sftp.rename(tmp_path, path)
+
+    async def remove(self, path):
+        await self.sftp.remove(path)
+
+    async def rmdir(self, path):
+        await self.sftp.rmdir(path)
+
+    async def put(self, local_path, path):
+        default_throttle.refresh()
+        if default_throttle.buckets['upload_kbps'].rate <= 0:
+            await self.sftp.put(local_path, path, block_size=READ_BLOCK_SIZE, max_requests=SFTP_MAX_REQUESTS)
+            return
+        # Z limitem przepustowości bloki wysyłane są kolejno po pobraniu żetonów
+        with open(local_path, 'rb') as f:
+            async with self.sftp.open(path, 'wb') as remote_file:
+                offset = 0
+                while True:
+                    data = await read_local(f, READ_BLOCK_SIZE)
+                    if not data:
+                        break
+                    await consume_upload(len(data))
+                    await remote_file.write(data, offset)
+                    offset += len(data)
+
+    async def get(self, path, local_path):
+        await self.sftp.get(path, local_path, block_size=READ_BLOCK_SIZE, max_requests=SFTP_MAX_REQUESTS)
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            await self.conn.wait_closed()
+
+
+class AsyncFTPSession:
+    # FTP nie ma potokowania żądań - każda równoległa operacja potrzebuje
+    # własnego połączenia sterującego. Klienci aioftp czekają w puli na
+    # kolejne operacje, wszystkie obsługiwane przez jedną pętlę zdarzeń.
+    def __init__(self, settings, max_in_flight):
+        self.settings = settings
+        self.limit = asyncio.Semaphore(max_in_flight)
+        self.idle = []
+        self.broken = False
+
+    async def connect(self):
+        # Pierwsze połączenie sprawdza dane logowania przed operacjami
+        self.idle.append(await self.new_client())
+
+    async def new_client(self):
+        client = aioftp.Client()
+        await client.connect(self.settings['host'], self.settings['port'])
+        await client.login(self.settings['username'], self.settings['password'])
+        return client
+
+    def is_open(self):
+        return not self.broken
+
+    @staticmethod
+    def is_connection_error(error):
+        return isinstance(error, ConnectionError)
+
+    @staticmethod
+    def translate(error):
+        if isinstance(error, aioftp.StatusCodeError):
+            if any(str(code).startswith('550') for code in error.received_codes):
+                return FileNotFoundError(str(error))
+            return OSError(str(error))
+        return error
+
+    @asynccontextmanager
+    async def client(self):
+        client = self.idle.pop() if self.idle else await self.new_client()
+        try:
+            yield client
+        except (ConnectionError, asyncio.TimeoutError):
+            # Stan połączenia po błędzie sieci jest nieznany - nie wraca do puli
+            client.close()
+            raise
+        self.idle.append(client)
+
+    async def makedirs(self, path):
+        async with self.client() as client:
+            if path:
+                await client.make_directory(path, parents=True)
+
+    async def listdir(self, path):
+        async with self.client() as client:
+            try:
+                entries = await client.list(path or '')
+            except aioftp.StatusCodeError:
+                return []
+        return [posixpath.basename(str(name)) for name, info in entries]
+
+    async def read(self, path, offset=0, length=None):
+        buffer = bytearray()
+        async with self.client() as client:
+            try:
+                async with client.download_stream(path, offset=offset) as stream:
+                    async for block in stream.iter_by_block(READ_BLOCK_SIZE):
+                        buffer += block
+                        if length is not None and len(buffer) >= length:
+                            break
+            except aioftp.StatusCodeError:
+                # 426 - serwer potwierdza przerwanie transferu przed końcem pliku
+                if length is None or len(buffer) < length:
+                    raise
+        return bytes(buffer if length is None else buffer[:length])
+
+    async def size(self, path):
+        async with self.client() as client:
+            return int((await client.stat(path))['size'])
+
+    async def version(self, path):
+        async with self.client() as client:
+            try:
+                info = await client.stat(path)
+            except aioftp.StatusCodeError:
+                return None
+        return [int(info['size']), info.get('modify')]
+
+    async def write(self, path, data):
+        tmp_path = path + '.tmp'
+        async with self.client() as client:
+            async with client.upload_stream(tmp_path) as stream:
+                for offset in range(0, len(data), READ_BLOCK_SIZE):
+                    block = data[offset:offset + READ_BLOCK_SIZE]
+                    await consume_upload(len(block))
+                    await stream.write(block)
+            try:
+                await client.rename(tmp_path, path)
+            except aioftp.StatusCodeError:
+                # Część serwerów nie nadpisuje istniejącego pliku przy RNTO
+                await client.remove_file(path)
+                await client.rename(tmp_path, path)
+
+    async def remove(self, path):
+        async with self.client() as client:
+            await client.remove_file(path)
+
+    async def rmdir(self, path):
+        async with self.client() as client:
+            await client.remove_directory(path)
+
+    async def put(self, local_path, path):
+        with open(local_path, 'rb') as f:
+            async with self.client() as client:
+                async with client.upload_stream(path) as stream:
+                    while True:
+                        data = await read_local(f, READ_BLOCK_SIZE)
+                        if not data:
+                            break
+                        await consume_upload(len(data))
+                        await stream.write(data)
+
+    async def get(self, path, local_path):
+        with open(local_path, 'wb') as f:
+            async with self.client() as client:
+                async with client.download_stream(path) as stream:
+                    async for block in stream.iter_by_block(READ_BLOCK_SIZE):
+                        f.write(block)
+
+    async def close(self):
+        clients, self.idle = self.idle, []
+        for client in clients:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+
+class ThreadedSession:
+    # Zastępstwo bez asyncssh/aioftp: operacje ftplib/paramiko w puli
+    # wątków, każda na połączeniu z puli połączeń. Liczba operacji w locie
+    # jest taka sama, ale każda zajmuje wątek i własną sesję.
+    STORAGE_TYPES = {
+        'ftp': FTPStorage,
+        'ssh': SFTPStorage
+    }
+
+    def __init__(self, kind, settings, max_in_flight, pool=default_pool):
+        self.kind = kind
+        self.settings = settings
+        self.pool = pool
+        self.limit = asyncio.Semaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_in_flight, thread_name_prefix=f'async-{kind}')
+        self.broken = False
+
+    async def connect(self):
+        pass
+
+    def is_open(self):
+        return not self.broken
+
+    @staticmethod
+    def is_connection_error(error):
+        # Zerwane połączenia odrzuca pula połączeń, sesja pozostaje ważna
+        return False
+
+    @staticmethod
+    def translate(error):
+        return error
+
+    def run(self, operation, args):
+        storage = self.STORAGE_TYPES[self.kind](self.pool.acquire(self.kind, self.settings), '', self.pool)
+        with storage:
+            return getattr(storage, operation)(*args)
+
+    async def call(self, operation, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.run, operation, args)
+
+    async def makedirs(self, path):
+        await self.call('makedirs', path)
+
+    async def listdir(self, path):
+        return await self.call('listdir', path)
+
+    async def read(self, path, offset=0, length=None):
+        if length is None and not offset:
+            return await self.call('read_bytes', path)
+        if length is None:
+            length = await self.size(path) - offset
+        return await self.call('read_range', path, offset, length)
+
+    async def size(self, path):
+        return await self.call('size', path)
+
+    async def version(self, path):
+        return await self.call('version', path)
+
+    async def write(self, path, data):
+        await self.call('write_bytes', path, data)
+
+    async def remove(self, path):
+        await self.call('delete', path)
+
+    async def rmdir(self, path):
+        await self.call('rmdir', path)
+
+    async def put(self, local_path, path):
+        await self.call('upload_file', local_path, path)
+
+    async def get(self, path, local_path):
+        await self.call('download_file', path, local_path)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def session_type(kind):
+    if kind == 'ssh' and asyncssh is not None:
+        return 'asyncssh'
+    if kind == 'ftp' and aioftp is not None:
+        return 'aioftp'
+    return 'threads'
+
+
+class AsyncEngine:
+    # Pętla asyncio w jednym wątku tła, wspólna dla procesu (jak pula
+    # połączeń). Sesje kluczowane są tak jak w puli: (typ, host, port, użytkownik).
+    def __init__(self, pool=default_pool):
+        self.pool = pool
+        self.loop = None
+        self.thread = None
+        self.sessions = {}
+        self._session_lock = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='async-transport', daemon=True)
+                self.thread.start()
+
+    def run(self, coro):
+        # Wywołanie z kodu synchronicznego: czeka na wynik korutyny
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def session(self, kind, settings, max_in_flight):
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+        key = ConnectionPool.key(kind, settings)
+        async with self._session_lock:
+            session = self.sessions.get(key)
+            if session is None or not session.is_open():
+                if session is not None:
+                    await self.close_session(session)
+                backend = session_type(kind)
+                if backend == 'asyncssh':
+                    session = AsyncSFTPSession(settings, max_in_flight)
+                elif backend == 'aioftp':
+                    session = AsyncFTPSession(settings, max_in_flight)
+                else:
+                    session = ThreadedSession(kind, settings, max_in_flight, self.pool)
+                await session.connect()
+                self.sessions[key] = session
+            return session
+
+    async def call(self, kind, settings, max_in_flight, operation, *args):
+        session = await self.session(kind, settings, max_in_flight)
+        async with session.limit:
+            try:
+                return await getattr(session, operation)(*args)
+            except Exception as e:
+                if session.is_connection_error(e):
+                    session.broken = True
+                error = session.translate(e)
+                if error is e:
+                    raise
+                raise error from e
+
+    async def gather(self, kind, settings, max_in_flight, operation, arguments):
+        # Wszystkie operacje w locie naraz, ograniczone semaforem sesji;
+        # wyniki w kolejności argumentów, pierwszy błąd przerywa całość
+        return await asyncio.gather(*(self.call(kind, settings, max_in_flight, operation, *args)
+                                      for args in arguments))
+
+    async def close_session(self, session):
+        try:
+            await session.close()
+        except Exception:
+            pass
+
+    async def _close_all(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            await self.close_session(session)
+
+    def close_all(self):
+        if self.loop is None:
+            return
+        self.run(self._close_all())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self._session_lock = None
+
+
+class AsyncStorage(FTPStorage):
+    # Miejsce docelowe FTP/SFTP obsługiwane przez silnik asyncio, z tym
+    # samym interfejsem co FTPStorage/SFTPStorage. Operacje na wielu
+    # plikach (write_many, read_many, delete_many...) wysyłają wszystkie
+    # żądania naraz zamiast czekać na każdą odpowiedź po kolei.
+    def __init__(self, engine, kind, settings, root='', max_in_flight=MAX_IN_FLIGHT):
+        LocalStorage.__init__(self, root)
+        self.engine = engine
+        self.kind = kind
+        self.settings = settings
+        self.max_in_flight = max_in_flight
+
+    def call(self, operation, *args):
+        return self.engine.run(self.engine.call(self.kind, self.settings, self.max_in_flight, operation, *args))
+
+    def gather(self, operation, arguments):
+        return self.engine.run(self.engine.gather(self.kind, self.settings, self.max_in_flight, operation, arguments))
+
+    def makedirs(self, name=''):
+        self.call('makedirs', self.path(name))
+
+    def listdir(self, name=''):
+        return self.call('listdir', self.path(name))
+
+    def read_bytes(self, name):
+        return self.call('read', self.path(name))
+
+    def read_range(self, name, offset, length):
+        return self.call('read', self.path(name), offset, length)
+
+    def size(self, name):
+        return self.call('size', self.path(name))
+
+    def version(self, name):
+        return self.call('version', self.path(name))
+
+    def write_bytes(self, name, data):
+        self.call('write', self.path(name), data)
+
+    def delete(self, name):
+        self.call('remove', self.path(name))
+
+    def rmdir(self, name):
+        self.call('rmdir', self.path(name))
+
+    def upload_file(self, local_path, name):
+        self.call('put', local_path, self.path(name))
+
+    def download_file(self, name, local_path):
+        self.call('get', self.path(name), local_path)
+
+    def write_many(self, items):
+        self.gather('write', [(self.path(name), data) for name, data in items])
+
+    def read_many(self, names):
+        return self.gather('read', [(self.path(name),) for name in names])
+
+    def size_many(self, names):
+        return self.gather('size', [(self.path(name),) for name in names])
+
+    def delete_many(self, names):
+        self.gather('remove', [(self.path(name),) for name in names])
+
+    def close(self, failed=False):
+        # Sesje zostają w silniku do ponownego użycia
+        pass
+
+
+def open_async_storage(config, backup_type, root=''):
+    settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+    max_in_flight = config['backup_settings'].get('async_max_in_flight', MAX_IN_FLIGHT)
+    return AsyncStorage(default_engine, backup_type, config[settings_key], root, max_in_flight)
+
+
+default_engine = AsyncEngine()
+atexit.register(default_engine.close_all)
@@ -1,67 +1,142 @@
 #!/usr/bin/env python3
+import argparse
 import json
 import os
+import signal
 import sys
 from datetime import datetime
+from throttle import default_throttle
 
 CONFIG_FILE = 'config.json'
 
+# Kody wyjścia trybu wiersza poleceń (2 zwraca argparse przy błędnych argumentach)
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_LOCKED = 3
+
+TARGETS = ('files', 'database', 'all', 'jobs', 'logs')
+REPLICA_HELP = 'Miejsce docelowe z listy targets w trybie fanout (domyślnie pierwsze)'
+
+def default_config():
+    # Domyślna konfiguracja; zapisywana przy pierwszym uruchomieniu
+    return {
+        'backup_locations': {
+            'source': '',
+            'destination': '',
+            'type': 'local',
+            'targets': []
+        },
+        'ftp_settings': {
+            'host': '',
+            'port': 21,
+            'username': '',
+            'password': ''
+        },
+        'ssh_settings': {
+            'host': '',
+            'port': 22,
+            'username': '',
+            'key_path': ''
+        },
+        'database_settings': {
+            'type': '',
+            'host': '',
+            'port': '',
+            'database': '',
+            'username': '',
+            'password': '',
+            'dump_format': 'plain',
+            'dump_jobs': 4,
+            'restore_jobs': 4,
+            'dump_staging_dir': '',
+            'consistent_snapshot': True,
+            'point_in_time': False,
+            'data_directory': ''
+        },
+        'jobs': [],
+        'backup_settings': {
+            'max_backups': 10,
+            'retention': {
+                'keep_hourly': 0,
+                'keep_daily': 0,
+                'keep_weekly': 0,
+                'keep_monthly': 0
+            },
+            'compress': True,
+            'compression_workers': 0,
+            'backup_schedule': 'daily',
+            'schedule_jitter_seconds': 300,
+            'connection_idle_timeout': 300,
+            'streaming': True,
+            'incremental': False,
+            'full_backup_every': 7,
+            'stream_buffer_mb': 8,
+            'transfer_streams': 1,
+            'transport_engine': 'sync',
+            'async_max_in_flight': 16,
+            'fanout_buffer_mb': 16,
+            'fanout_lag_seconds': 30,
+            'parallel_threshold_mb': 64,
+            'resumable': False,
+            'transfer_retries': 3,
+            'retry_backoff': 5,
+            'member_index': True,
+            'verify_bandwidth_kbps': 0,
+            'scan_workers': 8,
+            'prefetch_mb': 64,
+            'exclude': [],
+            'max_file_size_mb': 0,
+            'ignore_file': '.backupignore',
+            'sparse_files': True,
+            'local_mode': 'archive',
+            'progress': True,
+            'report_dir': '',
+            'prometheus_textfile': '',
+            'throttle': {
+                'upload_kbps': 0,
+                'read_kbps': 0,
+                'windows': [],
+                'nice': 0,
+                'ionice_class': '',
+                'ionice_level': 7
+            },
+            'max_concurrent_jobs': 4,
+            'destination_concurrency': {
+                'local': 2,
+                'ftp': 2,
+                'ssh': 2,
+                'database': 1
+            }
+        }
+    }
+
 class BackupManager:
-    def __init__(self):
+    def __init__(self, config_file=CONFIG_FILE):
+        self.config_file = config_file
         self.config = self.load_config()
+        # Limity przepustowości i priorytety wczytywane ponownie po zmianie pliku
+        default_throttle.watch(self.config_file, self.config)
 
     def load_config(self):
-        if not os.path.exists(CONFIG_FILE):
+        if not os.path.exists(self.config_file):
             print('Błąd: Plik konfiguracyjny nie istnieje!')
             return self.create_default_config()
         
         try:
-            with open(CONFIG_FILE, 'r') as f:
+            with open(self.config_file, 'r') as f:
                 return json.load(f)
         except json.JSONDecodeError:
             print('Błąd: Nieprawidłowy format pliku konfiguracyjnego!')
             return self.create_default_config()
 
     def create_default_config(self):
-        default_config = {
-            'backup_locations': {
-                'source': '',
-                'destination': '',
-                'type': 'local'
-            },
-            'ftp_settings': {
-                'host': '',
-                'port': 21,
-                'username': '',
-                'password': ''
-            },
-            'ssh_settings': {
-                'host': '',
-                'port': 22,
-                'username': '',
-                'key_path': ''
-            },
-            'database_settings': {
-                'type': '',
-                'host': '',
-                'port': '',
-                'database': '',
-                'username': '',
-                'password': ''
-            },
-            'backup_settings': {
-                'max_backups': 10,
-                'compress': True,
-                'backup_schedule': 'daily'
-            }
-        }
-        
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(default_config, f, indent=4)
-        return default_config
+        config = default_config()
+        with open(self.config_file, 'w') as f:
+            json.dump(config, f, indent=4)
+        return config
 
     def save_config(self):
-        with open(CONFIG_FILE, 'w') as f:
+        with open(self.config_file, 'w') as f:
             json.dump(self.config, f, indent=4)
 
     def show_menu(self):
@@ -87,48 +162,146 @@ class BackupManager:
                 print('Nieprawidłowa opcja!')
 
     def backup_menu(self):
-        from file_handler import FileHandler
-        from db_handler import DatabaseHandler
-        
         print('\n=== Menu Kopii Zapasowej ===')
         print('1. Kopia zapasowa plików')
         print('2. Kopia zapasowa bazy danych')
-        print('3. Powrót')
+        print('3. Wszystkie zadania z listy jobs')
+        print('4. Powrót')
         
         choice = input('\nWybierz opcję: ')
         
         if choice == '1':
-            file_handler = FileHandler(self.config)
-            source = self.config['backup_locations']['source']
-            dest = self.config['backup_locations']['destination']
-            backup_type = self.config['backup_locations']['type']
-            
-            if not source or not dest:
-                print('Błąd: Nie skonfigurowano ścieżek źródłowej i docelowej!')
-                return
-            
-            print(f'\nTworzenie kopii zapasowej z {source}')
-            success = False
-            message = ''
-            
-            if backup_type == 'local':
-                success, message = file_handler.backup_local(source, dest)
-            elif backup_type == 'ftp':
-                success, message = file_handler.backup_ftp(source)
-            elif backup_type == 'ssh':
-                success, message = file_handler.backup_ssh(source)
-            
+            success, message = self.run_file_backup()
             print(message)
             
         elif choice == '2':
-            db_handler = DatabaseHandler(self.config)
-            if not self.config['database_settings']['type']:
-                print('Błąd: Nie skonfigurowano bazy danych!')
-                return
+            success, message = self.run_database_backup()
+            print(message)
             
-            print('\nTworzenie kopii zapasowej bazy danych...')
-            success, message = db_handler.backup_database()
+        elif choice == '3':
+            self.run_jobs()
+
+    def run_file_backup(self):
+        from file_handler import FileHandler
+        
+        file_handler = FileHandler(self.config, progress=self.progress_bar())
+        source = self.config['backup_locations']['source']
+        dest = self.config['backup_locations']['destination']
+        
+        if not source or (not dest and self.config['backup_locations']['type'] != 'fanout'):
+            return False, 'Błąd: Nie skonfigurowano ścieżek źródłowej i docelowej!'
+        
+        print(f'\nTworzenie kopii zapasowej z {source}')
+        return file_handler.backup(source, dest)
+
+    def run_database_backup(self):
+        from db_handler import DatabaseHandler
+        
+        db_handler = DatabaseHandler(self.config, progress=self.progress_bar())
+        if not self.config['database_settings']['type']:
+            return False, 'Błąd: Nie skonfigurowano bazy danych!'
+        
+        print('\nTworzenie kopii zapasowej bazy danych...')
+        return db_handler.backup_database()
+
+    def progress_bar(self):
+        # Pasek postępu tylko w terminalu - nie w cronie ani w logach demona
+        if not self.config['backup_settings'].get('progress', True) or not sys.stdout.isatty():
+            return None
+        from metrics import ProgressBar
+        return ProgressBar()
+
+    def restore_config(self, replica=None):
+        # W trybie fanout przywracanie, listowanie i weryfikacja korzystają z
+        # jednego miejsca docelowego (domyślnie pierwszego z listy targets)
+        if self.config['backup_locations']['type'] != 'fanout':
+            return self.config
+        from fanout import replica_config
+        return replica_config(self.config, replica)
+
+    def run_jobs(self, names=None):
+        from jobs import JobRunner, format_job_summary
+        
+        try:
+            results, elapsed = JobRunner(self.config).run(names)
+        except ValueError as e:
+            print(f'Błąd: {str(e)}')
+            return False
+        if not results:
+            print('Brak zadań do wykonania - lista jobs w konfiguracji jest pusta')
+            return False
+        print('\n' + format_job_summary(results, elapsed))
+        return all(result['success'] for result in results)
+
+    def run_prune(self, target='files', dry_run=False):
+        # W trybie fanout retencja stosowana jest w każdym miejscu docelowym
+        from db_handler import DatabaseHandler
+        from file_handler import FileHandler
+        
+        configs = [(None, self.config)]
+        if self.config['backup_locations']['type'] == 'fanout':
+            from fanout import target_configs
+            try:
+                configs = target_configs(self.config)
+            except ValueError as e:
+                print(f'Błąd: {str(e)}')
+                return False
+        success = True
+        for name, config in configs:
+            if target == 'database':
+                result, message = DatabaseHandler(config).prune(dry_run)
+            else:
+                result, message = FileHandler(config).prune_backups(config['backup_locations']['type'], dry_run)
+            print(f'{name}: {message}' if name else message)
+            success = success and result
+        return success
+
+    def run_replication(self, job_names=None):
+        # Doganianie kopii trybu fanout, które nie trafiły do części miejsc docelowych
+        from fanout import format_replication
+        from file_handler import FileHandler
+        from jobs import job_config, load_jobs
+        
+        configs = [self.config]
+        try:
+            if job_names:
+                configs = [job_config(self.config, job) for job in load_jobs(self.config, job_names)]
+        except ValueError as e:
+            print(f'Błąd: {str(e)}')
+            return False
+        success = True
+        for config in configs:
+            label = f"[{config['job_name']}] " if config.get('job_name') else ''
+            if config['backup_locations']['type'] != 'fanout':
+                print(f'{label}Replikacja dotyczy tylko kopii w trybie fanout')
+                success = False
+                continue
+            try:
+                results = FileHandler(config).replicate_pending()
+            except ValueError as e:
+                print(f'{label}Błąd: {str(e)}')
+                success = False
+                continue
+            print(label + (format_replication(results) if results else 'Brak kopii oczekujących na replikację'))
+            success = success and all(status != 'pending' for name, target, status, message in results)
+        return success
+
+    def run_backups(self, target='files', job_names=None):
+        # Kopia plików i/lub bazy danych bez interakcji z użytkownikiem;
+        # 'all' pomija elementy, które nie zostały skonfigurowane
+        if target == 'jobs':
+            return self.run_jobs(job_names)
+        results = []
+        if target == 'logs':
+            from db_handler import DatabaseHandler
+            results.append(DatabaseHandler(self.config).ship_logs())
+        if target == 'files' or (target == 'all' and self.config['backup_locations']['source']):
+            results.append(self.run_file_backup())
+        if target == 'database' or (target == 'all' and self.config['database_settings']['type']):
+            results.append(self.run_database_backup())
+        for success, message in results:
             print(message)
+        return all(success for success, message in results)
 
     def restore_menu(self):
         from file_handler import FileHandler
@@ -142,9 +315,9 @@ class BackupManager:
         choice = input('\nWybierz opcję: ')
         
         if choice == '1':
-            file_handler = FileHandler(self.config)
-            backup_type = self.config['backup_locations']['type']
-            dest = self.config['backup_locations']['destination']
+            file_handler = FileHandler(self.restore_config())
+            backup_type = file_handler.config['backup_locations']['type']
+            dest = file_handler.config['backup_locations']['destination']
             
             # Pobierz listę dostępnych kopii zapasowych
             backups = file_handler.list_backups(backup_type)
@@ -160,36 +333,22 @@ class BackupManager:
             try:
                 choice = int(input('\nWybierz numer kopii do przywrócenia: ')) - 1
                 if 0 <= choice < len(backups):
-                    backup_name = backups[choice]
-                    print(f'\nPrzywracanie kopii zapasowej {backup_name}...')
-                    
-                    success = False
-                    message = ''
-                    
-                    if backup_type == 'local':
-                        success, message = file_handler.restore_local(
-                            os.path.join(dest, backup_name),
-                            dest
-                        )
-                    elif backup_type == 'ftp':
-                        success, message = file_handler.restore_ftp(backup_name, dest)
-                    elif backup_type == 'ssh':
-                        success, message = file_handler.restore_ssh(backup_name, dest)
-                    
-                    print(message)
+                    paths = input('Ścieżki lub wzorce do przywrócenia, oddzielone przecinkami (puste = całość): ')
+                    patterns = [p.strip() for p in paths.split(',') if p.strip()]
+                    self.restore_files(file_handler, backups, backups[choice], dest, patterns)
                 else:
                     print('Nieprawidłowy numer kopii zapasowej!')
             except ValueError:
                 print('Nieprawidłowy wybór!')
                 
         elif choice == '2':
-            db_handler = DatabaseHandler(self.config)
+            db_handler = DatabaseHandler(self.restore_config())
             if not self.config['database_settings']['type']:
                 print('Błąd: Nie skonfigurowano bazy danych!')
                 return
             
-            # Lista plików .sql w bieżącym katalogu
-            backups = [f for f in os.listdir('.') if f.endswith('.sql')]
+            # Zrzuty .sql w bieżącym katalogu oraz w miejscu docelowym
+            backups = db_handler.list_backups()
             
             if not backups:
                 print('Nie znaleziono kopii zapasowych bazy danych!')
@@ -203,14 +362,43 @@ class BackupManager:
                 choice = int(input('\nWybierz numer kopii do przywrócenia: ')) - 1
                 if 0 <= choice < len(backups):
                     backup_name = backups[choice]
+                    target_time = None
+                    if db_handler.use_point_in_time():
+                        target_time = input('Czas docelowy (RRRR-MM-DD GG:MM:SS, puste = wszystkie logi): ').strip() or None
                     print(f'\nPrzywracanie bazy danych z kopii {backup_name}...')
-                    success, message = db_handler.restore_database(backup_name)
+                    success, message = db_handler.restore_database(backup_name, target_time, self.config_file)
                     print(message)
                 else:
                     print('Nieprawidłowy numer kopii zapasowej!')
             except ValueError:
                 print('Nieprawidłowy wybór!')
 
+    def restore_files(self, file_handler, backups, backup_to_restore, dest, patterns=None):
+        backup_type = file_handler.config['backup_locations']['type']
+        backup_dir = file_handler.config['backup_locations']['destination']
+        success = False
+        message = ''
+        
+        # Kopie przyrostowe odtwarzane są razem z kopią pełną
+        for backup_name in file_handler.backup_chain(backups, backup_to_restore):
+            print(f'\nPrzywracanie kopii zapasowej {backup_name}...')
+            if patterns:
+                success, message = file_handler.restore_selected(backup_type, backup_name, patterns, dest, backup_dir)
+            elif backup_type == 'local':
+                success, message = file_handler.restore_local(
+                    os.path.join(backup_dir, backup_name),
+                    dest
+                )
+            elif backup_type == 'ftp':
+                success, message = file_handler.restore_ftp(backup_name, dest)
+            elif backup_type == 'ssh':
+                success, message = file_handler.restore_ssh(backup_name, dest)
+            if not success:
+                break
+        
+        print(message)
+        return success
+
     def config_menu(self):
         print('\n=== Menu Konfiguracji ===')
         print('1. Ustawienia lokalizacji')
@@ -277,11 +465,185 @@ class BackupManager:
             print('\nUstawienia kopii zapasowych')
             self.config['backup_settings']['max_backups'] = int(input('Maksymalna liczba kopii zapasowych: '))
             compress = input('Kompresować kopie zapasowe? (t/n): ').lower()
-            self.config['backup_settings']['compress'] = compress == 't'
+            if compress == 't':
+                from compression import CODEC_EXTENSIONS, resolve_codec
+                names = '/'.join(name for name in CODEC_EXTENSIONS if name != 'none')
+                while True:
+                    codec = input(f'Algorytm kompresji - {names} (domyślnie gzip): ').lower()
+                    # Nieznany algorytm lub brak biblioteki (zstandard, lz4)
+                    # zgłaszany teraz, a nie dopiero przy pierwszej kopii
+                    try:
+                        resolve_codec(codec or True)
+                        break
+                    except ValueError as e:
+                        print(str(e))
+                self.config['backup_settings']['compress'] = codec or True
+                workers = input('Liczba wątków kompresji (0 = wszystkie rdzenie): ')
+                self.config['backup_settings']['compression_workers'] = int(workers or 0)
+            else:
+                self.config['backup_settings']['compress'] = False
+            streaming = input('Przesyłać kopie strumieniowo, bez pliku tymczasowego? (t/n): ').lower()
+            self.config['backup_settings']['streaming'] = streaming == 't'
             self.save_config()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='System kopii zapasowych')
+    parser.add_argument('--config', default=CONFIG_FILE, help='Plik konfiguracyjny (domyślnie config.json)')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    backup = subparsers.add_parser('backup', help='Wykonaj kopię zapasową')
+    backup.add_argument('--target', choices=TARGETS, default='files',
+                        help='Co kopiować (domyślnie pliki; jobs - zadania z listy jobs; logs - pliki binlog MySQL)')
+    backup.add_argument('--job', action='append', dest='jobs',
+                        help='Nazwa zadania dla --target jobs (można podać wielokrotnie)')
+    
+    restore = subparsers.add_parser('restore', help='Przywróć kopię zapasową plików')
+    restore.add_argument('backup', help='Nazwa kopii zapasowej')
+    restore.add_argument('--path', action='append', dest='paths',
+                         help='Ścieżka lub wzorzec do przywrócenia (można podać wielokrotnie)')
+    restore.add_argument('--dest', help='Katalog docelowy (domyślnie katalog kopii zapasowych)')
+    restore.add_argument('--replica', help=REPLICA_HELP)
+    
+    restore_database = subparsers.add_parser('restore-database', help='Przywróć kopię zapasową bazy danych')
+    restore_database.add_argument('backup', help='Nazwa kopii zapasowej bazy danych')
+    restore_database.add_argument('--time', dest='target_time',
+                                  help='Odtwarzanie do punktu w czasie: RRRR-MM-DD GG:MM:SS')
+    restore_database.add_argument('--replica', help=REPLICA_HELP)
+    
+    wal_push = subparsers.add_parser('wal-push', help='Archiwizuj segment WAL (archive_command PostgreSQL)')
+    wal_push.add_argument('path', help='Ścieżka segmentu (%%p)')
+    wal_fetch = subparsers.add_parser('wal-fetch', help='Pobierz segment WAL (restore_command PostgreSQL)')
+    wal_fetch.add_argument('name', help='Nazwa segmentu (%%f)')
+    wal_fetch.add_argument('path', help='Ścieżka docelowa (%%p)')
+    
+    list_parser = subparsers.add_parser('list', help='Wypisz dostępne kopie zapasowe plików')
+    list_parser.add_argument('--refresh', action='store_true',
+                             help='Odbuduj katalog kopii z listowania miejsca docelowego')
+    list_parser.add_argument('--replica', help=REPLICA_HELP)
+    verify = subparsers.add_parser('verify', help='Sprawdź sumy kontrolne kopii w miejscu docelowym')
+    verify.add_argument('backups', nargs='*', help='Nazwy kopii (domyślnie wszystkie z katalogu kopii)')
+    verify.add_argument('--bwlimit', type=int, dest='bandwidth_kbps',
+                        help='Limit przepustowości odczytu w KB/s (domyślnie verify_bandwidth_kbps)')
+    verify.add_argument('--replica', help=REPLICA_HELP)
+    prune = subparsers.add_parser('prune', help='Usuń kopie poza polityką retencji')
+    prune.add_argument('--target', choices=('files', 'database'), default='files',
+                       help='Kopie plików (domyślnie) lub zrzuty bazy danych')
+    prune.add_argument('--dry-run', action='store_true',
+                       help='Tylko wypisz kopie do usunięcia i miejsce do odzyskania')
+    replicate = subparsers.add_parser('replicate', help='Dogoń kopie trybu fanout w miejscach, do których nie dotarły')
+    replicate.add_argument('--job', action='append', dest='jobs',
+                           help='Nazwa zadania z listy jobs (można podać wielokrotnie)')
+    
+    daemon = subparsers.add_parser('daemon', help='Wykonuj kopie zgodnie z backup_schedule')
+    daemon.add_argument('--target', choices=TARGETS, default='files',
+                        help='Co kopiować (domyślnie pliki; jobs - zadania z listy jobs; logs - pliki binlog MySQL)')
+    daemon.add_argument('--job', action='append', dest='jobs',
+                        help='Nazwa zadania dla --target jobs (można podać wielokrotnie)')
+    return parser.parse_args(argv)
+
+def lock_path(config, name='backup'):
+    return os.path.join(config['backup_settings'].get('state_dir', '.backup_state'), f'{name}.lock')
+
+def lock_name(args):
+    # Wysyłanie logów bazy danych nie czeka na trwającą kopię bazową
+    return 'logs' if getattr(args, 'target', None) == 'logs' else 'backup'
+
+def run_command(manager, args):
+    from file_handler import FileHandler
+    from scheduler import RunLock, Scheduler
+    from transport import default_pool
+    
+    settings = manager.config['backup_settings']
+    backup_type = manager.config['backup_locations']['type']
+    
+    if args.command in ('backup', 'prune', 'replicate'):
+        # Uruchomienia z crona nie mogą nakładać się na trwającą kopię
+        lock = RunLock(lock_path(manager.config, lock_name(args)))
+        if not lock.acquire():
+            print('Poprzednie uruchomienie kopii zapasowej nadal trwa - pomijam')
+            return EXIT_LOCKED
+        try:
+            if args.command == 'backup':
+                success = manager.run_backups(args.target, args.jobs)
+            elif args.command == 'replicate':
+                success = manager.run_replication(args.jobs)
+            else:
+                success = manager.run_prune(args.target, args.dry_run)
+        finally:
+            lock.release()
+        return EXIT_SUCCESS if success else EXIT_FAILURE
+    
+    if args.command in ('restore', 'restore-database', 'list', 'verify'):
+        try:
+            config = manager.restore_config(args.replica)
+        except ValueError as e:
+            print(f'Błąd: {str(e)}')
+            return EXIT_FAILURE
+        backup_type = config['backup_locations']['type']
+    
+    if args.command == 'restore':
+        file_handler = FileHandler(config)
+        backups = file_handler.list_backups(backup_type)
+        if args.backup not in backups:
+            print(f'Nie znaleziono kopii zapasowej {args.backup}!')
+            return EXIT_FAILURE
+        dest = args.dest or config['backup_locations']['destination']
+        return EXIT_SUCCESS if manager.restore_files(file_handler, backups, args.backup, dest, args.paths) else EXIT_FAILURE
+    
+    if args.command == 'restore-database':
+        from db_handler import DatabaseHandler
+        
+        success, message = DatabaseHandler(config).restore_database(args.backup, args.target_time, manager.config_file)
+        print(message)
+        return EXIT_SUCCESS if success else EXIT_FAILURE
+    
+    if args.command in ('wal-push', 'wal-fetch'):
+        from db_handler import DatabaseHandler
+        
+        db_handler = DatabaseHandler(manager.config)
+        if args.command == 'wal-push':
+            success, message = db_handler.push_wal(args.path)
+        else:
+            success, message = db_handler.fetch_wal(args.name, args.path)
+        print(message)
+        return EXIT_SUCCESS if success else EXIT_FAILURE
+    
+    if args.command == 'verify':
+        success, message = FileHandler(config).verify_backups(backup_type, args.backups, args.bandwidth_kbps)
+        print(message)
+        return EXIT_SUCCESS if success else EXIT_FAILURE
+    
+    if args.command == 'list':
+        file_handler = FileHandler(config)
+        if args.refresh:
+            success, message = file_handler.refresh_catalog(backup_type)
+            print(message)
+            if not success:
+                return EXIT_FAILURE
+        for backup in sorted(file_handler.list_backups(backup_type)):
+            print(backup)
+        return EXIT_SUCCESS
+    
+    if args.command == 'daemon':
+        # Sesje w puli utrzymywane są między zadaniami przez connection_idle_timeout
+        default_pool.idle_timeout = settings.get('connection_idle_timeout', default_pool.idle_timeout)
+        # kill -HUP wczytuje od razu nowe limity throttle, także w trakcie kopii
+        signal.signal(signal.SIGHUP, default_throttle.hangup)
+        scheduler = Scheduler(
+            settings.get('backup_schedule', 'daily'),
+            lambda: manager.run_backups(args.target, args.jobs),
+            lock_path(manager.config, lock_name(args)),
+            jitter=settings.get('schedule_jitter_seconds', 300),
+            pool=default_pool
+        )
+        scheduler.run_forever()
+        return EXIT_SUCCESS
+
 def main():
-    manager = BackupManager()
+    args = parse_args()
+    manager = BackupManager(args.config)
+    if args.command:
+        sys.exit(run_command(manager, args))
     manager.show_menu()
 
 if __name__ == '__main__':
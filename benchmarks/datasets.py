@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import json
+import os
+import random
+import shutil
+
+MB = 1024 * 1024
+MARKER = '.dataset.json'
+WRITE_BLOCK = 4 * MB
+# Tekst o powtarzalnej strukturze - kompresuje się jak typowe logi i zrzuty
+WORDS = [b'backup', b'archive', b'select', b'insert', b'value', b'error', b'request', b'user', b'2026-10-18',
+         b'GET', b'POST', b'/api/v1/items', b'200', b'404', b'id', b'name', b'status', b'ok']
+
+
+def text_block(rng, size):
+    parts = []
+    length = 0
+    while length < size:
+        line = b' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))) + b'\n'
+        parts.append(line)
+        length += len(line)
+    return b''.join(parts)[:size]
+
+
+def write_file(path, size, rng, compressible=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        remaining = size
+        # Blok tekstu generowany raz i powielany - generator nie jest wąskim gardłem
+        pattern = text_block(rng, min(size, WRITE_BLOCK)) if compressible else None
+        while remaining:
+            count = min(WRITE_BLOCK, remaining)
+            f.write(pattern[:count] if compressible else rng.randbytes(count))
+            remaining -= count
+
+
+def tiny_files(root, scale, rng):
+    # Wiele małych plików w zagnieżdżonych katalogach (koszt metadanych)
+    count = max(100, int(20000 * scale))
+    for i in range(count):
+        path = os.path.join(root, f'd{i % 50:02d}', f'e{i % 7}', f'file_{i:06d}.txt')
+        write_file(path, rng.randint(200, 4096), rng)
+
+
+def huge_files(root, scale, rng):
+    # Kilka dużych plików dobrze kompresowalnych (przepustowość kompresji)
+    for i in range(2):
+        write_file(os.path.join(root, f'huge_{i}.log'), max(MB, int(256 * MB * scale)), rng)
+
+
+def sparse_files(root, scale, rng):
+    # Obraz z dziurami: dane tylko w kilku obszarach (SEEK_DATA/SEEK_HOLE)
+    size = max(16 * MB, int(1024 * MB * scale))
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'disk.img'), 'wb') as f:
+        f.truncate(size)
+        for offset in range(0, size, size // 16):
+            f.seek(offset)
+            f.write(text_block(rng, MB))
+
+
+def incompressible_files(root, scale, rng):
+    # Dane losowe - kompresja nic nie daje, liczy się tylko przepustowość
+    for i in range(4):
+        write_file(os.path.join(root, f'random_{i}.bin'), max(MB, int(64 * MB * scale)), rng, compressible=False)
+
+
+DATASETS = {
+    'tiny': tiny_files,
+    'huge': huge_files,
+    'sparse': sparse_files,
+    'incompressible': incompressible_files
+}
+
+
+def tree_size(root):
+    # Rozmiar danych (bez dziur plików rzadkich) i liczba plików
+    total = 0
+    files = 0
+    for path, dirs, names in os.walk(root):
+        for name in names:
+            st = os.lstat(os.path.join(path, name))
+            total += st.st_size
+            files += 1
+    return total, files
+
+
+def prepare(name, root, scale=1.0, seed=1):
+    # Zbiory są deterministyczne (stałe ziarno), więc kolejne przebiegi i
+    # porównanie z wynikiem bazowym dotyczą tych samych danych. Zbiór jest
+    # generowany ponownie tylko przy zmianie parametrów.
+    params = {'name': name, 'scale': scale, 'seed': seed}
+    marker = os.path.join(root, MARKER)
+    try:
+        with open(marker, 'r') as f:
+            if json.load(f) == params:
+                return os.path.join(root, name)
+    except (OSError, json.JSONDecodeError):
+        pass
+    shutil.rmtree(root, ignore_errors=True)
+    source = os.path.join(root, name)
+    DATASETS[name](source, scale, random.Random(f'{name}:{seed}'))
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return source
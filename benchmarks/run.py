@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from backup_manager import default_config
+from datasets import DATASETS, MB, prepare, tree_size
+from metrics import load_reports
+
+DESTINATIONS = ('local', 'ftp', 'ssh')
+OPERATIONS = ('backup', 'list', 'restore')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+SAMPLE_INTERVAL = 0.1
+BASELINE_PARAMS = ('scale', 'seed', 'latency_ms', 'bandwidth_kbps', 'overrides')
+# Szczytowe RSS odczytywane z VmHWM przy wyjściu procesu: ru_maxrss procesu
+# potomnego w Linuksie obejmuje pamięć rodzica sprzed exec
+RSS_WRAPPER = '''
+import atexit, os, re, runpy, sys
+
+def record():
+    with open('/proc/self/status') as f:
+        peak = re.search(r'VmHWM:\\s+(\\d+)', f.read()).group(1)
+    with open(os.environ['BENCH_RSS_FILE'], 'w') as f:
+        f.write(peak)
+
+atexit.register(record)
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+# Porównywane wartości i najmniejsza różnica uznawana za zmianę (szum pomiaru)
+COMPARED = {
+    'seconds': 0.25,
+    'peak_rss_mb': 2.0,
+    'temp_disk_mb': 1.0
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Testy wydajności kopii zapasowych na lokalnych serwerach FTP/SFTP')
+    parser.add_argument('--dataset', action='append', dest='datasets', choices=sorted(DATASETS),
+                        help='Zbiór danych (można podać wielokrotnie, domyślnie wszystkie)')
+    parser.add_argument('--destination', action='append', dest='destinations', choices=DESTINATIONS,
+                        help='Miejsce docelowe (można podać wielokrotnie, domyślnie wszystkie)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Mnożnik rozmiaru zbiorów danych (np. 0.05 dla szybkiego przebiegu)')
+    parser.add_argument('--seed', type=int, default=1, help='Ziarno generatora zbiorów danych')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Liczba powtórzeń każdego pomiaru (wynikiem jest mediana czasu)')
+    parser.add_argument('--latency-ms', type=int, default=0,
+                        help='Opóźnienie dodawane przez serwery FTP/SFTP (ms)')
+    parser.add_argument('--bandwidth-kbps', type=int, default=0,
+                        help='Limit przepustowości serwerów FTP/SFTP (KB/s, 0 - bez limitu)')
+    parser.add_argument('--set', action='append', dest='overrides', default=[], metavar='KLUCZ=WARTOŚĆ',
+                        help='Zmiana konfiguracji kopii, np. backup_settings.streaming=false')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'bench_backup'),
+                        help='Katalog na zbiory danych i miejsca docelowe')
+    parser.add_argument('--output', help='Plik JSON z wynikami')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Plik wyniku bazowego do porównania')
+    parser.add_argument('--save-baseline', action='store_true', help='Zapisz wyniki jako wynik bazowy')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Dopuszczalne pogorszenie względem wyniku bazowego (%%)')
+    return parser.parse_args(argv)
+
+
+def parse_override(text):
+    key, _, value = text.partition('=')
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return key.split('.'), value
+
+
+def apply_overrides(config, overrides):
+    for text in overrides:
+        path, value = parse_override(text)
+        section = config
+        for key in path[:-1]:
+            section = section.setdefault(key, {})
+        section[path[-1]] = value
+    return config
+
+
+def disk_usage(path):
+    # Zajęte bloki, nie rozmiar pozorny - pliki rzadkie nie zawyżają wyniku
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_blocks * 512
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def tmp_backups():
+    # restore_ftp/restore_ssh bez strumieniowania pobierają archiwum do /tmp
+    try:
+        return {name for name in os.listdir('/tmp') if name.startswith('backup_')}
+    except OSError:
+        return set()
+
+
+class DiskSampler:
+    # Szczytowe zajęcie dysku tymczasowego: katalog roboczy procesu kopii
+    # (archiwa przed wysłaniem, stan) oraz nowe pliki kopii w /tmp
+    def __init__(self, scratch):
+        self.scratch = scratch
+        self.existing = tmp_backups()
+        self.peak = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        usage = disk_usage(self.scratch)
+        for name in tmp_backups() - self.existing:
+            try:
+                usage += os.lstat(os.path.join('/tmp', name)).st_blocks * 512
+            except FileNotFoundError:
+                continue
+        self.peak = max(self.peak, usage)
+
+    def run(self):
+        while self.running:
+            self.sample()
+            time.sleep(SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.running = False
+        self.thread.join()
+        self.sample()
+
+
+def read_peak_rss(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read()) / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def run_cli(scratch, config_path, *command):
+    # Operacja wykonywana przez interfejs wiersza poleceń w osobnym procesie,
+    # więc pomiar obejmuje cały przebieg łącznie z uruchomieniem programu
+    env = dict(os.environ, TMPDIR=os.path.join(scratch, 'tmp'), BENCH_RSS_FILE=os.path.join(scratch, 'peak_rss'))
+    os.makedirs(env['TMPDIR'], exist_ok=True)
+    started = time.monotonic()
+    with DiskSampler(scratch) as sampler:
+        process = subprocess.run(
+            [sys.executable, '-c', RSS_WRAPPER, os.path.join(REPO_DIR, 'backup_manager.py'),
+             '--config', config_path, *command],
+            cwd=scratch, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        seconds = time.monotonic() - started
+    return {
+        'success': process.returncode == 0,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(read_peak_rss(env['BENCH_RSS_FILE']), 1),
+        'temp_disk_mb': round(sampler.peak / MB, 1),
+        'output': process.stdout.decode(errors='replace')
+    }
+
+
+def start_servers(args, destinations, roots, key_dir):
+    from servers import FTPServer, LatencyProxy, SFTPServer
+
+    servers = {}
+    settings = {}
+    if 'ftp' in destinations:
+        servers['ftp'] = FTPServer(roots['ftp'], args.latency_ms, args.bandwidth_kbps).start()
+        settings['ftp'] = servers['ftp'].settings()
+    if 'ssh' in destinations:
+        servers['ssh'] = SFTPServer(roots['ssh'], key_dir).start()
+        port = None
+        if args.latency_ms or args.bandwidth_kbps:
+            servers['proxy'] = LatencyProxy(servers['ssh'].port, args.latency_ms, args.bandwidth_kbps).start()
+            port = servers['proxy'].port
+        settings['ssh'] = servers['ssh'].settings(port)
+    return servers, settings
+
+
+def make_config(args, destination, source, roots, server_settings):
+    config = default_config()
+    config['backup_locations'] = {
+        'source': source,
+        # Dla FTP/SFTP ścieżka docelowa jest tylko wymagana przez konfigurację
+        'destination': roots['local'],
+        'type': destination
+    }
+    if destination == 'ftp':
+        config['ftp_settings'].update(server_settings['ftp'])
+    elif destination == 'ssh':
+        config['ssh_settings'].update(server_settings['ssh'])
+    config['backup_settings']['progress'] = False
+    return apply_overrides(config, args.overrides)
+
+
+def reset_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def run_case(args, dataset, destination, source, roots, server_settings):
+    # Jeden przebieg backup -> list -> restore na pustym miejscu docelowym
+    work = os.path.abspath(args.work_dir)
+    scratch = os.path.join(work, 'scratch')
+    restore_dir = os.path.join(work, 'restore')
+    for path in (scratch, restore_dir, roots[destination]):
+        reset_dir(path)
+    config_path = os.path.join(scratch, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(make_config(args, destination, source, roots, server_settings), f, indent=4)
+
+    data_bytes, files = tree_size(source)
+    results = {}
+    results['backup'] = run_cli(scratch, config_path, 'backup')
+    reports = [r for r in load_reports(os.path.join(scratch, '.backup_state', 'reports')) if r.get('kind') == 'files']
+    if reports:
+        results['backup']['phases'] = reports[0].get('phases', {})
+        results['backup']['bytes_out'] = reports[0].get('bytes_out', 0)
+    results['list'] = run_cli(scratch, config_path, 'list')
+    backups = [line for line in results['list']['output'].splitlines() if line.startswith('backup_')]
+    if results['backup']['success'] and backups:
+        results['restore'] = run_cli(scratch, config_path, 'restore', backups[-1], '--dest', restore_dir)
+    else:
+        results['restore'] = {'success': False, 'seconds': 0.0, 'peak_rss_mb': 0.0, 'temp_disk_mb': 0.0,
+                              'output': 'Brak kopii do przywrócenia'}
+    for operation in ('backup', 'restore'):
+        if results[operation]['success']:
+            results[operation]['bytes'] = data_bytes
+            results[operation]['files'] = files
+            results[operation]['mb_per_s'] = round(data_bytes / results[operation]['seconds'] / MB, 2)
+    return results
+
+
+def median_result(runs):
+    result = dict(sorted(runs, key=lambda r: r['seconds'])[len(runs) // 2])
+    result['success'] = all(r['success'] for r in runs)
+    if len(runs) > 1:
+        result['seconds'] = round(statistics.median(r['seconds'] for r in runs), 3)
+        result['seconds_min'] = min(r['seconds'] for r in runs)
+        result['seconds_max'] = max(r['seconds'] for r in runs)
+    return result
+
+
+def compare(results, baseline, threshold):
+    # Pogorszenia względem wyniku bazowego większe niż threshold procent
+    regressions = []
+    for key, result in sorted(results.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, min_diff in COMPARED.items():
+            old = previous.get(metric)
+            new = result.get(metric)
+            if old is None or new is None or new - old <= min_diff:
+                continue
+            change = (new - old) / old * 100 if old else float('inf')
+            if change > threshold:
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+
+def format_table(results, baseline):
+    header = f"{'przypadek':<32} {'czas [s]':>9} {'zmiana':>8} {'MB/s':>8} {'RSS [MB]':>9} {'tmp [MB]':>9}  status"
+    lines = [header, '-' * len(header)]
+    for key, result in sorted(results.items()):
+        previous = baseline.get(key, {}).get('seconds')
+        change = f"{(result['seconds'] - previous) / previous * 100:+.0f}%" if previous else '-'
+        mb_per_s = f"{result['mb_per_s']:.1f}" if 'mb_per_s' in result else '-'
+        lines.append(f"{key:<32} {result['seconds']:>9.2f} {change:>8} {mb_per_s:>8} "
+                     f"{result['peak_rss_mb']:>9.1f} {result['temp_disk_mb']:>9.1f}  "
+                     f"{'OK' if result['success'] else 'BŁĄD'}")
+    return '\n'.join(lines)
+
+
+def load_baseline(path, report):
+    # Wynik bazowy porównywalny tylko przy tych samych parametrach przebiegu
+    try:
+        with open(path, 'r') as f:
+            baseline = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    different = [key for key in BASELINE_PARAMS if baseline.get(key) != report[key]]
+    if different:
+        print(f"Wynik bazowy {path} dotyczy innych parametrów ({', '.join(different)}) - pomijam porównanie")
+        return {}
+    return baseline.get('results', {})
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = args.datasets or sorted(DATASETS)
+    destinations = args.destinations or list(DESTINATIONS)
+    work = os.path.abspath(args.work_dir)
+    roots = {name: os.path.join(work, 'destinations', name) for name in DESTINATIONS}
+    servers, server_settings = start_servers(args, destinations, roots, os.path.join(work, 'keys'))
+
+    results = {}
+    failures = []
+    try:
+        for dataset in datasets:
+            print(f'Przygotowywanie zbioru {dataset} (skala {args.scale})...')
+            source = prepare(dataset, os.path.join(work, 'datasets', dataset), args.scale, args.seed)
+            for destination in destinations:
+                print(f'Pomiar: {dataset} -> {destination}')
+                runs = [run_case(args, dataset, destination, source, roots, server_settings)
+                        for _ in range(args.repeat)]
+                for operation in OPERATIONS:
+                    key = f'{dataset}/{destination}/{operation}'
+                    result = median_result([run[operation] for run in runs])
+                    if not result['success']:
+                        failures.append(key)
+                        print(f"Błąd {key}:\n{result['output']}")
+                    del result['output']
+                    results[key] = result
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'scale': args.scale,
+        'seed': args.seed,
+        'latency_ms': args.latency_ms,
+        'bandwidth_kbps': args.bandwidth_kbps,
+        'overrides': args.overrides,
+        'results': results
+    }
+    baseline = {} if args.save_baseline else load_baseline(args.baseline, report)
+    print()
+    print(format_table(results, baseline))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nZapisano wynik bazowy: {args.baseline}')
+        return 1 if failures else 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, old, new, change in regressions:
+        print(f'Pogorszenie {key} {metric}: {old} -> {new} ({change:+.0f}%)')
+    if baseline and not regressions:
+        print(f'\nBrak pogorszeń powyżej {args.threshold}% względem wyniku bazowego')
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
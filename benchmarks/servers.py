@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import heapq
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import paramiko
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from throttle import TokenBucket
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler, ThrottledDTPHandler
+    from pyftpdlib.ioloop import IOLoop
+    from pyftpdlib.servers import ThreadedFTPServer
+except ImportError:
+    ThreadedFTPServer = None
+
+USERNAME = 'bench'
+PASSWORD = 'bench'
+PROXY_CHUNK = 64 * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class FTPServer:
+    # Lokalny serwer FTP (pyftpdlib, wątek na połączenie). Opóźnienie
+    # dodawane jest do każdego polecenia sesji, a limit przepustowości
+    # dotyczy połączeń danych - pasywne porty danych omijałyby pośrednika TCP.
+    def __init__(self, root, latency_ms=0, bandwidth_kbps=0):
+        if ThreadedFTPServer is None:
+            raise RuntimeError('Serwer FTP do testów wydajności wymaga biblioteki pyftpdlib')
+        os.makedirs(root, exist_ok=True)
+        authorizer = DummyAuthorizer()
+        authorizer.add_user(USERNAME, PASSWORD, root, perm='elradfmwMT')
+        delay = latency_ms / 1000.0
+
+        class Handler(FTPHandler):
+            def pre_process_command(self, line, cmd, arg):
+                if delay:
+                    time.sleep(delay)
+                return super().pre_process_command(line, cmd, arg)
+
+        Handler.authorizer = authorizer
+        if bandwidth_kbps:
+            dtp = type('BenchDTPHandler', (ThrottledDTPHandler,), {})
+            dtp.read_limit = dtp.write_limit = bandwidth_kbps * 1024
+            Handler.dtp_handler = dtp
+        # Bez własnego handlera pyftpdlib wypisuje każde polecenie na stderr
+        logger = logging.getLogger('pyftpdlib')
+        if not logger.handlers:
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.WARNING)
+        self.port = free_port()
+        self.server = ThreadedFTPServer(('127.0.0.1', self.port), Handler, ioloop=IOLoop())
+        # Zdarzenie zakończenia jest w pyftpdlib atrybutem klasy - zatrzymywany
+        # serwer kończyłby wtedy też wątki połączeń kolejnego serwera w procesie
+        self.server._exit = threading.Event()
+        self.server._lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, name='bench-ftp', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def settings(self):
+        return {'host': '127.0.0.1', 'port': self.port, 'username': USERNAME, 'password': PASSWORD}
+
+    def stop(self):
+        self.server.close_all()
+
+
+class SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class SFTPRoot(paramiko.SFTPServerInterface):
+    # Pliki serwera SFTP w katalogu root (ścieżki klienta względne wobec niego)
+    root = None
+
+    def path(self, path):
+        return os.path.join(self.root, os.path.normpath('/' + path).lstrip('/'))
+
+    def errors(operation):
+        def wrapper(self, *args):
+            try:
+                return operation(self, *args)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+        return wrapper
+
+    @errors
+    def list_folder(self, path):
+        folder = self.path(path)
+        result = []
+        for name in os.listdir(folder):
+            attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(folder, name)))
+            attr.filename = name
+            result.append(attr)
+        return result
+
+    @errors
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(self.path(path)))
+
+    @errors
+    def lstat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.lstat(self.path(path)))
+
+    @errors
+    def open(self, path, flags, attr):
+        fd = os.open(self.path(path), flags, 0o644)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        f = os.fdopen(fd, mode)
+        handle = SFTPHandle(flags)
+        handle.filename = self.path(path)
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    @errors
+    def remove(self, path):
+        os.remove(self.path(path))
+        return paramiko.SFTP_OK
+
+    @errors
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self.path(newpath)):
+            return paramiko.SFTP_FAILURE
+        os.rename(self.path(oldpath), self.path(newpath))
+        return paramiko.SFTP_OK
+
+    @errors
+    def posix_rename(self, oldpath, newpath):
+        os.replace(self.path(oldpath), self.path(newpath))
+        return paramiko.SFTP_OK
+
+    @errors
+    def mkdir(self, path, attr):
+        os.mkdir(self.path(path))
+        return paramiko.SFTP_OK
+
+    @errors
+    def rmdir(self, path):
+        os.rmdir(self.path(path))
+        return paramiko.SFTP_OK
+
+    @errors
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.normpath('/' + path)
+
+
+class SSHAuth(paramiko.ServerInterface):
+    # Dowolny klucz publiczny użytkownika bench - serwer słucha tylko na loopback
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL if username == USERNAME else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class SFTPServer:
+    # Lokalny serwer SFTP na paramiko; klucz hosta i klucz klienta
+    # generowane są w katalogu roboczym testu
+    def __init__(self, root, key_dir):
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(key_dir, exist_ok=True)
+        self.root = root
+        self.host_key = self.load_key(os.path.join(key_dir, 'host_key'))
+        self.client_key_path = os.path.join(key_dir, 'client_key')
+        self.load_key(self.client_key_path)
+        # Rozłączenia klientów po zakończeniu operacji nie są błędami testu
+        logging.getLogger('paramiko').addHandler(logging.NullHandler())
+        self.port = free_port()
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', self.port))
+        self.transports = []
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name='bench-sftp', daemon=True)
+
+    @staticmethod
+    def load_key(path):
+        if os.path.exists(path):
+            return paramiko.RSAKey.from_private_key_file(path)
+        key = paramiko.RSAKey.generate(2048)
+        key.write_private_key_file(path)
+        return key
+
+    def start(self):
+        self.listener.listen(16)
+        self.thread.start()
+        return self
+
+    def serve(self):
+        root = type('BenchSFTPRoot', (SFTPRoot,), {'root': self.root})
+        while self.running:
+            try:
+                connection, address = self.listener.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, root)
+            transport.start_server(server=SSHAuth())
+            self.transports.append(transport)
+
+    def settings(self, port=None):
+        return {'host': '127.0.0.1', 'port': port or self.port, 'username': USERNAME,
+                'key_path': self.client_key_path}
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+        for transport in self.transports:
+            transport.close()
+
+
+class LatencyProxy:
+    # Pośrednik TCP dodający opóźnienie w każdą stronę i limit
+    # przepustowości (kubełek żetonów, jak dla wysyłania kopii)
+    def __init__(self, target_port, latency_ms=0, bandwidth_kbps=0):
+        self.target_port = target_port
+        self.latency = latency_ms / 1000.0
+        self.bandwidth = bandwidth_kbps * 1024
+        self.port = free_port()
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', self.port))
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name='bench-proxy', daemon=True)
+
+    def start(self):
+        self.listener.listen(16)
+        self.thread.start()
+        return self
+
+    def serve(self):
+        while self.running:
+            try:
+                client, address = self.listener.accept()
+            except OSError:
+                break
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for source, target in ((client, upstream), (upstream, client)):
+                self.pipe(source, target)
+
+    def pipe(self, source, target):
+        # Odczyt i wysyłanie w osobnych wątkach: dane czekają w kolejce do
+        # chwili odbioru + opóźnienie, więc opóźnienie nie ogranicza przepustowości
+        queue = []
+        cond = threading.Condition()
+        bucket = TokenBucket(self.bandwidth)
+        sequence = [0]
+
+        def reader():
+            while True:
+                try:
+                    data = source.recv(PROXY_CHUNK)
+                except OSError:
+                    data = b''
+                with cond:
+                    sequence[0] += 1
+                    heapq.heappush(queue, (time.monotonic() + self.latency, sequence[0], data))
+                    cond.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with cond:
+                    while not queue:
+                        cond.wait()
+                    due, _, data = queue[0]
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        cond.wait(delay)
+                        continue
+                    heapq.heappop(queue)
+                if not data:
+                    try:
+                        target.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                bucket.consume(len(data))
+                try:
+                    target.sendall(data)
+                except OSError:
+                    source.close()
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
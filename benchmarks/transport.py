@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from async_transport import default_engine, session_type
+from backup_manager import default_config
+from servers import FTPServer, LatencyProxy, SFTPServer
+from storage import open_storage
+from transport import default_pool
+
+ENGINES = ('sync', 'async')
+DESTINATIONS = ('ftp', 'ssh')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Porównanie transportu synchronicznego i asyncio na lokalnych serwerach')
+    parser.add_argument('--destination', action='append', dest='destinations', choices=DESTINATIONS,
+                        help='Miejsce docelowe (można podać wielokrotnie, domyślnie oba)')
+    parser.add_argument('--files', type=int, default=200, help='Liczba plików')
+    parser.add_argument('--size-kb', type=int, default=16, help='Rozmiar pliku (KB)')
+    parser.add_argument('--in-flight', type=int, default=16, help='Operacje w locie silnika asyncio')
+    parser.add_argument('--latency-ms', type=int, default=20, help='Opóźnienie dodawane przez serwery (ms)')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'bench_transport'),
+                        help='Katalog serwerów testowych')
+    parser.add_argument('--output', help='Plik JSON z wynikami')
+    return parser.parse_args(argv)
+
+
+def make_config(destination, engine, settings, in_flight):
+    config = default_config()
+    config['backup_locations']['type'] = destination
+    config['ftp_settings' if destination == 'ftp' else 'ssh_settings'].update(settings)
+    config['backup_settings']['transport_engine'] = engine
+    config['backup_settings']['async_max_in_flight'] = in_flight
+    return config
+
+
+def measure(config, destination, files, size):
+    # Wysłanie, listowanie, rozmiary, odczyt i usunięcie wielu małych plików
+    names = [f'bench_{i:05d}.bin' for i in range(files)]
+    data = os.urandom(size)
+    timings = {}
+    with open_storage(config, destination, 'bench') as storage:
+        storage.makedirs()
+        for operation, run in (
+            ('write', lambda: storage.write_many([(name, data) for name in names])),
+            ('list', lambda: storage.listdir()),
+            ('size', lambda: storage.size_many(names)),
+            ('read', lambda: storage.read_many(names)),
+            ('delete', lambda: storage.delete_many(names))
+        ):
+            started = time.monotonic()
+            result = run()
+            timings[operation] = time.monotonic() - started
+            if operation == 'read' and any(r != data for r in result):
+                raise ValueError('Odczytane dane różnią się od wysłanych')
+    return timings
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    destinations = args.destinations or list(DESTINATIONS)
+    work = os.path.abspath(args.work_dir)
+    shutil.rmtree(work, ignore_errors=True)
+    servers = []
+    settings = {}
+    if 'ftp' in destinations:
+        servers.append(FTPServer(os.path.join(work, 'ftp'), args.latency_ms).start())
+        settings['ftp'] = servers[-1].settings()
+    if 'ssh' in destinations:
+        servers.append(SFTPServer(os.path.join(work, 'ssh'), os.path.join(work, 'keys')).start())
+        settings['ssh'] = servers[-1].settings()
+        if args.latency_ms:
+            servers.append(LatencyProxy(servers[-1].port, args.latency_ms).start())
+            settings['ssh']['port'] = servers[-1].port
+
+    results = {}
+    try:
+        for destination in destinations:
+            for engine in ENGINES:
+                config = make_config(destination, engine, settings[destination], args.in_flight)
+                timings = measure(config, destination, args.files, args.size_kb * 1024)
+                results[f'{destination}/{engine}'] = {name: round(value, 3) for name, value in timings.items()}
+    finally:
+        default_engine.close_all()
+        default_pool.close_all()
+        for server in servers:
+            server.stop()
+
+    print(f'\n{args.files} plików po {args.size_kb} KB, opóźnienie {args.latency_ms} ms, '
+          f'w locie: {args.in_flight}')
+    header = f"{'przypadek':<12}" + ''.join(f'{name:>10}' for name in results[next(iter(results))]) + '  silnik'
+    print(header)
+    print('-' * len(header))
+    for key, timings in results.items():
+        destination, engine = key.split('/')
+        backend = session_type(destination) if engine == 'async' else 'ftplib' if destination == 'ftp' else 'paramiko'
+        print(f'{key:<12}' + ''.join(f'{value:>9.2f}s' for value in timings.values()) + f'  {backend}')
+    for destination in destinations:
+        sync = sum(results[f'{destination}/sync'].values())
+        asynchronous = sum(results[f'{destination}/async'].values())
+        print(f'{destination}: przyspieszenie {sync / asynchronous:.1f}x')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
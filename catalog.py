@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+CATALOG_NAME = 'backup_catalog.json'
+CATALOG_FORMAT = 1
+BACKUP_TYPES = ('local', 'ftp', 'ssh', 'fanout')
+RESERVED_JOB_NAMES = BACKUP_TYPES + ('db',)
+
+# Aktualizacje katalogu z wielu wątków (równoległe zadania) wykonywane po kolei
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def catalog_lock(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def matches_prefix(name, prefix):
+    # Nazwa kopii to prefiks, opcjonalnie typ i czas: backup_[zadanie_]typ_czas
+    # lub backup_db_[zadanie_]czas. Samo startswith nie wystarcza - prefiks
+    # backup_ (bez zadania) pasowałby też do backup_<zadanie>_...
+    if not prefix:
+        return True
+    pattern = re.escape(prefix) + r'((' + '|'.join(BACKUP_TYPES) + r')_)?\d{8}_\d{6}'
+    return re.match(pattern, name) is not None
+
+
+class Catalog:
+    # Spis kopii w miejscu docelowym: nazwa, czas, rozmiar, skrót, zadanie,
+    # rodzaj i kopia nadrzędna. Listowanie i retencja czytają jeden mały
+    # plik zamiast całego katalogu na serwerze.
+    def __init__(self, entries=None, seeded=None):
+        self.entries = entries if entries is not None else {}
+        self.seeded = seeded if seeded is not None else []
+
+    def add(self, entry):
+        self.entries[entry['name']] = entry
+
+    def remove(self, name):
+        self.entries.pop(name, None)
+
+    def names(self, prefix='', kind=None):
+        return sorted(name for name, entry in self.entries.items()
+                      if matches_prefix(name, prefix) and (kind is None or entry.get('kind') == kind))
+
+    def find(self, prefix):
+        # Pełna nazwa archiwum dla nazwy kopii bez rozszerzenia
+        for name in sorted(self.entries):
+            if name == prefix or name.startswith(prefix + '.'):
+                return name
+        return None
+
+    def to_dict(self):
+        return {
+            'format': CATALOG_FORMAT,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'seeded': self.seeded,
+            'entries': [self.entries[name] for name in sorted(self.entries)]
+        }
+
+    def to_bytes(self):
+        return json.dumps(self.to_dict(), indent=1).encode()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({entry['name']: entry for entry in data.get('entries', [])}, data.get('seeded', []))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_dict(json.loads(data))
+
+
+class CatalogStore:
+    # Lokalna kopia katalogu jest ważna, dopóki rozmiar i czas modyfikacji
+    # pliku w miejscu docelowym się nie zmienią - wtedy wystarcza jedno
+    # zapytanie o metadane zamiast pobierania katalogu
+    def __init__(self, cache_dir, key):
+        self.key = key
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        self.cache_path = os.path.join(cache_dir, f'catalog_{digest}.json')
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_cache(self, version, catalog):
+        if version is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': self.key, 'version': version, 'catalog': catalog.to_dict()}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def load(self, storage):
+        version = storage.version(CATALOG_NAME)
+        if version is None:
+            return None
+        cached = self._read_cache()
+        if cached and cached.get('version') == version:
+            return Catalog.from_dict(cached['catalog'])
+        catalog = Catalog.from_bytes(storage.read_bytes(CATALOG_NAME))
+        self._write_cache(version, catalog)
+        return catalog
+
+    def update(self, storage, change):
+        # Odczyt, zmiana i atomowy zapis (plik tymczasowy + zmiana nazwy)
+        with catalog_lock(self.key):
+            catalog = self.load(storage) or Catalog()
+            change(catalog)
+            storage.write_bytes(CATALOG_NAME, catalog.to_bytes())
+            self._write_cache(storage.version(CATALOG_NAME), catalog)
+        return catalog
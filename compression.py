@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import gzip
+import hashlib
+import lzma
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from throttle import default_throttle
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+CODEC_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'lz4': '.lz4',
+    'xz': '.xz',
+    'none': ''
+}
+
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+    'lz4': 0,
+    'xz': 6,
+    'none': 0
+}
+
+CODEC_ALIASES = {
+    'gz': 'gzip',
+    'zst': 'zstd',
+    'lzma': 'xz'
+}
+
+
+def resolve_codec(compress):
+    # backup_settings.compress: True/False lub nazwa algorytmu
+    if compress is True or compress is None:
+        return 'gzip'
+    if compress is False:
+        return 'none'
+    codec = str(compress).lower()
+    codec = CODEC_ALIASES.get(codec, codec)
+    if codec not in CODEC_EXTENSIONS:
+        raise ValueError(f'Nieobsługiwany algorytm kompresji: {compress}')
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError('Kompresja zstd wymaga biblioteki zstandard')
+    if codec == 'lz4' and lz4frame is None:
+        raise ValueError('Kompresja lz4 wymaga biblioteki lz4')
+    return codec
+
+
+def archive_extension(codec):
+    return '.tar' + CODEC_EXTENSIONS[codec]
+
+
+ARCHIVE_EXTENSIONS = tuple(archive_extension(codec) for codec in CODEC_EXTENSIONS)
+
+
+def is_archive_name(name):
+    return name.endswith(ARCHIVE_EXTENSIONS)
+
+
+def codec_from_name(name, base='.tar'):
+    for codec, extension in CODEC_EXTENSIONS.items():
+        if extension and name.endswith(base + extension):
+            return codec
+    return 'none'
+
+
+def compress_block(codec, level, data):
+    # Każdy blok jest samodzielnym członem gzip / ramką zstd, lz4 lub xz,
+    # więc ich konkatenacja jest poprawnym strumieniem dla dekompresora
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == 'lz4':
+        return lz4frame.compress(data, compression_level=level)
+    if codec == 'xz':
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def decompress_block(codec, data):
+    # Odwrotność compress_block dla pojedynczego bloku archiwum
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == 'lz4':
+        return lz4frame.decompress(data)
+    if codec == 'xz':
+        return lzma.decompress(data)
+    return data
+
+
+def open_decompressor(fileobj, codec):
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    if codec == 'lz4':
+        return lz4frame.LZ4FrameFile(fileobj, mode='rb')
+    if codec == 'xz':
+        return lzma.LZMAFile(fileobj, mode='rb')
+    return fileobj
+
+
+class ParallelCompressor:
+    # Strumień zapisu w stylu pigz: dane dzielone są na bloki kompresowane
+    # równolegle w puli wątków (zlib, lzma, zstd i lz4 zwalniają GIL),
+    # a wyniki zapisywane są do pliku docelowego w oryginalnej kolejności
+    def __init__(self, fileobj, codec='gzip', workers=0, level=None, block_size=DEFAULT_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.codec = codec
+        self.level = DEFAULT_LEVELS[codec] if level is None else level
+        self.workers = workers or os.cpu_count() or 1
+        self.block_size = block_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Skrót archiwum liczony w trakcie zapisu, bez ponownego odczytu pliku
+        self.digest = hashlib.sha256()
+        # (przesunięcie danych, przesunięcie w archiwum, rozmiar po i przed
+        # kompresją, SHA-256 skompresowanego bloku)
+        self.blocks = []
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._started = time.monotonic()
+        self._finished = None
+        self._executor = None
+        if self.workers > 1 and codec != 'none':
+            # Wątki kompresji z obniżonym priorytetem (throttle.nice, ionice_class)
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='compress',
+                                                initializer=default_throttle.lower_thread_priority)
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_in += len(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        if self._executor is None:
+            self._emit(len(block), compress_block(self.codec, self.level, block))
+            return
+        self._pending.append((len(block), self._executor.submit(compress_block, self.codec, self.level, block)))
+        # Ogranicz liczbę bloków w locie, aby nie buforować całego archiwum
+        while len(self._pending) > self.workers * 2:
+            self._drain_one()
+
+    def _drain_one(self):
+        raw_size, future = self._pending.popleft()
+        self._emit(raw_size, future.result())
+
+    def _emit(self, raw_size, data):
+        raw_offset = self.blocks[-1][0] + self.blocks[-1][3] if self.blocks else 0
+        self.blocks.append((raw_offset, self.bytes_out, len(data), raw_size, hashlib.sha256(data).hexdigest()))
+        self.fileobj.write(data)
+        self.digest.update(data)
+        self.bytes_out += len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._finished is not None:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._drain_one()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._finished = time.monotonic()
+
+    def abort(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        self._pending.clear()
+        self._finished = time.monotonic()
+
+    def stats(self):
+        elapsed = max((self._finished or time.monotonic()) - self._started, 1e-6)
+        return {
+            'codec': self.codec,
+            'workers': self.workers if self._executor is not None else 1,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'sha256': self.digest.hexdigest(),
+            'seconds': elapsed,
+            'mb_per_s': self.bytes_in / elapsed / (1024 * 1024),
+            'ratio': self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+        }
+
+
+def format_stats(stats):
+    return (f"{stats['codec']}, wątki: {stats['workers']}, "
+            f"{stats['mb_per_s']:.1f} MB/s, współczynnik {stats['ratio']:.2f}")
@@ -1,34 +1,224 @@
 #!/usr/bin/env python3
+import json
 import os
+import re
+import shutil
 import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
+from catalog import matches_prefix
+from compression import CODEC_EXTENSIONS, codec_from_name, open_decompressor
+from fanout import fanout_result
+from file_handler import FileHandler
+from integrity import HashingReader, check_digest
+from retention import format_reclaimed, order_backups
+from storage import open_storage
+from streaming import consumer_stream
+from throttle import default_throttle
+
+DUMP_SUFFIX = '.sql'
+DIRECTORY_SUFFIX = '.pgdump.tar'
+TABLES_SUFFIX = '.tables'
+BASE_SUFFIX = '.pgbase.tar'
+SQL_EXTENSIONS = tuple(DUMP_SUFFIX + extension for extension in CODEC_EXTENSIONS.values())
+BASE_EXTENSIONS = tuple(BASE_SUFFIX + extension for extension in CODEC_EXTENSIONS.values())
+DUMP_EXTENSIONS = SQL_EXTENSIONS + BASE_EXTENSIONS + (DIRECTORY_SUFFIX, TABLES_SUFFIX)
+MANIFEST_NAME = 'manifest.json'
+META_SUFFIX = '.json'
+POSITION_SCAN_SIZE = 64 * 1024
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+WAL_SEGMENT = re.compile(r'^[0-9A-F]{24}')
+BINLOG_POSITION = re.compile(rb"CHANGE (?:MASTER|REPLICATION SOURCE) TO (?:MASTER|SOURCE)_LOG_FILE='([^']+)', "
+                             rb"(?:MASTER|SOURCE)_LOG_POS=(\d+)")
+READ_SIZE = 1024 * 1024
+DEFAULT_DUMP_JOBS = 4
+DEFAULT_RESTORE_JOBS = 4
+# Narzędzia kopii uruchamiane z obniżonym priorytetem (throttle.nice, ionice_class)
+DUMP_PROGRAMS = ('mysqldump', 'mysqlbinlog', 'pg_dump', 'pg_basebackup')
+
+# Komunikaty --verbose pg_dump/pg_restore wyznaczające początek i koniec
+# przetwarzania danych tabeli
+TABLE_STARTED = re.compile(r'dumping contents of table "(?:[^"]+\.)?(?P<name>[^"]+)"'
+                           r'|(?:launching|processing) item \d+ TABLE DATA (?:\S+ )?(?P<item>\S+)$')
+TABLE_FINISHED = re.compile(r'finished item \d+ TABLE DATA (?:\S+ )?(?P<name>\S+)$')
+
+
+def program_name(command):
+    # Nazwa narzędzia także dla polecenia poprzedzonego nice/ionice
+    return next((part for part in command if part in DUMP_PROGRAMS), command[0])
+
+
+class TableTimer:
+    # Czas przetwarzania poszczególnych tabel, aby było widać, które
+    # relacje dominują w czasie zrzutu lub przywracania
+    def __init__(self, sequential=False):
+        self.sequential = sequential
+        self.started = {}
+        self.times = {}
+
+    def start(self, name, now=None):
+        now = time.monotonic() if now is None else now
+        if self.sequential:
+            self.finish_all(now)
+        self.started[name] = now
+
+    def finish(self, name, now=None):
+        if name in self.started:
+            now = time.monotonic() if now is None else now
+            self.times[name] = self.times.get(name, 0.0) + now - self.started.pop(name)
+
+    def finish_all(self, now=None):
+        for name in list(self.started):
+            self.finish(name, now)
+
+    def feed(self, line):
+        match = TABLE_STARTED.search(line)
+        if match:
+            self.start(match.group('name') or match.group('item'))
+            return
+        match = TABLE_FINISHED.search(line)
+        if match:
+            self.finish(match.group('name'))
+
+    def slowest(self, limit=5):
+        return sorted(self.times.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+# Komentarz, którym mysqldump poprzedza dane każdej tabeli
+TABLE_MARKER = re.compile(rb'^-- Dumping data for table `((?:[^`]|``)+)`')
+
+
+def group_tables(tables, count):
+    # Największe tabele rozdzielane najpierw, zawsze do najmniej obciążonej grupy
+    groups = [[0, []] for _ in range(max(1, min(count, len(tables))))]
+    for name, size in sorted(tables, key=lambda table: table[1], reverse=True):
+        group = min(groups, key=lambda group: group[0])
+        group[0] += size
+        group[1].append(name)
+    return [names for size, names in groups if names]
+
+
+def table_files(names, extension):
+    # Nazwy plików bezpieczne dla każdego miejsca docelowego, bez kolizji
+    files = {}
+    used = set()
+    for name in names:
+        base = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+        candidate = base
+        suffix = 1
+        while candidate.lower() in used:
+            candidate = f'{base}_{suffix}'
+            suffix += 1
+        used.add(candidate.lower())
+        files[name] = f'{candidate}{DUMP_SUFFIX}{extension}'
+    return files
+
+
+def log_name(file_name):
+    # Nazwa segmentu WAL lub pliku binlog bez rozszerzenia kompresji
+    for extension in CODEC_EXTENSIONS.values():
+        if extension and file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return file_name
+
+
+def log_order(name):
+    # Segmenty WAL porównywane bez linii czasu, pliki binlog po numerze
+    return name[8:24] if WAL_SEGMENT.match(name) else name
+
+
+def format_table_times(timer, limit=5):
+    slowest = timer.slowest(limit)
+    if not slowest:
+        return ''
+    return ' (najdłużej: ' + ', '.join(f'{name} {seconds:.1f} s' for name, seconds in slowest) + ')'
 
 class DatabaseHandler:
-    def __init__(self, config):
+    def __init__(self, config, pool=None, progress=None):
         self.config = config
+        self.file_handler = FileHandler(config, pool, progress)
+        self.last_table_times = {}
 
     def create_backup_name(self):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        job_name = self.config.get('job_name')
+        if job_name:
+            return f'backup_db_{job_name}_{timestamp}.sql'
         return f'backup_db_{timestamp}.sql'
 
+    def backup_prefix(self):
+        job_name = self.config.get('job_name')
+        return f'backup_db_{job_name}_' if job_name else 'backup_db_'
+
+    def use_streaming(self):
+        return self.config['backup_settings'].get('streaming', False)
+
+    def use_point_in_time(self):
+        return self.config['database_settings'].get('point_in_time', False)
+
+    def log_dir(self):
+        return self.backup_prefix() + 'logs'
+
+    def use_table_format(self):
+        db_settings = self.config['database_settings']
+        return db_settings['type'].lower() == 'mysql' and db_settings.get('dump_format', 'plain') == 'tables'
+
+    def use_directory_format(self):
+        db_settings = self.config['database_settings']
+        return (db_settings['type'].lower() == 'postgresql'
+                and db_settings.get('dump_format', 'plain') == 'directory')
+
+    def priority_command(self, command):
+        if command[0] in DUMP_PROGRAMS:
+            return default_throttle.priority_command(command)
+        return command
+
+    def mysql_command(self, program):
+        db_settings = self.config['database_settings']
+        return self.priority_command([
+            program,
+            f'--host={db_settings["host"]}',
+            f'--port={db_settings["port"]}',
+            f'--user={db_settings["username"]}',
+            f'--password={db_settings["password"]}'
+        ])
+
+    def postgresql_command(self, program):
+        db_settings = self.config['database_settings']
+        return self.priority_command([
+            program,
+            f'--host={db_settings["host"]}',
+            f'--port={db_settings["port"]}',
+            f'--username={db_settings["username"]}',
+            f'--dbname={db_settings["database"]}'
+        ])
+
+    def postgresql_env(self):
+        # Ustaw zmienne środowiskowe dla hasła
+        env = os.environ.copy()
+        env['PGPASSWORD'] = self.config['database_settings']['password']
+        return env
+
     def backup_mysql(self):
         try:
             backup_name = self.create_backup_name()
             db_settings = self.config['database_settings']
             
             # Przygotuj komendę mysqldump
-            command = [
-                'mysqldump',
-                f'--host={db_settings["host"]}',
-                f'--port={db_settings["port"]}',
-                f'--user={db_settings["username"]}',
-                f'--password={db_settings["password"]}',
-                db_settings['database']
-            ]
+            command = self.mysql_command('mysqldump') + [db_settings['database']]
             
             # Wykonaj backup
-            with open(backup_name, 'w') as f:
+            with self.file_handler.metrics.phase('dump'), open(backup_name, 'w') as f:
                 subprocess.run(command, stdout=f, check=True)
+            self.file_handler.metrics.add('bytes_out', os.path.getsize(backup_name))
+            self.cleanup_local_dumps()
             
             return True, backup_name
         except subprocess.CalledProcessError as e:
@@ -41,14 +231,7 @@ class DatabaseHandler:
             db_settings = self.config['database_settings']
             
             # Przygotuj komendę mysql
-            command = [
-                'mysql',
-                f'--host={db_settings["host"]}',
-                f'--port={db_settings["port"]}',
-                f'--user={db_settings["username"]}',
-                f'--password={db_settings["password"]}',
-                db_settings['database']
-            ]
+            command = self.mysql_command('mysql') + [db_settings['database']]
             
             # Wykonaj przywracanie
             with open(backup_file, 'r') as f:
@@ -63,25 +246,18 @@ class DatabaseHandler:
     def backup_postgresql(self):
         try:
             backup_name = self.create_backup_name()
-            db_settings = self.config['database_settings']
-            
-            # Ustaw zmienne środowiskowe dla hasła
-            env = os.environ.copy()
-            env['PGPASSWORD'] = db_settings['password']
             
             # Przygotuj komendę pg_dump
-            command = [
-                'pg_dump',
-                f'--host={db_settings["host"]}',
-                f'--port={db_settings["port"]}',
-                f'--username={db_settings["username"]}',
-                f'--dbname={db_settings["database"]}',
+            command = self.postgresql_command('pg_dump') + [
                 '--format=plain',
                 f'--file={backup_name}'
             ]
             
             # Wykonaj backup
-            subprocess.run(command, env=env, check=True)
+            with self.file_handler.metrics.phase('dump'):
+                subprocess.run(command, env=self.postgresql_env(), check=True)
+            self.file_handler.metrics.add('bytes_out', os.path.getsize(backup_name))
+            self.cleanup_local_dumps()
             
             return True, backup_name
         except subprocess.CalledProcessError as e:
@@ -91,24 +267,11 @@ class DatabaseHandler:
 
     def restore_postgresql(self, backup_file):
         try:
-            db_settings = self.config['database_settings']
-            
-            # Ustaw zmienne środowiskowe dla hasła
-            env = os.environ.copy()
-            env['PGPASSWORD'] = db_settings['password']
-            
             # Przygotuj komendę psql
-            command = [
-                'psql',
-                f'--host={db_settings["host"]}',
-                f'--port={db_settings["port"]}',
-                f'--username={db_settings["username"]}',
-                f'--dbname={db_settings["database"]}',
-                f'--file={backup_file}'
-            ]
+            command = self.postgresql_command('psql') + [f'--file={backup_file}']
             
             # Wykonaj przywracanie
-            subprocess.run(command, env=env, check=True)
+            subprocess.run(command, env=self.postgresql_env(), check=True)
             
             return True, 'Baza danych została przywrócona pomyślnie'
         except subprocess.CalledProcessError as e:
@@ -116,7 +279,909 @@ class DatabaseHandler:
         except Exception as e:
             return False, f'Nieoczekiwany błąd: {str(e)}'
 
+    def dump_command(self):
+        db_type = self.config['database_settings']['type'].lower()
+        if db_type == 'mysql':
+            return self.mysql_command('mysqldump') + [self.config['database_settings']['database']], None
+        elif db_type == 'postgresql':
+            return self.postgresql_command('pg_dump') + ['--format=plain'], self.postgresql_env()
+        raise ValueError(f'Nieobsługiwany typ bazy danych: {db_type}')
+
+    def load_command(self):
+        db_type = self.config['database_settings']['type'].lower()
+        if db_type == 'mysql':
+            return self.mysql_command('mysql') + [self.config['database_settings']['database']], None
+        elif db_type == 'postgresql':
+            return self.postgresql_command('psql'), self.postgresql_env()
+        raise ValueError(f'Nieobsługiwany typ bazy danych: {db_type}')
+
+    def write_dump(self, command, env, fileobj):
+        # Wyjście procesu kompresowane w locie; gdy odbiorca nie nadąża,
+        # zapis blokuje się i zrzut czeka na potoku (bez buforowania całości)
+        compressor = self.file_handler.open_compressor(fileobj)
+        metrics = self.file_handler.metrics
+        with metrics.phase('dump'), tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, env=env)
+            try:
+                for chunk in iter(lambda: process.stdout.read(READ_SIZE), b''):
+                    metrics.add('bytes_read', len(chunk))
+                    metrics.tick()
+                    compressor.write(chunk)
+                process.stdout.close()
+                if process.wait() != 0:
+                    errors.seek(0)
+                    raise subprocess.CalledProcessError(process.returncode, program_name(command),
+                                                        stderr=errors.read().decode(errors='replace'))
+                compressor.close()
+            except BaseException:
+                compressor.abort()
+                process.kill()
+                process.wait()
+                raise
+        self.file_handler.last_compression = compressor.stats()
+        metrics.add_compression(self.file_handler.last_compression)
+
+    def backup_stream(self):
+        # Zrzut płynie z procesu przez kompresor prosto do miejsca docelowego,
+        # więc nieskompresowana kopia bazy nigdy nie trafia na dysk
+        try:
+            codec = self.file_handler.compression_codec()
+            backup_name = self.create_backup_name() + CODEC_EXTENSIONS[codec]
+            command, env = self.dump_command()
+            self.upload_dump(backup_name, command, env)
+            self.record_dump(backup_name)
+            self.prune_backups()
+            return True, (f'Kopia zapasowa bazy danych {backup_name} została utworzona pomyślnie'
+                          + self.file_handler.compression_summary())
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas tworzenia kopii zapasowej bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def backup_fanout(self):
+        # Jeden zrzut, kompresowany raz, trafia równocześnie do wszystkich
+        # miejsc docelowych z listy targets
+        try:
+            codec = self.file_handler.compression_codec()
+            backup_name = self.create_backup_name() + CODEC_EXTENSIONS[codec]
+            command, env = self.dump_command()
+            results = self.file_handler.upload_fanout(backup_name, lambda f: self.write_dump(command, env, f))
+
+            def finalize(handler):
+                target = DatabaseHandler(handler.config, handler.pool)
+                target.file_handler = handler
+                target.record_dump(backup_name, stats=self.file_handler.last_compression)
+                try:
+                    target.prune_backups()
+                except Exception as e:
+                    print(f'Błąd podczas usuwania starych kopii zapasowych bazy danych: {str(e)}')
+
+            statuses = self.file_handler.finish_fanout(results, backup_name, finalize, 'database')
+            return fanout_result(statuses, f'Kopia zapasowa bazy danych {backup_name}',
+                                 self.file_handler.compression_summary())
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas tworzenia kopii zapasowej bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def load_dump(self, backup_name):
+        # Zrzut pobierany i rozpakowywany w locie na wejście klienta bazy
+        codec = codec_from_name(backup_name, DUMP_SUFFIX)
+        command, env = self.load_command()
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=errors, env=env)
+            try:
+                self.read_dump(backup_name, lambda f: shutil.copyfileobj(
+                    open_decompressor(f, codec), process.stdin, READ_SIZE))
+                process.stdin.close()
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            if process.wait() != 0:
+                errors.seek(0)
+                raise subprocess.CalledProcessError(process.returncode, program_name(command),
+                                                    stderr=errors.read().decode(errors='replace'))
+
+    def restore_stream(self, backup_name):
+        try:
+            self.load_dump(backup_name)
+            return True, 'Baza danych została przywrócona pomyślnie'
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas przywracania bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def read_dump(self, backup_name, consume, verify=True):
+        # Suma kontrolna z katalogu kopii sprawdzana w tym samym przebiegu;
+        # pliki wewnątrz katalogów zrzutu i logi nie mają wpisów w katalogu
+        locations = self.config['backup_locations']
+        checksum = None
+        if verify and '/' not in backup_name:
+            checksum = self.file_handler.expected_checksum(locations['type'], backup_name, locations['destination'])
+        if locations['type'] == 'local':
+            with open(os.path.join(locations['destination'], backup_name), 'rb') as f:
+                reader = HashingReader(f)
+                consume(reader)
+                if checksum:
+                    reader.drain()
+        else:
+            with self.file_handler.download_stream(locations['type'], backup_name, [0]) as stream:
+                reader = HashingReader(stream)
+                consume(reader)
+                if checksum:
+                    reader.drain()
+        check_digest(backup_name, checksum, reader.hexdigest())
+
+    def run_verbose(self, command, env, timer):
+        # Komunikaty --verbose czytane na bieżąco; ostatnie wiersze trafiają
+        # do opisu błędu, gdy narzędzie zakończy się niepowodzeniem
+        tail = deque(maxlen=10)
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   env=env, text=True, errors='replace')
+        try:
+            for line in process.stderr:
+                line = line.rstrip()
+                timer.feed(line)
+                tail.append(line)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stderr.close()
+            process.wait()
+        timer.finish_all()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, program_name(command), stderr='\n'.join(tail))
+
+    def pack_directory(self, dump_path, fileobj):
+        # Pliki tabel są już skompresowane przez pg_dump, tar ich nie kompresuje
+        with tarfile.open(fileobj=fileobj, mode='w|') as tar:
+            tar.add(dump_path, arcname='dump')
+
+    def backup_postgresql_directory(self):
+        # pg_dump --format=directory --jobs=N: każda tabela zrzucana osobnym
+        # połączeniem do katalogu roboczego, który następnie trafia jako
+        # jedno archiwum tar do miejsca docelowego
+        try:
+            locations = self.config['backup_locations']
+            db_settings = self.config['database_settings']
+            jobs = max(1, int(db_settings.get('dump_jobs', DEFAULT_DUMP_JOBS)))
+            backup_name = self.create_backup_name()[:-len(DUMP_SUFFIX)] + DIRECTORY_SUFFIX
+            staging = tempfile.mkdtemp(prefix='pg_dump_', dir=db_settings.get('dump_staging_dir') or None)
+            timer = TableTimer(sequential=jobs == 1)
+            try:
+                dump_path = os.path.join(staging, 'dump')
+                command = self.postgresql_command('pg_dump') + [
+                    '--format=directory',
+                    f'--jobs={jobs}',
+                    '--verbose',
+                    f'--file={dump_path}'
+                ]
+                started = time.monotonic()
+                with self.file_handler.metrics.phase('dump'):
+                    self.run_verbose(command, self.postgresql_env(), timer)
+                dumped = time.monotonic() - started
+                self.file_handler.upload_stream(locations['type'], backup_name,
+                                                lambda f: self.pack_directory(dump_path, f),
+                                                locations['destination'])
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self.last_table_times = timer.times
+            self.record_dump(backup_name, stats={})
+            self.prune_backups()
+            return True, (f'Kopia zapasowa bazy danych {backup_name} została utworzona pomyślnie '
+                          f'(pg_dump, procesy: {jobs}, {dumped:.1f} s)' + format_table_times(timer))
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas tworzenia kopii zapasowej bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def restore_postgresql_directory(self, backup_name):
+        # pg_restore --jobs=N odtwarza dane i indeksy wielu tabel naraz;
+        # istniejące obiekty są usuwane przed odtworzeniem (--clean)
+        try:
+            db_settings = self.config['database_settings']
+            jobs = max(1, int(db_settings.get('restore_jobs', DEFAULT_RESTORE_JOBS)))
+            staging = tempfile.mkdtemp(prefix='pg_restore_', dir=db_settings.get('dump_staging_dir') or None)
+            timer = TableTimer(sequential=jobs == 1)
+            try:
+                self.read_dump(backup_name, lambda f: self.file_handler.extract_archive(f, 'none', staging))
+                command = self.postgresql_command('pg_restore') + [
+                    f'--jobs={jobs}',
+                    '--clean',
+                    '--if-exists',
+                    '--verbose',
+                    os.path.join(staging, 'dump')
+                ]
+                started = time.monotonic()
+                self.run_verbose(command, self.postgresql_env(), timer)
+                restored = time.monotonic() - started
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self.last_table_times = timer.times
+            return True, (f'Baza danych została przywrócona pomyślnie '
+                          f'(pg_restore, procesy: {jobs}, {restored:.1f} s)' + format_table_times(timer))
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas przywracania bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def mysql_query(self, query):
+        command = self.mysql_command('mysql') + [
+            '--batch',
+            '--skip-column-names',
+            f'--execute={query}',
+            self.config['database_settings']['database']
+        ]
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        return [line.split('\t') for line in result.stdout.splitlines()]
+
+    def mysql_tables(self):
+        rows = self.mysql_query(
+            "SELECT TABLE_NAME, COALESCE(DATA_LENGTH, 0) + COALESCE(INDEX_LENGTH, 0) "
+            "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'"
+        )
+        return [(name, int(size)) for name, size in rows]
+
+    def lock_tables(self):
+        # FLUSH TABLES WITH READ LOCK trzymany, aż każdy proces mysqldump
+        # rozpocznie swoją transakcję - wszystkie widzą ten sam stan bazy
+        command = self.mysql_command('mysql') + [
+            '--batch',
+            '--skip-column-names',
+            '--unbuffered',
+            self.config['database_settings']['database']
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process.stdin.write(b"FLUSH TABLES WITH READ LOCK;\nSELECT 'locked';\n")
+        process.stdin.flush()
+        if process.stdout.readline().strip() != b'locked':
+            process.kill()
+            stderr = process.communicate()[1]
+            raise subprocess.CalledProcessError(process.returncode, program_name(command),
+                                                stderr=stderr.decode(errors='replace'))
+        return process
+
+    def unlock_tables(self, process):
+        process.communicate(b'UNLOCK TABLES;\n')
+
+    def upload_dump(self, backup_name, command, env=None):
+        locations = self.config['backup_locations']
+        self.file_handler.upload_stream(locations['type'], backup_name,
+                                        lambda f: self.write_dump(command, env, f),
+                                        locations['destination'])
+
+    def compress_stream(self, source, fileobj):
+        compressor = self.file_handler.open_compressor(fileobj)
+        metrics = self.file_handler.metrics
+        try:
+            for chunk in iter(lambda: source.read(READ_SIZE), b''):
+                metrics.add('bytes_read', len(chunk))
+                metrics.tick()
+                compressor.write(chunk)
+            compressor.close()
+        except BaseException:
+            compressor.abort()
+            raise
+        metrics.add_compression(compressor.stats())
+
+    def dump_table_group(self, backup_dir, names, files, started, timer):
+        # Jeden proces mysqldump na grupę tabel; jego wyjście dzielone jest
+        # na pliki tabel według komentarzy poprzedzających dane tabeli
+        locations = self.config['backup_locations']
+        command = self.mysql_command('mysqldump') + [
+            '--single-transaction',
+            '--no-create-info',
+            '--skip-triggers',
+            self.config['database_settings']['database']
+        ] + names
+        header = bytearray()
+        current = None
+        with self.file_handler.metrics.phase('dump'), tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+            try:
+                with ExitStack() as stack:
+                    sink = None
+                    for line in process.stdout:
+                        match = TABLE_MARKER.match(line)
+                        if match:
+                            # Transakcja mysqldump jest już otwarta
+                            started.set()
+                            stack.close()
+                            if current is not None:
+                                timer.finish(current)
+                            current = match.group(1).replace(b'``', b'`').decode()
+                            timer.start(current)
+                            name = f'{backup_dir}/{files[current]}'
+                            sink = stack.enter_context(consumer_stream(
+                                lambda pipe, name=name: self.file_handler.upload_stream(
+                                    locations['type'], name, lambda f: self.compress_stream(pipe, f),
+                                    locations['destination']),
+                                self.file_handler.stream_buffer_size()))
+                            # Nagłówek z ustawieniami sesji, aby każdy plik dało się wczytać osobno
+                            sink.write(header)
+                        if sink is None:
+                            header += line
+                        else:
+                            sink.write(line)
+                    process.stdout.close()
+                    if process.wait() != 0:
+                        errors.seek(0)
+                        raise subprocess.CalledProcessError(process.returncode, program_name(command),
+                                                            stderr=errors.read().decode(errors='replace'))
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                started.set()
+        if current is not None:
+            timer.finish(current)
+
+    def delete_dump(self, storage, backup_name):
+        if self.use_point_in_time():
+            try:
+                storage.delete(backup_name + META_SUFFIX)
+            except Exception:
+                pass
+        if backup_name.endswith(TABLES_SUFFIX):
+            for name in storage.listdir(backup_name):
+                storage.delete(f'{backup_name}/{name}')
+            storage.rmdir(backup_name)
+        else:
+            storage.delete(backup_name)
+
+    def backup_mysql_tables(self):
+        # Tabele zrzucane równolegle przez ograniczoną liczbę procesów
+        # mysqldump, każda do osobnego skompresowanego pliku, z manifestem
+        backup_dir = None
+        try:
+            db_settings = self.config['database_settings']
+            jobs = max(1, int(db_settings.get('dump_jobs', DEFAULT_DUMP_JOBS)))
+            extension = CODEC_EXTENSIONS[self.file_handler.compression_codec()]
+            backup_dir = self.create_backup_name()[:-len(DUMP_SUFFIX)] + TABLES_SUFFIX
+            tables = self.mysql_tables()
+            files = table_files([name for name, size in tables], extension)
+            groups = group_tables(tables, jobs)
+            with self.open_destination() as storage:
+                storage.makedirs(backup_dir)
+
+            started = time.monotonic()
+            database = db_settings['database']
+            schema_name = f'schema{DUMP_SUFFIX}{extension}'
+            self.upload_dump(f'{backup_dir}/{schema_name}', self.mysql_command('mysqldump') + [
+                '--single-transaction', '--no-data', '--skip-triggers', '--routines', database])
+
+            timer = TableTimer()
+            lock = self.lock_tables() if groups and len(groups) > 1 and db_settings.get('consistent_snapshot', True) else None
+            try:
+                with ThreadPoolExecutor(max(1, len(groups)), thread_name_prefix='mysqldump') as executor:
+                    events = [threading.Event() for _ in groups]
+                    futures = [executor.submit(self.dump_table_group, backup_dir, names, files, event, timer)
+                               for names, event in zip(groups, events)]
+                    if lock is not None:
+                        for event in events:
+                            event.wait()
+                        lock, locked = None, lock
+                        self.unlock_tables(locked)
+                    for future in futures:
+                        future.result()
+            finally:
+                if lock is not None:
+                    self.unlock_tables(lock)
+
+            triggers_name = f'triggers{DUMP_SUFFIX}{extension}'
+            self.upload_dump(f'{backup_dir}/{triggers_name}', self.mysql_command('mysqldump') + [
+                '--single-transaction', '--no-create-info', '--no-data', '--triggers', database])
+            elapsed = time.monotonic() - started
+
+            # Manifest zapisywany na końcu - jego obecność oznacza kompletną kopię
+            manifest = {
+                'format': 'mysql-tables',
+                'database': database,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'schema': schema_name,
+                'triggers': triggers_name,
+                'tables': [{'name': name, 'file': files[name], 'size': size,
+                            'seconds': round(timer.times.get(name, 0.0), 3)} for name, size in tables]
+            }
+            with self.open_destination() as storage:
+                storage.write_bytes(f'{backup_dir}/{MANIFEST_NAME}', json.dumps(manifest, indent=2).encode())
+            self.last_table_times = timer.times
+            self.record_dump(backup_dir, stats={})
+            self.prune_backups()
+            return True, (f'Kopia zapasowa bazy danych {backup_dir} została utworzona pomyślnie '
+                          f'(tabele: {len(tables)}, procesy: {len(groups)}, {elapsed:.1f} s)'
+                          + format_table_times(timer))
+        except subprocess.CalledProcessError as e:
+            self.discard_dump(backup_dir)
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas tworzenia kopii zapasowej bazy danych: {str(e)}{details}'
+        except Exception as e:
+            self.discard_dump(backup_dir)
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def discard_dump(self, backup_name):
+        # Usuń niekompletną kopię, ignorując błędy
+        if backup_name is None:
+            return
+        try:
+            with self.open_destination() as storage:
+                self.delete_dump(storage, backup_name)
+        except Exception:
+            pass
+
+    def restore_mysql_tables(self, backup_dir):
+        # Schemat, potem dane tabel równolegle (największe najpierw), na końcu wyzwalacze
+        try:
+            jobs = max(1, int(self.config['database_settings'].get('restore_jobs', DEFAULT_RESTORE_JOBS)))
+            with self.open_destination() as storage:
+                manifest = json.loads(storage.read_bytes(f'{backup_dir}/{MANIFEST_NAME}'))
+            started = time.monotonic()
+            self.load_dump(f'{backup_dir}/{manifest["schema"]}')
+            timer = TableTimer()
+
+            def load(table):
+                timer.start(table['name'])
+                self.load_dump(f'{backup_dir}/{table["file"]}')
+                timer.finish(table['name'])
+
+            tables = sorted(manifest['tables'], key=lambda table: table['size'], reverse=True)
+            if tables:
+                with ThreadPoolExecutor(min(jobs, len(tables)), thread_name_prefix='mysql') as executor:
+                    for future in [executor.submit(load, table) for table in tables]:
+                        future.result()
+            self.load_dump(f'{backup_dir}/{manifest["triggers"]}')
+            elapsed = time.monotonic() - started
+            self.last_table_times = timer.times
+            return True, (f'Baza danych została przywrócona pomyślnie '
+                          f'(tabele: {len(tables)}, procesy: {min(jobs, max(len(tables), 1))}, {elapsed:.1f} s)'
+                          + format_table_times(timer))
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas przywracania bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def postgresql_query(self, query):
+        command = self.postgresql_command('psql') + ['--no-align', '--tuples-only', f'--command={query}']
+        result = subprocess.run(command, capture_output=True, text=True, check=True, env=self.postgresql_env())
+        return result.stdout.splitlines()
+
+    def current_log(self):
+        # Bieżący segment WAL lub plik binlog - logi sprzed niego nie są
+        # potrzebne do odtworzenia kopii bazowej wykonanej od tej chwili
+        if self.config['database_settings']['type'].lower() == 'postgresql':
+            return self.postgresql_query('SELECT pg_walfile_name(pg_current_wal_lsn())')[0].strip()
+        try:
+            rows = self.mysql_query('SHOW MASTER STATUS')
+        except subprocess.CalledProcessError:
+            rows = self.mysql_query('SHOW BINARY LOG STATUS')
+        if not rows:
+            raise ValueError('Dziennik binarny MySQL jest wyłączony (log_bin)')
+        return rows[0][0]
+
+    def base_backup_command(self):
+        db_settings = self.config['database_settings']
+        if db_settings['type'].lower() == 'postgresql':
+            # Kopia fizyczna jako tar na standardowym wyjściu, z WAL potrzebnym do spójności
+            return self.priority_command([
+                'pg_basebackup',
+                f'--host={db_settings["host"]}',
+                f'--port={db_settings["port"]}',
+                f'--username={db_settings["username"]}',
+                '--pgdata=-',
+                '--format=tar',
+                '--wal-method=fetch',
+                '--checkpoint=fast'
+            ]), self.postgresql_env()
+        # Pozycja binlog zapisana w zrzucie jest punktem startu odtwarzania logów
+        return self.mysql_command('mysqldump') + [
+            '--single-transaction',
+            '--flush-logs',
+            '--master-data=2',
+            '--routines',
+            '--triggers',
+            db_settings['database']
+        ], None
+
+    def backup_point_in_time(self):
+        # Kopia bazowa; zmiany po niej odtwarzane są z przesłanych logów
+        try:
+            db_type = self.config['database_settings']['type'].lower()
+            extension = CODEC_EXTENSIONS[self.file_handler.compression_codec()]
+            base_name = self.create_backup_name()
+            if db_type == 'postgresql':
+                backup_name = base_name[:-len(DUMP_SUFFIX)] + BASE_SUFFIX + extension
+            else:
+                backup_name = base_name + extension
+            first_log = self.current_log()
+            command, env = self.base_backup_command()
+            self.upload_dump(backup_name, command, env)
+            with self.open_destination() as storage:
+                storage.write_bytes(backup_name + META_SUFFIX, json.dumps({
+                    'first_log': first_log,
+                    'created': datetime.now().strftime(TIME_FORMAT)
+                }).encode())
+            self.record_dump(backup_name, level='base')
+            message = f'Kopia bazowa bazy danych {backup_name} została utworzona pomyślnie'
+            message += self.file_handler.compression_summary()
+            if db_type == 'mysql':
+                message += f', wysłane pliki binlog: {len(self.ship_binlogs())}'
+            self.prune_backups()
+            return True, message
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas tworzenia kopii zapasowej bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def push_log(self, path, name=None):
+        # Segment WAL lub plik binlog kompresowany i wysyłany do katalogu logów.
+        # Plik już obecny w archiwum nie jest wysyłany ponownie.
+        name = name or os.path.basename(path)
+        locations = self.config['backup_locations']
+        remote_name = f'{self.log_dir()}/{name}{CODEC_EXTENSIONS[self.file_handler.compression_codec()]}'
+        with self.open_destination() as storage:
+            storage.makedirs(self.log_dir())
+            try:
+                storage.size(remote_name)
+                return False
+            except Exception:
+                pass
+        with open(path, 'rb') as source:
+            self.file_handler.upload_stream(locations['type'], remote_name,
+                                            lambda f: self.compress_stream(source, f),
+                                            locations['destination'])
+        return True
+
+    def push_wal(self, path):
+        # Wywoływane przez archive_command serwera PostgreSQL
+        try:
+            if not self.push_log(path):
+                return True, f'Segment WAL {os.path.basename(path)} jest już w archiwum'
+            return True, f'Segment WAL {os.path.basename(path)} został zarchiwizowany'
+        except Exception as e:
+            return False, f'Błąd podczas archiwizacji segmentu WAL: {str(e)}'
+
+    def find_log(self, storage, name):
+        for extension in CODEC_EXTENSIONS.values():
+            remote_name = f'{self.log_dir()}/{name}{extension}'
+            try:
+                storage.size(remote_name)
+                return remote_name
+            except Exception:
+                continue
+        return None
+
+    def fetch_log(self, remote_name, local_path):
+        codec = codec_from_name(remote_name, '')
+        tmp_path = local_path + '.tmp'
+        with open(tmp_path, 'wb') as target:
+            self.read_dump(remote_name, lambda f: shutil.copyfileobj(open_decompressor(f, codec), target, READ_SIZE))
+        os.replace(tmp_path, local_path)
+
+    def fetch_wal(self, name, local_path):
+        # Wywoływane przez restore_command podczas odtwarzania; brak pliku
+        # oznacza dla serwera koniec archiwum
+        try:
+            with self.open_destination() as storage:
+                remote_name = self.find_log(storage, name)
+            if remote_name is None:
+                return False, f'Brak segmentu WAL {name} w archiwum'
+            self.fetch_log(remote_name, local_path)
+            return True, f'Pobrano segment WAL {name}'
+        except Exception as e:
+            return False, f'Błąd podczas pobierania segmentu WAL: {str(e)}'
+
+    def ship_binlogs(self):
+        # Zamknięcie bieżącego pliku binlog i wysłanie zamkniętych plików
+        # nowszych od ostatniego w archiwum - starsze mogły zostać usunięte
+        # przez retencję, choć serwer nadal je przechowuje
+        self.mysql_query('FLUSH BINARY LOGS')
+        names = [row[0] for row in self.mysql_query('SHOW BINARY LOGS')][:-1]
+        with self.open_destination() as storage:
+            shipped = [log_order(log_name(name)) for name in storage.listdir(self.log_dir())]
+            backups = self.destination_backups(storage)
+        if shipped:
+            newest = max(shipped)
+            pending = [name for name in names if log_order(name) > newest]
+        else:
+            # Pierwsze wysyłanie zaczyna się od pliku z pozycji kopii bazowej,
+            # a nie od całej historii binlog serwera
+            start_file = self.base_binlog_file(backups)
+            if start_file is None:
+                raise ValueError('Brak kopii bazowej z pozycją binlog - najpierw wykonaj backup --target database')
+            pending = [name for name in names if log_order(name) >= log_order(start_file)]
+        staging_dir = self.config['database_settings'].get('dump_staging_dir') or None
+        for name in pending:
+            staging = tempfile.mkdtemp(prefix='binlog_', dir=staging_dir)
+            try:
+                command = self.mysql_command('mysqlbinlog') + [
+                    '--read-from-remote-server',
+                    '--raw',
+                    f'--result-file={staging}{os.sep}',
+                    name
+                ]
+                subprocess.run(command, capture_output=True, text=True, check=True)
+                self.push_log(os.path.join(staging, name), name)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        return pending
+
+    def ship_logs(self):
+        try:
+            if self.config['database_settings']['type'].lower() != 'mysql':
+                return False, 'Segmenty WAL PostgreSQL wysyła archive_command serwera (wal-push)'
+            shipped = self.ship_binlogs()
+            return True, f'Wysłane pliki binlog: {len(shipped)}'
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas wysyłania logów bazy danych: {str(e)}{details}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def base_binlog_file(self, backups):
+        # Plik binlog z pozycji najstarszej kopii bazowej - logi sprzed niej
+        # nie są potrzebne do odtworzenia żadnej z zachowanych kopii
+        for backup_name in reversed(order_backups(backups)):
+            if log_name(backup_name).endswith(DUMP_SUFFIX):
+                position = self.read_binlog_position(backup_name)
+                if position is not None:
+                    return position[0]
+        return None
+
+    def read_binlog_position(self, backup_name):
+        # Komentarz CHANGE MASTER TO zapisany przez --master-data=2 na początku zrzutu
+        codec = codec_from_name(backup_name, DUMP_SUFFIX)
+        header = bytearray()
+
+        def scan(f):
+            reader = open_decompressor(f, codec)
+            while len(header) < POSITION_SCAN_SIZE:
+                chunk = reader.read(POSITION_SCAN_SIZE - len(header))
+                if not chunk:
+                    break
+                header.extend(chunk)
+
+        self.read_dump(backup_name, scan, verify=False)
+        match = BINLOG_POSITION.search(header)
+        if not match:
+            return None
+        return match.group(1).decode(), int(match.group(2))
+
+    def restore_mysql_point_in_time(self, backup_name, target_time):
+        position = self.read_binlog_position(backup_name)
+        if position is None:
+            raise ValueError(f'Zrzut {backup_name} nie zawiera pozycji binlog - nie jest kopią bazową')
+        start_file, start_position = position
+        with self.open_destination() as storage:
+            files = sorted((name for name in storage.listdir(self.log_dir())
+                            if log_order(log_name(name)) >= log_order(start_file)),
+                           key=lambda name: log_order(log_name(name)))
+        if files and log_name(files[0]) != start_file:
+            raise ValueError(f'Brak pliku binlog {start_file} w archiwum')
+        if not files and target_time:
+            # Sama kopia bazowa nie odpowiada stanowi z żądanej chwili
+            raise ValueError(f'Brak plików binlog od {start_file} w archiwum - nie można odtworzyć '
+                             f'stanu z {target_time} (wyślij logi poleceniem backup --target logs)')
+
+        self.load_dump(backup_name)
+        if not files:
+            print(f'Ostrzeżenie: brak plików binlog od {start_file} w archiwum - '
+                  f'przywrócono tylko kopię bazową {backup_name}')
+            return 0
+        staging = tempfile.mkdtemp(prefix='binlog_', dir=self.config['database_settings'].get('dump_staging_dir') or None)
+        try:
+            paths = []
+            for file_name in files:
+                path = os.path.join(staging, log_name(file_name))
+                self.fetch_log(f'{self.log_dir()}/{file_name}', path)
+                paths.append(path)
+            # Jedno wywołanie mysqlbinlog dla wszystkich plików zachowuje stan
+            # sesji (np. tabele tymczasowe) między plikami
+            replay = ['mysqlbinlog', f'--start-position={start_position}']
+            if target_time:
+                replay.append(f'--stop-datetime={target_time}')
+            load, env = self.load_command()
+            with tempfile.TemporaryFile() as replay_errors, tempfile.TemporaryFile() as load_errors:
+                reader = subprocess.Popen(replay + paths, stdout=subprocess.PIPE, stderr=replay_errors)
+                loader = subprocess.Popen(load, stdin=reader.stdout, stderr=load_errors, env=env)
+                reader.stdout.close()
+                loader.wait()
+                reader.wait()
+                for process, command, errors in ((reader, replay, replay_errors), (loader, load, load_errors)):
+                    if process.returncode != 0:
+                        errors.seek(0)
+                        raise subprocess.CalledProcessError(process.returncode, program_name(command),
+                                                            stderr=errors.read().decode(errors='replace'))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return len(files)
+
+    def restore_postgresql_point_in_time(self, backup_name, target_time, config_file):
+        # Kopia bazowa rozpakowywana do pustego katalogu danych; WAL odtwarza
+        # sam serwer po uruchomieniu, pobierając segmenty przez wal-fetch
+        data_dir = self.config['database_settings'].get('data_directory')
+        if not data_dir:
+            raise ValueError('Nie skonfigurowano katalogu danych (database_settings.data_directory)')
+        if os.path.isdir(data_dir) and os.listdir(data_dir):
+            raise ValueError(f'Katalog danych {data_dir} nie jest pusty - zatrzymaj serwer i opróżnij katalog')
+        os.makedirs(data_dir, mode=0o700, exist_ok=True)
+        codec = codec_from_name(backup_name, BASE_SUFFIX)
+
+        def extract(f):
+            with tarfile.open(fileobj=open_decompressor(f, codec), mode='r|') as tar:
+                tar.extractall(path=data_dir)
+
+        self.read_dump(backup_name, extract)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backup_manager.py')
+        restore_command = (f'{sys.executable} {script} --config {os.path.abspath(config_file)} '
+                           f'wal-fetch %f %p').replace("'", "''")
+        settings = [f"restore_command = '{restore_command}'"]
+        if target_time:
+            settings += [f"recovery_target_time = '{target_time}'", "recovery_target_action = 'promote'"]
+        with open(os.path.join(data_dir, 'postgresql.auto.conf'), 'a') as f:
+            f.write('\n# Odtwarzanie do punktu w czasie\n' + '\n'.join(settings) + '\n')
+        open(os.path.join(data_dir, 'recovery.signal'), 'w').close()
+
+    def restore_point_in_time(self, backup_name, target_time=None, config_file='config.json'):
+        try:
+            if target_time:
+                datetime.strptime(target_time, TIME_FORMAT)
+            target = target_time or 'końca archiwum logów'
+            if self.config['database_settings']['type'].lower() == 'postgresql':
+                self.restore_postgresql_point_in_time(backup_name, target_time, config_file)
+                data_dir = self.config['database_settings']['data_directory']
+                return True, (f'Katalog danych {data_dir} został przygotowany - uruchom serwer PostgreSQL, '
+                              f'aby odtworzył WAL do {target}')
+            replayed = self.restore_mysql_point_in_time(backup_name, target_time)
+            return True, f'Baza danych została przywrócona do {target} (odtworzone pliki binlog: {replayed})'
+        except subprocess.CalledProcessError as e:
+            details = f' ({e.stderr.strip()})' if e.stderr and e.stderr.strip() else ''
+            return False, f'Błąd podczas przywracania bazy danych: {str(e)}{details}'
+        except ValueError as e:
+            return False, f'Błąd: {str(e)}'
+        except Exception as e:
+            return False, f'Nieoczekiwany błąd: {str(e)}'
+
+    def prune_logs(self, storage, backups):
+        # Logi sprzed początku najstarszej zachowanej kopii bazowej są zbędne;
+        # pliki historii linii czasu PostgreSQL zostają zawsze
+        firsts = []
+        for backup in backups:
+            try:
+                firsts.append(json.loads(storage.read_bytes(backup + META_SUFFIX))['first_log'])
+            except Exception:
+                return
+        if not firsts:
+            return
+        oldest = min(log_order(first) for first in firsts)
+        for file_name in storage.listdir(self.log_dir()):
+            name = log_name(file_name)
+            if not name.endswith('.history') and log_order(name) < oldest:
+                storage.delete(f'{self.log_dir()}/{file_name}')
+
+    def open_destination(self):
+        return open_storage(self.config, self.config['backup_locations']['type'], pool=self.file_handler.pool)
+
+    def record_dump(self, backup_name, level='full', stats=None):
+        locations = self.config['backup_locations']
+        self.file_handler.record_backup(locations['type'], backup_name, locations['destination'],
+                                        kind='database', level=level, stats=stats)
+
+    def destination_backups(self, storage=None):
+        # Zrzuty z katalogu kopii w miejscu docelowym; bez katalogu - z
+        # listowania, które jednocześnie uzupełnia katalog
+        locations = self.config['backup_locations']
+        prefix = self.backup_prefix()
+        catalog = self.file_handler.load_catalog(locations['type'], 'database', prefix, locations['destination'])
+        if catalog is not None:
+            return catalog.names(prefix, 'database')
+        if storage is None:
+            with self.open_destination() as storage:
+                names = storage.listdir()
+        else:
+            names = storage.listdir()
+        backups = [f for f in names if matches_prefix(f, prefix) and f.endswith(DUMP_EXTENSIONS)]
+        self.file_handler.seed_catalog(locations['type'], backups, 'database', prefix, locations['destination'])
+        return backups
+
+    def list_backups(self):
+        # Zrzuty w miejscu docelowym oraz starsze, nieskompresowane zrzuty
+        # .sql w katalogu bieżącym
+        backups = [f for f in os.listdir('.') if f.endswith(DUMP_SUFFIX)]
+        if self.use_destination():
+            try:
+                backups += [f for f in self.destination_backups() if f not in backups]
+            except Exception as e:
+                print(f'Błąd podczas listowania kopii zapasowych bazy danych: {str(e)}')
+        return sorted(backups)
+
+    def use_destination(self):
+        # Tryby, w których zrzuty trafiają do miejsca docelowego, a nie do katalogu bieżącego
+        return (self.use_streaming() or self.use_directory_format() or self.use_table_format()
+                or self.use_point_in_time())
+
+    def dump_size(self, storage, backup_name):
+        if backup_name.endswith(TABLES_SUFFIX):
+            return sum(storage.size(f'{backup_name}/{name}') for name in storage.listdir(backup_name))
+        return storage.size(backup_name)
+
+    def prune_backups(self, dry_run=False):
+        # Retencja zrzutów w miejscu docelowym w jednej sesji; zwraca usunięte
+        # kopie i liczbę zwolnionych bajtów
+        reclaimed = 0
+        with self.file_handler.metrics.phase('prune'), self.open_destination() as storage:
+            backups = self.destination_backups(storage)
+            expired = self.file_handler.expired_backups(backups)
+            for backup in expired:
+                reclaimed += self.dump_size(storage, backup)
+                if dry_run:
+                    print(f'Do usunięcia: {backup}')
+                else:
+                    self.delete_dump(storage, backup)
+            if self.use_point_in_time() and not dry_run:
+                self.prune_logs(storage, [backup for backup in backups if backup not in expired])
+        if not dry_run:
+            locations = self.config['backup_locations']
+            self.file_handler.uncatalog_backups(locations['type'], expired, locations['destination'])
+        return expired, reclaimed
+
+    def prune_local_dumps(self, dry_run=False):
+        # Nieskompresowane zrzuty .sql w katalogu bieżącym (tryb bez strumieniowania)
+        backups = [f for f in os.listdir('.') if matches_prefix(f, self.backup_prefix()) and f.endswith(DUMP_SUFFIX)]
+        expired = self.file_handler.expired_backups(backups)
+        reclaimed = 0
+        for backup in expired:
+            reclaimed += os.path.getsize(backup)
+            if dry_run:
+                print(f'Do usunięcia: {backup}')
+            else:
+                os.remove(backup)
+        return expired, reclaimed
+
+    def cleanup_local_dumps(self):
+        try:
+            with self.file_handler.metrics.phase('prune'):
+                self.prune_local_dumps()
+        except Exception as e:
+            print(f'Błąd podczas czyszczenia starych kopii zapasowych bazy danych: {str(e)}')
+
+    def prune(self, dry_run=False):
+        try:
+            expired, reclaimed = self.prune_local_dumps(dry_run)
+            if self.use_destination():
+                remote_expired, remote_reclaimed = self.prune_backups(dry_run)
+                expired += remote_expired
+                reclaimed += remote_reclaimed
+            return True, format_reclaimed(len(expired), reclaimed, dry_run)
+        except Exception as e:
+            return False, f'Błąd podczas usuwania starych kopii zapasowych bazy danych: {str(e)}'
+
     def backup_database(self):
+        self.file_handler.start_metrics('database')
+        return self.file_handler.finish_metrics(self.run_backup())
+
+    def run_backup(self):
+        if self.file_handler.use_fanout():
+            if self.use_point_in_time() or self.use_directory_format() or self.use_table_format():
+                return False, 'Tryb fanout obsługuje tylko strumieniowy zrzut bazy danych w jednym pliku'
+            return self.backup_fanout()
+        if self.use_point_in_time():
+            return self.backup_point_in_time()
+        if self.use_directory_format():
+            return self.backup_postgresql_directory()
+        if self.use_table_format():
+            return self.backup_mysql_tables()
+        if self.use_streaming():
+            return self.backup_stream()
         db_type = self.config['database_settings']['type'].lower()
         if db_type == 'mysql':
             return self.backup_mysql()
@@ -125,11 +1190,22 @@ class DatabaseHandler:
         else:
             return False, f'Nieobsługiwany typ bazy danych: {db_type}'
 
-    def restore_database(self, backup_file):
+    def restore_database(self, backup_file, target_time=None, config_file='config.json'):
+        # Zrzuty z katalogu bieżącego odtwarzane są jak dotąd, pozostałe
+        # strumieniowo z miejsca docelowego
+        if backup_file.endswith(BASE_EXTENSIONS) or (self.use_point_in_time() and not os.path.isfile(backup_file)
+                                                     and backup_file.endswith(SQL_EXTENSIONS)):
+            return self.restore_point_in_time(backup_file, target_time, config_file)
+        if backup_file.endswith(TABLES_SUFFIX):
+            return self.restore_mysql_tables(backup_file)
+        if backup_file.endswith(DIRECTORY_SUFFIX):
+            return self.restore_postgresql_directory(backup_file)
+        if not os.path.isfile(backup_file):
+            return self.restore_stream(backup_file)
         db_type = self.config['database_settings']['type'].lower()
         if db_type == 'mysql':
             return self.restore_mysql(backup_file)
         elif db_type == 'postgresql':
             return self.restore_postgresql(backup_file)
         else:
-            return False, f'Nieobsługiwany typ bazy danych: {db_type}'
\ No newline at end of file
+            return False, f'Nieobsługiwany typ bazy danych: {db_type}'
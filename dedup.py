@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import posixpath
+import socket
+import stat
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from catalog import matches_prefix
+from member_index import match_member
+from scanner import TreeScanner
+from throttle import ThrottledReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SNAPSHOT_SUFFIX = '.snapshot'
+CHUNK_DIR = 'chunks'
+SNAPSHOT_DIR = 'snapshots'
+LOCK_DIR = 'locks'
+# Trwająca kopia odświeża swoją blokadę co LOCK_REFRESH_SECONDS; blokada
+# nieodświeżana dłużej niż LOCK_STALE_SECONDS pochodzi z przerwanego procesu
+# i jest pomijana (zapas na opóźnienia sieci i różnice zegarów hostów)
+LOCK_REFRESH_SECONDS = 60
+LOCK_STALE_SECONDS = 10 * 60
+READ_SIZE = 8 * 1024 * 1024
+# Nowe fragmenty zapisywane są partiami (write_many), a odczytywane po
+# kilka naraz (read_many) - silnik asyncio ma wtedy wiele żądań w locie
+WRITE_BATCH_SIZE = 32 * 1024 * 1024
+WRITE_BATCH_COUNT = 64
+READ_BATCH_COUNT = 16
+HASH_BITS = 31
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# Tablica "gear" dla haszu kroczącego - deterministyczna, aby granice
+# fragmentów były takie same na każdym hoście
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') & HASH_MASK for i in range(256)]
+# Hasz wektorowy liczony jest odcinkami, aby nie przeliczać całego
+# max_size, gdy granica wypada wcześnie
+SCAN_STEP = 256 * 1024
+CHUNK_ID_SIZE = 32
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+
+def top_bits_mask(bits):
+    return ((1 << bits) - 1) << (HASH_BITS - bits)
+
+
+def gear_hashes(data, start, stop, origin):
+    # Wartości haszu kroczącego dla pozycji start..stop-1 naraz (numpy).
+    # Przesunięcie w lewo z maską HASH_BITS sprawia, że hasz zależy tylko od
+    # ostatnich HASH_BITS bajtów: h[i] = suma gear[b[i-k]] << k, k < HASH_BITS,
+    # z oknem obciętym na pozycji origin, od której liczy pętla bajtowa.
+    # Arytmetyka uint32 przepełnia się modulo 2^32, co zachowuje wynik modulo 2^31.
+    low = max(origin, start - (HASH_BITS - 1))
+    gears = GEAR_ARRAY[numpy.frombuffer(data, dtype=numpy.uint8, count=stop - low, offset=low)]
+    count = stop - start
+    offset = start - low
+    hashes = gears[offset:].copy()
+    shifted = numpy.empty(count, dtype=numpy.uint32)
+    for k in range(1, HASH_BITS):
+        first = max(0, k - offset)
+        if first >= count:
+            break
+        part = shifted[first:]
+        numpy.left_shift(gears[offset + first - k:offset + count - k], k, out=part)
+        hashes[first:] += part
+    hashes &= numpy.uint32(HASH_MASK)
+    return hashes
+
+
+def is_snapshot_name(name):
+    return name.endswith(SNAPSHOT_SUFFIX)
+
+
+class RepositoryLocked(RuntimeError):
+    pass
+
+
+class Chunker:
+    # Podział na fragmenty zależny od treści (FastCDC z normalizacją):
+    # wstawienie bajtów przesuwa tylko sąsiednie granice, a nie wszystkie
+    def __init__(self, avg_size=1024 * 1024):
+        self.avg_size = avg_size
+        self.min_size = avg_size // 4
+        self.max_size = avg_size * 4
+        bits = avg_size.bit_length() - 1
+        self.mask_s = top_bits_mask(bits + 1)
+        self.mask_l = top_bits_mask(bits - 1)
+
+    def boundary(self, data):
+        size = len(data)
+        if size <= self.min_size:
+            return size
+        end = min(size, self.max_size)
+        normal = min(self.avg_size, end)
+        if numpy is None:
+            return self.scan_bytes(data, normal, end)
+        # Te same granice co pętla bajtowa, ale bez pętli w Pythonie
+        position = self.min_size
+        mask_s = numpy.uint32(self.mask_s)
+        mask_l = numpy.uint32(self.mask_l)
+        while position < end:
+            stop = min(position + SCAN_STEP, end)
+            hashes = gear_hashes(data, position, stop, self.min_size)
+            split = min(max(normal - position, 0), stop - position)
+            hits = numpy.flatnonzero((hashes[:split] & mask_s) == 0)
+            if hits.size:
+                return position + int(hits[0]) + 1
+            hits = numpy.flatnonzero((hashes[split:] & mask_l) == 0)
+            if hits.size:
+                return position + split + int(hits[0]) + 1
+            position = stop
+        return end
+
+    def scan_bytes(self, data, normal, end):
+        # Pętla bajtowa, gdy numpy nie jest dostępne
+        gear = GEAR
+        h = 0
+        mask = self.mask_s
+        for i in range(self.min_size, normal):
+            h = ((h << 1) + gear[data[i]]) & HASH_MASK
+            if not h & mask:
+                return i + 1
+        mask = self.mask_l
+        for i in range(normal, end):
+            h = ((h << 1) + gear[data[i]]) & HASH_MASK
+            if not h & mask:
+                return i + 1
+        return end
+
+    def chunks(self, f):
+        buffer = bytearray()
+        eof = False
+        while not eof:
+            data = f.read(READ_SIZE)
+            eof = not data
+            buffer += data
+            while buffer and (eof or len(buffer) >= self.max_size):
+                cut = self.boundary(buffer)
+                yield bytes(buffer[:cut])
+                del buffer[:cut]
+
+
+class LockHeartbeat:
+    # Wątek odświeżający plik blokady, dopóki trwa kopia lub przywracanie
+    def __init__(self, open_storage, path, info, interval):
+        self.open_storage = open_storage
+        self.path = path
+        self.info = info
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='dedup-lock', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.info['refreshed'] = time.time()
+            try:
+                with self.open_storage() as storage:
+                    storage.write_bytes(self.path, json.dumps(self.info).encode())
+            except Exception as e:
+                print(f'Nie udało się odświeżyć blokady repozytorium: {str(e)}')
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class DedupRepository:
+    # Repozytorium: chunks/<sha256> przechowuje każdy unikalny fragment raz,
+    # a snapshots/<nazwa>.snapshot opisuje drzewo katalogów jako listę fragmentów.
+    # lock_storage otwiera osobną sesję do odświeżania blokady - jednej sesji
+    # FTP/SFTP nie mogą używać dwa wątki naraz; bez niej blokadę odświeża
+    # self.storage (katalog lokalny).
+    def __init__(self, storage, chunker=None, level=6, lock_storage=None):
+        self.storage = storage
+        self.chunker = chunker or Chunker()
+        self.level = level
+        self.lock_storage = lock_storage or (lambda: nullcontext(self.storage))
+        self.pending = []
+        self.pending_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Sesja przerwana w trakcie transferu nie wraca do puli
+        self.storage.close(failed=exc_type is not None)
+
+    def init(self):
+        self.storage.makedirs(CHUNK_DIR)
+        self.storage.makedirs(SNAPSHOT_DIR)
+
+    def known_chunks(self):
+        # Jedno listowanie katalogu zamiast sprawdzania każdego fragmentu osobno
+        return {name for name in self.storage.listdir(CHUNK_DIR) if not name.endswith('.tmp')}
+
+    def list_snapshots(self, prefix=''):
+        return sorted(name for name in self.storage.listdir(SNAPSHOT_DIR)
+                      if is_snapshot_name(name) and matches_prefix(name, prefix))
+
+    def active_locks(self):
+        names = [name for name in self.storage.listdir(LOCK_DIR) if not name.endswith('.tmp')]
+        now = time.time()
+        active = []
+        for name, data in zip(names, self.storage.read_many([posixpath.join(LOCK_DIR, n) for n in names])):
+            try:
+                info = json.loads(data)
+                refreshed = info.get('refreshed', info['created'])
+            except (ValueError, KeyError):
+                refreshed = now
+            if now - refreshed < LOCK_STALE_SECONDS:
+                active.append(name)
+        return active
+
+    @contextmanager
+    def lock(self, exclusive=False):
+        # Blokada w samym repozytorium, widoczna dla wszystkich hostów i
+        # zadań: kopie i przywracanie biorą blokadę współdzieloną, odśmiecanie
+        # - wyłączną. Najpierw zapis własnej blokady, potem sprawdzenie
+        # cudzych, więc z dwóch równoczesnych procesów co najmniej jeden
+        # zobaczy drugi.
+        name = f"{'gc' if exclusive else 'shared'}-{uuid.uuid4().hex}"
+        path = posixpath.join(LOCK_DIR, name)
+        self.storage.makedirs(LOCK_DIR)
+        created = time.time()
+        info = {
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'created': created,
+            'refreshed': created
+        }
+        self.storage.write_bytes(path, json.dumps(info).encode())
+        heartbeat = LockHeartbeat(self.lock_storage, path, info, LOCK_REFRESH_SECONDS)
+        heartbeat.start()
+        try:
+            others = [other for other in self.active_locks() if other != name]
+            if exclusive and others:
+                raise RepositoryLocked('Repozytorium jest używane przez trwającą kopię lub przywracanie - '
+                                       'odśmiecanie pominięte')
+            if not exclusive and any(other.startswith('gc-') for other in others):
+                raise RepositoryLocked('Trwa odśmiecanie repozytorium - spróbuj ponownie później')
+            yield
+        finally:
+            # Zatrzymanie przed usunięciem, aby odświeżenie nie odtworzyło pliku
+            heartbeat.stop()
+            try:
+                self.storage.delete(path)
+            except Exception:
+                pass
+
+    def load_snapshot(self, snapshot_name):
+        data = self.storage.read_bytes(posixpath.join(SNAPSHOT_DIR, snapshot_name))
+        return json.loads(zlib.decompress(data))
+
+    def store_file(self, path, known, stats):
+        chunk_ids = []
+        with open(path, 'rb') as f:
+            for chunk in self.chunker.chunks(ThrottledReader(f, 'read_kbps')):
+                chunk_id = hashlib.sha256(chunk).hexdigest()
+                stats['bytes_in'] += len(chunk)
+                if chunk_id in known:
+                    stats['duplicate_chunks'] += 1
+                else:
+                    data = zlib.compress(chunk, self.level)
+                    self.queue_chunk(chunk_id, data)
+                    known.add(chunk_id)
+                    stats['new_chunks'] += 1
+                    stats['bytes_stored'] += len(data)
+                chunk_ids.append(chunk_id)
+        return chunk_ids
+
+    def queue_chunk(self, chunk_id, data):
+        self.pending.append((posixpath.join(CHUNK_DIR, chunk_id), data))
+        self.pending_size += len(data)
+        if self.pending_size >= WRITE_BATCH_SIZE or len(self.pending) >= WRITE_BATCH_COUNT:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.storage.write_many(self.pending)
+        self.pending = []
+        self.pending_size = 0
+
+    def backup(self, source_path, backup_name, scanner=None, index=None):
+        self.init()
+        # Fragmenty uznane za istniejące nie mogą zniknąć przed zapisaniem migawki
+        with self.lock():
+            return self.store_snapshot(source_path, backup_name, scanner, index)
+
+    def previous_chunks(self, index):
+        # Listy fragmentów z poprzedniej kopii (indeks stanu plików); nieważne,
+        # gdy zmienił się średni rozmiar fragmentu
+        if index is None:
+            return {}
+        entries, meta = index.load()
+        if meta.get('chunk_size') != self.chunker.avg_size:
+            return {}
+        return entries
+
+    def reuse_chunks(self, previous, st, known, stats):
+        # Plik o niezmienionym rozmiarze, mtime i inode nie jest ponownie
+        # czytany ani dzielony, o ile wszystkie jego fragmenty są w repozytorium
+        if previous is None or tuple(previous[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        blob = previous[3] or b''
+        chunk_ids = [blob[i:i + CHUNK_ID_SIZE].hex() for i in range(0, len(blob), CHUNK_ID_SIZE)]
+        if not all(chunk_id in known for chunk_id in chunk_ids):
+            return None
+        stats['bytes_in'] += st.st_size
+        stats['duplicate_chunks'] += len(chunk_ids)
+        return chunk_ids
+
+    def store_snapshot(self, source_path, backup_name, scanner=None, index=None):
+        known = self.known_chunks()
+        stats = {'bytes_in': 0, 'bytes_stored': 0, 'new_chunks': 0, 'duplicate_chunks': 0}
+        entries = []
+        previous = self.previous_chunks(index)
+        state = {}
+        scanner = scanner or TreeScanner(source_path)
+        for rel_path, full_path, st in scanner.walk():
+            entry = {
+                'path': rel_path,
+                'mode': stat.S_IMODE(st.st_mode),
+                'mtime': st.st_mtime
+            }
+            if stat.S_ISLNK(st.st_mode):
+                entry['type'] = 'symlink'
+                entry['target'] = os.readlink(full_path)
+            elif stat.S_ISDIR(st.st_mode):
+                entry['type'] = 'dir'
+            elif stat.S_ISREG(st.st_mode):
+                entry['type'] = 'file'
+                entry['size'] = st.st_size
+                chunk_ids = self.reuse_chunks(previous.get(rel_path), st, known, stats)
+                if chunk_ids is None:
+                    try:
+                        chunk_ids = self.store_file(full_path, known, stats)
+                    except FileNotFoundError:
+                        continue
+                entry['chunks'] = chunk_ids
+                state[rel_path] = (st.st_size, st.st_mtime_ns, st.st_ino,
+                                   b''.join(bytes.fromhex(chunk_id) for chunk_id in chunk_ids))
+            else:
+                continue
+            entries.append(entry)
+
+        # Migawka zapisywana na końcu - wskazuje wyłącznie na zapisane fragmenty
+        self.flush()
+        snapshot_name = backup_name + SNAPSHOT_SUFFIX
+        snapshot = {
+            'name': snapshot_name,
+            'root': os.path.basename(os.path.normpath(source_path)),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'entries': entries
+        }
+        data = zlib.compress(json.dumps(snapshot).encode(), self.level)
+        self.storage.write_bytes(posixpath.join(SNAPSHOT_DIR, snapshot_name), data)
+        if index is not None:
+            index.save(state, {'last_backup': snapshot_name, 'chunk_size': self.chunker.avg_size})
+        return snapshot_name, stats
+
+    def check_chunk(self, chunk_id, data):
+        chunk = zlib.decompress(data)
+        if hashlib.sha256(chunk).hexdigest() != chunk_id:
+            raise ValueError(f'Uszkodzony fragment kopii zapasowej: {chunk_id}')
+        return chunk
+
+    def read_chunks(self, chunk_ids):
+        # Fragmenty w kolejności, pobierane po READ_BATCH_COUNT naraz
+        for start in range(0, len(chunk_ids), READ_BATCH_COUNT):
+            batch = chunk_ids[start:start + READ_BATCH_COUNT]
+            for chunk_id, data in zip(batch, self.storage.read_many([posixpath.join(CHUNK_DIR, c) for c in batch])):
+                yield self.check_chunk(chunk_id, data)
+
+    def restore(self, snapshot_name, destination_path, patterns=None):
+        with self.lock():
+            self.restore_snapshot(snapshot_name, destination_path, patterns)
+
+    def restore_snapshot(self, snapshot_name, destination_path, patterns=None):
+        snapshot = self.load_snapshot(snapshot_name)
+        base = os.path.realpath(os.path.join(destination_path, snapshot['root']))
+        os.makedirs(base, exist_ok=True)
+        directories = []
+        files = []
+        for entry in snapshot['entries']:
+            if patterns and not match_member(posixpath.join(snapshot['root'], entry['path']), patterns):
+                continue
+            target = os.path.normpath(os.path.join(base, entry['path']))
+            if not target.startswith(base + os.sep):
+                continue
+            if entry['type'] == 'dir':
+                os.makedirs(target, exist_ok=True)
+                directories.append((target, entry))
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.islink(target) or os.path.isfile(target):
+                os.remove(target)
+            if entry['type'] == 'symlink':
+                os.symlink(entry['target'], target)
+                continue
+            files.append((target, entry))
+        # Fragmenty kolejnych plików pobierane są partiami ponad granicami
+        # plików - małe pliki nie czekają na odczyt jeden po drugim
+        chunks = self.read_chunks([chunk_id for target, entry in files for chunk_id in entry['chunks']])
+        for target, entry in files:
+            with open(target, 'wb') as f:
+                for _ in entry['chunks']:
+                    f.write(next(chunks))
+            os.chmod(target, entry['mode'])
+            os.utime(target, (entry['mtime'], entry['mtime']))
+        # Atrybuty katalogów ustawiane po zapisaniu ich zawartości
+        for target, entry in reversed(directories):
+            os.chmod(target, entry['mode'])
+            os.utime(target, (entry['mtime'], entry['mtime']))
+
+    def gc(self, expired, dry_run=False):
+        # Usuwa wskazane migawki, a potem fragmenty, na które nie wskazuje
+        # żadna z pozostałych migawek repozytorium (wszystkich zadań).
+        # Wykonywane pod blokadą wyłączną - nie w trakcie cudzej kopii;
+        # dry_run (pod blokadą współdzieloną) tylko liczy, co zostałoby usunięte.
+        # Zwraca usunięte migawki, liczbę fragmentów i odzyskane bajty.
+        with self.lock(exclusive=not dry_run):
+            snapshots = self.list_snapshots()
+            removed = [name for name in expired if name in snapshots]
+            snapshot_paths = [posixpath.join(SNAPSHOT_DIR, snapshot_name) for snapshot_name in removed]
+
+            references = Counter()
+            for snapshot_name in snapshots:
+                if snapshot_name not in removed:
+                    for entry in self.load_snapshot(snapshot_name)['entries']:
+                        references.update(entry.get('chunks', ()))
+
+            orphans = [posixpath.join(CHUNK_DIR, name) for name in self.storage.listdir(CHUNK_DIR)
+                       if name.endswith('.tmp') or references[name] == 0]
+            reclaimed = sum(self.storage.size_many(snapshot_paths + orphans))
+            if not dry_run:
+                self.storage.delete_many(snapshot_paths)
+                self.storage.delete_many(orphans)
+        return removed, len(orphans), reclaimed
+
+
+def format_dedup_stats(stats):
+    # Bez nowych danych (same powtórzone fragmenty) współczynnik jest nieskończony
+    if stats['bytes_stored']:
+        ratio = f"{stats['bytes_in'] / stats['bytes_stored']:.2f}x"
+    else:
+        ratio = '∞' if stats['bytes_in'] else 'n/d'
+    return (f"nowe fragmenty: {stats['new_chunks']}, powtórzone: {stats['duplicate_chunks']}, "
+            f"zapisano {stats['bytes_stored'] / (1024 * 1024):.1f} MB, deduplikacja {ratio}")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from streaming import BoundedPipe
+
+TARGET_TYPES = ('local', 'ftp', 'ssh')
+SETTINGS_SECTIONS = ('ftp_settings', 'ssh_settings', 'backup_settings')
+DEFAULT_BUFFER_MB = 16
+DEFAULT_LAG_SECONDS = 30
+STALL_CHECK_SECONDS = 0.1
+STATUS_LABELS = {
+    'ok': 'OK',
+    'replicated': 'OK (dogoniona)',
+    'pending': 'oczekuje na replikację',
+    'error': 'BŁĄD',
+    'dropped': 'pominięta'
+}
+
+_pending_lock = threading.Lock()
+
+
+class LagExceeded(TimeoutError):
+    pass
+
+
+def target_configs(config):
+    # Konfiguracje miejsc docelowych trybu fanout: ustawienia globalne
+    # nadpisane polami celu; prefiks kopii (job_name) pozostaje wspólny
+    locations = config['backup_locations']
+    targets = locations.get('targets', [])
+    if not targets:
+        raise ValueError('Tryb fanout wymaga listy miejsc docelowych backup_locations.targets')
+    seen = set()
+    result = []
+    for target in targets:
+        name = target.get('name')
+        backup_type = target.get('type', 'local')
+        if not name:
+            raise ValueError('Każde miejsce docelowe na liście targets musi mieć nazwę')
+        if name in seen:
+            raise ValueError(f'Powtórzona nazwa miejsca docelowego: {name}')
+        if backup_type not in TARGET_TYPES:
+            raise ValueError(f'Nieobsługiwany typ miejsca docelowego {name}: {backup_type}')
+        if backup_type == 'local' and not target.get('destination'):
+            raise ValueError(f'Lokalne miejsce docelowe {name} wymaga ścieżki destination')
+        seen.add(name)
+        merged = copy.deepcopy(config)
+        merged['backup_locations'] = {
+            'source': locations.get('source', ''),
+            'destination': target.get('destination', ''),
+            'type': backup_type
+        }
+        for section in SETTINGS_SECTIONS:
+            merged.setdefault(section, {}).update(target.get(section, {}))
+        if 'max_backups' in target:
+            merged['backup_settings']['max_backups'] = target['max_backups']
+        if 'retention' in target:
+            merged['backup_settings']['retention'] = target['retention']
+        result.append((name, merged))
+    return result
+
+
+def replica_config(config, name=None):
+    # Konfiguracja jednego miejsca docelowego do przywracania, listowania i
+    # weryfikacji; domyślnie pierwszego z listy targets
+    targets = target_configs(config)
+    if name is None:
+        return targets[0][1]
+    for target_name, target_config in targets:
+        if target_name == name:
+            return target_config
+    raise ValueError(f'Nieznane miejsce docelowe: {name}')
+
+
+class Branch:
+    # Gałąź strumienia dla jednego miejsca docelowego z własnym buforem;
+    # stalled to czas, przez który ta gałąź bez przerwy wstrzymywała
+    # producenta, podczas gdy inna czekała z pustym buforem na dane
+    def __init__(self, capacity):
+        self.pipe = BoundedPipe(capacity)
+        self.error = None
+        self.stalled = 0.0
+
+
+class FanoutWriter:
+    # Plik tylko do zapisu powielający dane do wszystkich aktywnych gałęzi.
+    # Pełny bufor gałęzi wstrzymuje producenta. Gałąź odłączana jest dopiero
+    # wtedy, gdy przez lag_seconds bez przerwy zatrzymuje producenta, a inna
+    # w tym czasie nie ma danych do wysłania - czyli zostaje w tyle za
+    # najszybszą. Równo wolne miejsca (typowe ograniczenie przez sieć) tylko
+    # spowalniają producenta; ostatniej aktywnej gałęzi nie odłącza się nigdy.
+    def __init__(self, branches, lag_seconds=0):
+        self.branches = branches
+        self.lag = lag_seconds
+
+    def active(self):
+        return [branch for branch in self.branches if branch.error is None]
+
+    def starving(self, branch):
+        # Inna aktywna gałąź wysłała już wszystko i czeka na producenta
+        return any(other.pipe.pending() == 0 for other in self.active() if other is not branch)
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        for branch in self.active():
+            try:
+                self.write_branch(branch, data)
+            except BrokenPipeError:
+                # Wysyłanie do tego miejsca przerwane - błąd zapisał już jego wątek
+                pass
+        if not self.active():
+            raise BrokenPipeError('Żadne miejsce docelowe nie odbiera kopii')
+        return len(data)
+
+    def write_branch(self, branch, data):
+        if not self.lag:
+            branch.pipe.write(data)
+            return
+        position = 0
+        blocked = False
+        while position < len(data) and branch.error is None:
+            if len(self.active()) == 1:
+                branch.pipe.write(data[position:])
+                return
+            full = branch.pipe.pending() >= branch.pipe.capacity
+            started = time.monotonic()
+            position += branch.pipe.write_some(data[position:], STALL_CHECK_SECONDS)
+            if not full:
+                continue
+            blocked = True
+            if not self.starving(branch):
+                branch.stalled = 0.0
+                continue
+            branch.stalled += time.monotonic() - started
+            if branch.stalled >= self.lag:
+                self.detach(branch)
+        if not blocked:
+            branch.stalled = 0.0
+
+    def detach(self, branch):
+        error = LagExceeded(f'odłączono - miejsce docelowe nie nadążało (opóźnienie ponad {self.lag} s)')
+        branch.error = error
+        branch.pipe.fail(error)
+
+    def flush(self):
+        pass
+
+
+def tee(produce, targets, upload, capacity, lag_seconds=0):
+    # produce(plik) wykonywane raz, a upload(cel, czytnik) dla każdego celu w
+    # osobnym wątku; zwraca błędy (None - sukces) w kolejności celów.
+    # Błąd producenta przerywa wszystkie gałęzie i jest zgłaszany dalej.
+    branches = [Branch(capacity) for target in targets]
+
+    def consume(target, branch):
+        try:
+            upload(target, branch.pipe)
+        except BaseException as e:
+            if branch.error is None:
+                branch.error = e
+            branch.pipe.abort()
+
+    threads = [threading.Thread(target=consume, args=(target, branch), name='backup-fanout', daemon=True)
+               for target, branch in zip(targets, branches)]
+    for thread in threads:
+        thread.start()
+    writer = FanoutWriter(branches, lag_seconds)
+    try:
+        produce(writer)
+    except BaseException as e:
+        # Gdy odpadły wszystkie gałęzie, wynikiem są ich własne błędy
+        lost = not writer.active()
+        for branch in branches:
+            branch.pipe.fail(e)
+        for thread in threads:
+            thread.join()
+        if not lost:
+            raise
+        return [branch.error for branch in branches]
+    for branch in branches:
+        branch.pipe.close()
+    for thread in threads:
+        thread.join()
+    return [branch.error for branch in branches]
+
+
+class PendingReplicas:
+    # Kopie, które nie trafiły do części miejsc docelowych, wraz z miejscem,
+    # z którego można je dogonić; osobny plik stanu dla każdego zadania
+    def __init__(self, state_dir, job_name=None):
+        name = f'fanout_pending_{job_name}.json' if job_name else 'fanout_pending.json'
+        self.path = os.path.join(state_dir, name)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def save(self, entries):
+        if not entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, backup_name, kind, target, source):
+        with _pending_lock:
+            entries = [e for e in self.load() if (e['name'], e['target']) != (backup_name, target)]
+            entries.append({
+                'name': backup_name,
+                'kind': kind,
+                'target': target,
+                'source': source,
+                'added': datetime.now().isoformat(timespec='seconds')
+            })
+            self.save(entries)
+
+    def remove(self, backup_name, target):
+        with _pending_lock:
+            self.save([e for e in self.load() if (e['name'], e['target']) != (backup_name, target)])
+
+
+def format_replication(results):
+    return '\n'.join(f'{name} -> {target}: {STATUS_LABELS[status]} - {message}'
+                     for name, target, status, message in results)
+
+
+def fanout_result(statuses, title, suffix=''):
+    # Wynik (sukces, komunikat) z wierszem dla każdego miejsca docelowego;
+    # sukces tylko wtedy, gdy kopia jest we wszystkich
+    done = sum(1 for name, status, message in statuses if status in ('ok', 'replicated'))
+    lines = [f'{title}: miejsca docelowe {done}/{len(statuses)}{suffix}']
+    lines += [f'  {name}: {STATUS_LABELS[status]} - {message}' for name, status, message in statuses]
+    return done == len(statuses), '\n'.join(lines)
@@ -1,29 +1,889 @@
 #!/usr/bin/env python3
+import hashlib
+import io
+import json
 import os
 import shutil
+import time
 from datetime import datetime
-from ftplib import FTP
-import paramiko
 import tarfile
+import tempfile
+from ftplib import error_perm
+from catalog import CatalogStore, matches_prefix
+from dedup import Chunker, DedupRepository, format_dedup_stats, is_snapshot_name
+from fanout import (DEFAULT_BUFFER_MB, DEFAULT_LAG_SECONDS, PendingReplicas, fanout_result, target_configs,
+                    tee)
+from file_index import MANIFEST_NAME, FileIndex, plan_backup
+from integrity import ChecksumMismatch, HashingReader, RateLimiter, check_digest, format_verify_summary
+from mirror import MIRROR_SUFFIX, format_mirror_stats, is_mirror_name, mirror_size, mirror_tree, restore_mirror
+from metrics import REPORT_DIR, CountingReader, RunMetrics, write_prometheus, write_report
+from member_index import MemberIndex, extract_selected, index_name, match_member, read_parts
+from parallel_transfer import ParallelTransfer, find_volumes, format_transfer_stats, group_volumes
+from resumable import BLOCK_SIZE, ResumableTransfer
+from retention import expired_backups, format_reclaimed, retention_policy
+from scanner import DEFAULT_PREFETCH_SIZE, add_tree, prefetch, tree_scanner
+from storage import FTPStorage, LocalStorage, SFTPStorage, open_storage
+from transport import default_pool
+from compression import (ParallelCompressor, archive_extension, codec_from_name, format_stats,
+                         is_archive_name, open_decompressor, resolve_codec)
+from streaming import DEFAULT_BUFFER_SIZE, producer_stream
+from throttle import ThrottledReader
 
 class FileHandler:
-    def __init__(self, config):
+    def __init__(self, config, pool=None, progress=None):
         self.config = config
+        self.pool = pool or default_pool
+        self.progress = progress
+        self.last_compression = None
+        self.last_transfer = None
+        self.last_index = None
+        self.metrics = RunMetrics(config.get('job_name') or 'files', 'files', progress)
+        self.pool_before = None
+
+    def connection_metrics(self):
+        # Liczba połączeń, ponowne użycia i czas nawiązywania sesji
+        return self.pool.metrics()
+
+    def start_metrics(self, kind):
+        # Nowy pomiar na początku każdej kopii (pliki lub baza danych)
+        self.metrics = RunMetrics(self.config.get('job_name') or kind, kind, self.progress)
+        self.pool_before = self.pool.metrics()
+
+    def finish_metrics(self, result):
+        # Raport JSON i plik tekstowy Prometheusa po zakończeniu kopii;
+        # zwraca niezmieniony wynik (sukces, komunikat)
+        success, message = result
+        if self.pool_before is not None:
+            self.metrics.add_connections(self.pool_before, self.pool.metrics())
+        self.metrics.finish(success, message)
+        settings = self.config['backup_settings']
+        report_dir = settings.get('report_dir') or os.path.join(self.state_dir(), REPORT_DIR)
+        try:
+            write_report(self.metrics, report_dir)
+            if settings.get('prometheus_textfile'):
+                write_prometheus(report_dir, settings['prometheus_textfile'])
+        except Exception as e:
+            print(f'Błąd podczas zapisywania raportu z kopii zapasowej: {str(e)}')
+        return result
+
+    def backup_prefix(self):
+        # Kopie zadania z listy jobs mają własny prefiks, więc zadania
+        # dzielące miejsce docelowe nie mieszają list ani limitów kopii
+        job_name = self.config.get('job_name')
+        return f'backup_{job_name}_' if job_name else 'backup_'
 
     def create_backup_name(self, backup_type):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return f'backup_{backup_type}_{timestamp}'
+        return f'{self.backup_prefix()}{backup_type}_{timestamp}'
+
+    def backup_name_for(self, backup_type, plan=None):
+        backup_name = self.create_backup_name(backup_type)
+        if plan is not None and plan.is_incremental:
+            backup_name += '_inc'
+        return backup_name
+
+    def state_dir(self):
+        return self.config['backup_settings'].get('state_dir', '.backup_state')
+
+    def index_path(self, backup_type, source_path, destination_path=None, prefix='.backup_index'):
+        # Indeks kopii lokalnych leży obok kopii, zdalnych - w katalogu stanu.
+        # Klucz obejmuje zadanie i miejsce docelowe, więc zadania z tym samym
+        # źródłem (np. na różne serwery) nie nadpisują sobie indeksu.
+        from jobs import destination_key
+        key = repr((self.config.get('job_name'), os.path.abspath(source_path),
+                    destination_key(self.config, 'files'), self.config['backup_locations'].get('destination', '')))
+        source_key = hashlib.sha1(key.encode()).hexdigest()[:12]
+        index_name = f'{prefix}_{backup_type}_{source_key}.db'
+        if destination_path:
+            return os.path.join(destination_path, index_name)
+        return os.path.join(self.state_dir(), index_name)
+
+    def plan_backup(self, backup_type, source_path, destination_path=None):
+        settings = self.config['backup_settings']
+        if not settings.get('incremental', False):
+            return None
+        index_path = self.index_path(backup_type, source_path, destination_path)
+        with self.metrics.phase('plan'):
+            return plan_backup(index_path, source_path, settings)
+
+    def use_streaming(self):
+        # Przesyłanie wielostrumieniowe i wznawianie wymagają gotowego archiwum
+        settings = self.config['backup_settings']
+        return (settings.get('streaming', False) and settings.get('transfer_streams', 1) <= 1
+                and not self.use_resumable())
+
+    def use_resumable(self):
+        return self.config['backup_settings'].get('resumable', False)
+
+    def use_async_transport(self):
+        # Silnik asyncio bez wznawiania - przerwany transfer zaczyna się od nowa
+        settings = self.config['backup_settings']
+        return settings.get('transport_engine', 'sync') == 'async' and not self.use_resumable()
+
+    def resumable_transfer(self, backup_type):
+        settings = self.config['backup_settings']
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        return ResumableTransfer(
+            self.pool, backup_type, self.config[settings_key], self.state_dir(),
+            retries=settings.get('transfer_retries', 3),
+            backoff=settings.get('retry_backoff', 5)
+        )
+
+    def resume_pending_uploads(self, backup_type):
+        # Dokończ wysyłanie archiwów przerwanych w poprzednich uruchomieniach
+        # wraz z tym, co następuje po udanym wysłaniu: indeksem członów,
+        # wpisem w katalogu (z sumą kontrolną), indeksem stanu plików i retencją
+        if not self.use_resumable():
+            return
+        transfer = self.resumable_transfer(backup_type)
+        completed = 0
+        for state in transfer.pending_uploads():
+            remote_name = state['remote_name']
+            if not os.path.exists(state['local_path']):
+                transfer.checkpoint(remote_name, 'upload').remove()
+                self.discard_pending_backup(state.get('backup'))
+                continue
+            try:
+                transfer.upload(state['local_path'], remote_name)
+                self.complete_pending_backup(backup_type, remote_name, state.get('backup'))
+                os.remove(state['local_path'])
+                completed += 1
+                print(f'Dokończono przerwane wysyłanie kopii {remote_name}')
+            except Exception as e:
+                print(f'Nie udało się wznowić wysyłania kopii {remote_name}: {str(e)}')
+        if completed:
+            self.cleanup_old_backups(None, backup_type)
+
+    def pending_backup(self, archive_name, backup_name, plan):
+        # Zapisywane w punkcie kontrolnym wysyłania: poziom i rodzic kopii,
+        # statystyki kompresji z SHA-256 oraz ścieżki indeksów odłożonych w
+        # katalogu stanu do chwili, gdy archiwum dotrze na serwer
+        if not self.use_resumable():
+            return None
+        base = os.path.join(self.state_dir(), f'pending_{archive_name}')
+        backup = {
+            'name': backup_name,
+            'level': plan.kind if plan is not None else 'full',
+            'parent': plan.meta.get('last_backup') if plan is not None and plan.is_incremental else None,
+            'stats': self.last_compression,
+            'index_path': None,
+            'staged_index': None,
+            'index_base': None,
+            'member_index': None
+        }
+        os.makedirs(self.state_dir(), exist_ok=True)
+        if plan is not None:
+            backup['index_path'] = plan.index.path
+            backup['staged_index'] = f'{base}.db'
+            backup['index_base'] = plan.meta.get('last_backup')
+            plan.stage(backup_name, backup['staged_index'])
+        if self.last_index is not None:
+            backup['member_index'] = f'{base}.members'
+            with open(backup['member_index'], 'wb') as f:
+                f.write(self.last_index.to_bytes())
+        return backup
+
+    def complete_pending_backup(self, backup_type, archive_name, backup):
+        if not backup:
+            return
+        if backup['member_index'] and os.path.exists(backup['member_index']):
+            with open(backup['member_index'], 'rb') as f:
+                self.store_member_index(backup_type, archive_name, data=f.read())
+        self.record_backup(backup_type, archive_name, level=backup['level'], stats=backup['stats'] or {},
+                           parent=backup['parent'])
+        staged = backup['staged_index']
+        if staged and os.path.exists(staged):
+            # Indeks podmieniany tylko, gdy od przerwanej kopii nie zapisano
+            # nowszego - inaczej następna kopia liczy zmiany od tamtej
+            entries, meta = FileIndex(backup['index_path']).load()
+            if meta.get('last_backup') == backup['index_base']:
+                os.replace(staged, backup['index_path'])
+        self.discard_pending_backup(backup)
+
+    def discard_pending_backup(self, backup):
+        if not backup:
+            return
+        for path in (backup['staged_index'], backup['member_index']):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def discard_transfer(self, backup_type, local_path, direction):
+        # Bez trybu wznawiania pozostałości przerwanego transferu są usuwane
+        if not local_path or self.use_resumable():
+            return
+        for path in (local_path, f'{local_path}.part'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.resumable_transfer(backup_type).checkpoint(os.path.basename(local_path), direction).remove()
+
+    def parallel_transfer(self, backup_type, size=None):
+        # Rozmiar None oznacza archiwum w woluminach - zawsze pobierane równolegle
+        settings = self.config['backup_settings']
+        streams = settings.get('transfer_streams', 1)
+        threshold = settings.get('parallel_threshold_mb', 64) * 1024 * 1024
+        if size is not None and (streams <= 1 or size < threshold):
+            return None
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        return ParallelTransfer(self.pool, backup_type, self.config[settings_key], streams,
+                                settings.get('transfer_retries', 3), settings.get('retry_backoff', 5))
+
+    def upload_archive(self, backup_type, archive_path, backup=None):
+        self.last_transfer = None
+        remote_name = os.path.basename(archive_path)
+        size = os.path.getsize(archive_path)
+        transfer = self.parallel_transfer(backup_type, size)
+        with self.metrics.phase('upload'):
+            if transfer is not None:
+                checksum = (self.last_compression or {}).get('sha256')
+                self.last_transfer = transfer.upload(archive_path, remote_name, checksum)
+            elif self.use_async_transport():
+                with self.open_destination(backup_type) as storage:
+                    storage.upload_file(archive_path, remote_name)
+            else:
+                self.resumable_transfer(backup_type).upload(archive_path, remote_name, backup)
+        self.metrics.add('bytes_sent', size)
+
+    def download_archive(self, backup_type, backup_name, local_path, checksum=None):
+        self.last_transfer = None
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        volumes = []
+        with self.pool.connection(backup_type, self.config[settings_key]) as connection:
+            if backup_type == 'ftp':
+                connection.ftp.voidcmd('TYPE I')
+                try:
+                    size = connection.ftp.size(backup_name)
+                except error_perm:
+                    # Archiwum wysłane w woluminach składane jest przy pobieraniu
+                    volumes = find_volumes(connection.ftp.nlst(), backup_name)
+                    if not volumes:
+                        raise
+                    size = None
+            else:
+                size = connection.sftp.stat(backup_name).st_size
+        transfer = self.parallel_transfer(backup_type, size)
+        if transfer is None and self.use_async_transport():
+            with self.open_destination(backup_type) as storage:
+                storage.download_file(backup_name, local_path)
+        elif transfer is None:
+            self.resumable_transfer(backup_type).download(backup_name, local_path)
+        else:
+            self.last_transfer = transfer.download(backup_name, local_path, volumes, checksum)
 
-    def compress_directory(self, source_path, backup_name):
-        archive_path = f'{backup_name}.tar.gz'
-        with tarfile.open(archive_path, 'w:gz') as tar:
-            tar.add(source_path, arcname=os.path.basename(source_path))
+    def stream_buffer_size(self):
+        buffer_mb = self.config['backup_settings'].get('stream_buffer_mb')
+        return int(buffer_mb * 1024 * 1024) if buffer_mb else DEFAULT_BUFFER_SIZE
+
+    def download_ftp_stream(self, connection, backup_name, write):
+        connection.ftp.voidcmd('TYPE I')
+        try:
+            connection.ftp.size(backup_name)
+            names = [backup_name]
+        except error_perm:
+            names = find_volumes(connection.ftp.nlst(), backup_name)
+            if not names:
+                raise
+        for name in names:
+            connection.ftp.retrbinary(f'RETR {name}', write, BLOCK_SIZE)
+
+    def download_sftp_stream(self, connection, backup_name, write):
+        # readv w oknach wielkości bufora: wiele żądań w locie przy
+        # ograniczonym zużyciu pamięci (prefetch buforowałby cały plik)
+        window = max(self.stream_buffer_size() // BLOCK_SIZE, 1) * BLOCK_SIZE
+        with connection.sftp.open(backup_name, 'rb') as remote_file:
+            size = remote_file.stat().st_size
+            for offset in range(0, size, window):
+                end = min(offset + window, size)
+                chunks = [(position, min(BLOCK_SIZE, end - position)) for position in range(offset, end, BLOCK_SIZE)]
+                for data in remote_file.readv(chunks):
+                    write(data)
+
+    def download_stream(self, backup_type, backup_name, received):
+        # Archiwum pobierane w tle i rozpakowywane w trakcie pobierania
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        download = self.download_ftp_stream if backup_type == 'ftp' else self.download_sftp_stream
+
+        def produce(pipe):
+            def write(data):
+                received[0] += len(data)
+                pipe.write(data)
+            with self.pool.connection(backup_type, self.config[settings_key]) as connection:
+                download(connection, backup_name, write)
+
+        return producer_stream(produce, self.stream_buffer_size())
+
+    def read_backup(self, backup_type, backup_name, write, destination_path=None):
+        # Odczyt całej kopii (także w woluminach) blokami, w stałej pamięci
+        if backup_type == 'local':
+            backup_dir = destination_path or self.config['backup_locations']['destination']
+            with open(os.path.join(backup_dir, backup_name), 'rb') as f:
+                for data in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    write(data)
+            return
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        download = self.download_ftp_stream if backup_type == 'ftp' else self.download_sftp_stream
+        with self.pool.connection(backup_type, self.config[settings_key]) as connection:
+            download(connection, backup_name, write)
+
+    def verify_backups(self, backup_type, names=None, bandwidth_kbps=None):
+        # Ponowne pobranie kopii i porównanie SHA-256 z katalogiem, z
+        # ograniczeniem przepustowości, aby nie zająć łącza serwera
+        if bandwidth_kbps is None:
+            bandwidth_kbps = self.config['backup_settings'].get('verify_bandwidth_kbps', 0)
+        limiter = RateLimiter(bandwidth_kbps * 1024)
+        try:
+            with self.open_destination(backup_type) as storage:
+                catalog = self.catalog_store(backup_type).load(storage)
+        except Exception as e:
+            return False, f'Błąd podczas odczytu katalogu kopii zapasowych: {str(e)}'
+        if catalog is None:
+            return False, 'Brak katalogu kopii zapasowych - sumy kontrolne są nieznane'
+        if not names:
+            names = catalog.names(self.backup_prefix())
+
+        results = []
+        for backup_name in names:
+            entry = catalog.entries.get(backup_name) or {}
+            if not entry.get('sha256'):
+                results.append((backup_name, 'unknown', 'brak sumy kontrolnej'))
+            else:
+                results.append(self.verify_backup(backup_type, backup_name, entry['sha256'], limiter))
+            print(f'{backup_name}: {results[-1][2]}')
+        success = not any(status in ('corrupt', 'error') for name, status, message in results)
+        return success, format_verify_summary(results)
+
+    def verify_backup(self, backup_type, backup_name, checksum, limiter):
+        digest = hashlib.sha256()
+
+        def write(data):
+            digest.update(data)
+            limiter.consume(len(data))
+
+        try:
+            self.read_backup(backup_type, backup_name, write)
+            check_digest(backup_name, checksum, digest.hexdigest())
+            return backup_name, 'ok', 'suma kontrolna poprawna'
+        except ChecksumMismatch as e:
+            return backup_name, 'corrupt', str(e)
+        except Exception as e:
+            return backup_name, 'error', f'błąd odczytu: {str(e)}'
+
+    def use_dedup(self):
+        return self.config['backup_settings'].get('repository_format', 'archive') == 'dedup'
+
+    def open_repository(self, backup_type, destination_path=None):
+        settings = self.config['backup_settings']
+        repository_dir = settings.get('repository_dir', 'backup_repo')
+        if backup_type == 'local' and destination_path:
+            storage = LocalStorage(os.path.join(destination_path, repository_dir))
+            lock_storage = None
+        else:
+            storage = open_storage(self.config, backup_type, repository_dir, self.pool)
+            lock_storage = lambda: open_storage(self.config, backup_type, repository_dir, self.pool)
+        chunker = Chunker(settings.get('chunk_size_kb', 1024) * 1024)
+        return DedupRepository(storage, chunker, lock_storage=lock_storage)
+
+    def backup_dedup(self, backup_type, source_path, destination_path=None):
+        try:
+            with self.open_repository(backup_type, destination_path) as repository:
+                # Wysyłane są tylko fragmenty, których repozytorium jeszcze nie ma
+                backup_name = self.create_backup_name(backup_type)
+                scanner = tree_scanner(source_path, self.config['backup_settings'])
+                # Pliki niezmienione od poprzedniej kopii nie są ponownie dzielone
+                index = FileIndex(self.index_path(backup_type, source_path, destination_path, '.dedup_index'))
+                with self.metrics.phase('archive'):
+                    snapshot_name, stats = repository.backup(source_path, backup_name, scanner, index)
+                self.metrics.add('bytes_in', stats['bytes_in'])
+                self.metrics.add('bytes_out', stats['bytes_stored'])
+                self.metrics.add('bytes_sent', stats['bytes_stored'])
+            return True, f'Kopia zapasowa {snapshot_name} została utworzona pomyślnie ({format_dedup_stats(stats)})'
+        except Exception as e:
+            return False, f'Błąd podczas tworzenia kopii zapasowej: {str(e)}'
+
+    def restore_dedup(self, backup_type, snapshot_name, destination_path, repository_root=None, patterns=None):
+        try:
+            with self.open_repository(backup_type, repository_root) as repository:
+                repository.restore(snapshot_name, destination_path, patterns)
+            return True, 'Kopia zapasowa została przywrócona pomyślnie'
+        except Exception as e:
+            return False, f'Błąd podczas przywracania kopii zapasowej: {str(e)}'
+
+    def compression_codec(self):
+        return resolve_codec(self.config['backup_settings'].get('compress', True))
+
+    def archive_name(self, backup_name):
+        return backup_name + archive_extension(self.compression_codec())
+
+    def open_compressor(self, fileobj):
+        settings = self.config['backup_settings']
+        return ParallelCompressor(
+            fileobj,
+            codec=self.compression_codec(),
+            workers=settings.get('compression_workers', 0),
+            level=settings.get('compression_level')
+        )
+
+    def compression_summary(self):
+        summary = []
+        if self.last_compression:
+            summary.append(format_stats(self.last_compression))
+        if self.last_transfer:
+            summary.append(format_transfer_stats(self.last_transfer))
+        return f" ({'; '.join(summary)})" if summary else ''
+
+    def transfer_summary(self):
+        if not self.last_transfer:
+            return ''
+        return f' ({format_transfer_stats(self.last_transfer)})'
+
+    def add_manifest(self, tar, manifest):
+        data = json.dumps(manifest, indent=1).encode()
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        info.mtime = int(datetime.now().timestamp())
+        tar.addfile(info, io.BytesIO(data))
+
+    def add_members(self, tar, source_path, members, member_filter=None):
+        root = os.path.basename(source_path)
+        for rel_path in members:
+            self.metrics.tick()
+            path = os.path.join(source_path, rel_path)
+            try:
+                info = tar.gettarinfo(path, arcname=os.path.join(root, rel_path))
+                fileobj = open(path, 'rb') if info is not None and info.isreg() else None
+            except FileNotFoundError:
+                # Plik usunięty między skanowaniem a archiwizacją
+                continue
+            if info is None:
+                continue
+            try:
+                if member_filter is not None:
+                    info = member_filter(info)
+                if info is not None:
+                    # Jak tar.add(recursive=False), z limitem odczytu źródła
+                    tar.addfile(info, ThrottledReader(fileobj, 'read_kbps') if fileobj is not None else None)
+                    if info.isreg():
+                        self.metrics.add('files', 1)
+                        self.metrics.add('bytes_read', info.size)
+            finally:
+                if fileobj is not None:
+                    fileobj.close()
+
+    def add_tree(self, tar, source_path, member_filter=None):
+        # Równoległe skanowanie drzewa i odczyt małych plików z wyprzedzeniem,
+        # aby kompresor nie czekał na operacje na metadanych
+        settings = self.config['backup_settings']
+        scanner = tree_scanner(source_path, settings)
+        prefetch_mb = settings.get('prefetch_mb')
+        items = prefetch(scanner.walk(), scanner.workers,
+                         int(prefetch_mb * 1024 * 1024) if prefetch_mb else DEFAULT_PREFETCH_SIZE)
+        items = self.metrics.count_items(items)
+        add_tree(tar, source_path, os.path.basename(source_path), items, member_filter,
+                 settings.get('sparse_files', True))
+
+    def write_archive(self, source_path, fileobj, plan=None):
+        # Tryb strumieniowy 'w|' nie wymaga przewijania pliku docelowego,
+        # a kompresją zajmuje się równoległy kompresor blokowy
+        compressor = self.open_compressor(fileobj)
+        index = MemberIndex() if self.use_member_index() else None
+        self.last_index = None
+        manifest = None
+        with self.metrics.phase('archive'):
+            try:
+                with tarfile.open(fileobj=compressor, mode='w|') as tar:
+                    member_filter = None
+                    if index is not None:
+                        member_filter = lambda tarinfo: index.record(tarinfo, tar.offset)
+                    if plan is not None:
+                        # Manifest na początku, aby przywracanie strumieniowe znało go od razu
+                        manifest = plan.manifest(os.path.basename(source_path))
+                        self.add_manifest(tar, manifest)
+                    if plan is not None and plan.is_incremental:
+                        self.add_members(tar, source_path, plan.members, member_filter)
+                    else:
+                        self.add_tree(tar, source_path, member_filter)
+                    end = tar.offset
+                compressor.close()
+            except BaseException:
+                compressor.abort()
+                raise
+        self.last_compression = compressor.stats()
+        self.metrics.add_compression(self.last_compression)
+        if index is not None:
+            index.finish(end, compressor, manifest)
+            self.last_index = index
+
+    def use_member_index(self):
+        return self.config['backup_settings'].get('member_index', False)
+
+    def store_member_index(self, backup_type, archive_name, destination_path=None, data=None):
+        # Indeks członów zapisywany obok archiwum; jego brak oznacza jedynie
+        # wolniejsze przywracanie pojedynczych plików
+        if data is None:
+            if self.last_index is None:
+                return
+            data = self.last_index.to_bytes()
+        try:
+            with self.metrics.phase('catalog'), self.open_destination(backup_type, destination_path) as storage:
+                storage.write_bytes(index_name(archive_name), data)
+        except Exception as e:
+            print(f'Błąd podczas zapisywania indeksu kopii zapasowej: {str(e)}')
+
+    def open_destination(self, backup_type, destination_path=None):
+        if backup_type == 'local':
+            return LocalStorage(destination_path or self.config['backup_locations']['destination'])
+        return open_storage(self.config, backup_type, pool=self.pool)
+
+    def catalog_store(self, backup_type, destination_path=None):
+        # Kopia katalogu w katalogu stanu, osobna dla każdego miejsca docelowego
+        if backup_type == 'local':
+            key = 'local:' + os.path.abspath(destination_path or self.config['backup_locations']['destination'])
+        else:
+            settings = self.config['ftp_settings' if backup_type == 'ftp' else 'ssh_settings']
+            key = f"{backup_type}://{settings.get('username', '')}@{settings.get('host', '')}:{settings.get('port', '')}"
+        return CatalogStore(self.state_dir(), key)
+
+    def update_catalog(self, backup_type, change, destination_path=None):
+        # Błąd katalogu nie przerywa kopii - listowanie wróci wtedy do
+        # przeglądania katalogu w miejscu docelowym
+        try:
+            with self.metrics.phase('catalog'), self.open_destination(backup_type, destination_path) as storage:
+                self.catalog_store(backup_type, destination_path).update(storage, change)
+        except Exception as e:
+            print(f'Błąd podczas aktualizacji katalogu kopii zapasowych: {str(e)}')
+
+    def record_backup(self, backup_type, backup_name, destination_path=None, plan=None,
+                      kind='files', level='full', stats=None, parent=None):
+        if stats is None:
+            stats = self.last_compression or {}
+        if plan is not None:
+            parent = plan.meta.get('last_backup') if plan.is_incremental else None
+        entry = {
+            'name': backup_name,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'size': stats.get('bytes_out'),
+            'sha256': stats.get('sha256'),
+            'job': self.config.get('job_name'),
+            'kind': kind,
+            'level': plan.kind if plan is not None else level,
+            'parent': parent
+        }
+
+        def change(catalog):
+            if parent:
+                entry['parent'] = catalog.find(parent) or parent
+            catalog.add(entry)
+
+        self.update_catalog(backup_type, change, destination_path)
+
+    def uncatalog_backups(self, backup_type, names, destination_path=None):
+        def change(catalog):
+            for name in names:
+                catalog.remove(name)
+
+        if names:
+            self.update_catalog(backup_type, change, destination_path)
+
+    def expected_checksum(self, backup_type, backup_name, destination_path=None):
+        # SHA-256 zapisany w katalogu przy tworzeniu kopii; None, gdy nieznany
+        try:
+            with self.open_destination(backup_type, destination_path) as storage:
+                catalog = self.catalog_store(backup_type, destination_path).load(storage)
+        except Exception:
+            return None
+        entry = catalog.entries.get(backup_name) if catalog is not None else None
+        return entry.get('sha256') if entry else None
+
+    def load_catalog(self, backup_type, kind, prefix, destination_path=None):
+        # Katalog używany, gdy uzupełniono go już o kopie danego rodzaju i
+        # prefiksu utworzone przed jego powstaniem
+        try:
+            with self.open_destination(backup_type, destination_path) as storage:
+                catalog = self.catalog_store(backup_type, destination_path).load(storage)
+        except Exception as e:
+            print(f'Błąd podczas odczytu katalogu kopii zapasowych: {str(e)}')
+            return None
+        if catalog is None or f'{kind}:{prefix}' not in catalog.seeded:
+            return None
+        return catalog
+
+    def seed_catalog(self, backup_type, names, kind, prefix, destination_path=None, replace=False):
+        # Uzupełnienie katalogu o kopie znalezione przez listowanie; replace
+        # usuwa wpisy danego rodzaju, których plików już nie ma
+        def change(catalog):
+            if replace:
+                for name in catalog.names(prefix, kind):
+                    if name not in names:
+                        catalog.remove(name)
+            for name in names:
+                if name not in catalog.entries:
+                    catalog.add({
+                        'name': name,
+                        'created': None,
+                        'size': None,
+                        'sha256': None,
+                        'job': None,
+                        'kind': kind,
+                        'level': 'incremental' if '_inc.' in name else 'full',
+                        'parent': None
+                    })
+            if f'{kind}:{prefix}' not in catalog.seeded:
+                catalog.seeded.append(f'{kind}:{prefix}')
+
+        self.update_catalog(backup_type, change, destination_path)
+
+    def compress_directory(self, source_path, backup_name, plan=None):
+        archive_path = self.archive_name(backup_name)
+        with open(archive_path, 'wb') as f:
+            self.write_archive(source_path, f, plan)
         return archive_path
 
+    def upload_stream(self, backup_type, remote_name, produce, destination_path=None):
+        # Dane zapisywane przez produce(plik) trafiają do miejsca docelowego
+        # w trakcie powstawania, bez pełnej kopii na dysku lokalnym
+        self.last_transfer = None
+        if backup_type == 'local':
+            os.makedirs(destination_path, exist_ok=True)
+            final_path = os.path.join(destination_path, remote_name)
+            tmp_path = final_path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    produce(f)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, final_path)
+            self.metrics.add('bytes_sent', os.path.getsize(final_path))
+            return
+
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        try:
+            with self.metrics.phase('upload'), self.pool.connection(backup_type, self.config[settings_key]) as connection:
+                with producer_stream(produce, self.stream_buffer_size()) as stream:
+                    self.send_stream(connection, backup_type, remote_name, stream)
+        except Exception:
+            self.remove_remote(backup_type, remote_name + '.tmp')
+            raise
+
+    def upload_reader(self, backup_type, remote_name, reader, destination_path=None):
+        # Jak upload_stream, ale dane czytane są z gotowego strumienia (gałęzi
+        # trybu fanout) - bez drugiego bufora, więc limit pamięci gałęzi obowiązuje
+        if backup_type == 'local':
+            self.upload_stream('local', remote_name, lambda f: shutil.copyfileobj(reader, f, BLOCK_SIZE),
+                               destination_path)
+            return
+        settings_key = 'ftp_settings' if backup_type == 'ftp' else 'ssh_settings'
+        try:
+            with self.metrics.phase('upload'), self.pool.connection(backup_type, self.config[settings_key]) as connection:
+                self.send_stream(connection, backup_type, remote_name, reader)
+        except Exception:
+            self.remove_remote(backup_type, remote_name + '.tmp')
+            raise
+
+    def send_stream(self, connection, backup_type, remote_name, stream):
+        # Archiwum trafia pod nazwę tymczasową i dostaje docelową dopiero po
+        # przesłaniu w całości - przerwana kopia nie wygląda na kompletną
+        stream = ThrottledReader(CountingReader(stream, self.metrics), 'upload_kbps')
+        tmp_name = remote_name + '.tmp'
+        if backup_type == 'ftp':
+            connection.ftp.storbinary(f'STOR {tmp_name}', stream)
+            FTPStorage(connection, pool=self.pool).rename(tmp_name, remote_name)
+        else:
+            with connection.sftp.open(tmp_name, 'wb') as remote_file:
+                remote_file.set_pipelined(True)
+                shutil.copyfileobj(stream, remote_file, 32768)
+            SFTPStorage(connection, pool=self.pool).rename(tmp_name, remote_name)
+
+    def backup(self, source_path, destination_path=None):
+        self.start_metrics('files')
+        backup_type = self.config['backup_locations']['type']
+        if backup_type == 'local':
+            result = self.backup_local(source_path, destination_path)
+        elif backup_type == 'ftp':
+            result = self.backup_ftp(source_path)
+        elif backup_type == 'ssh':
+            result = self.backup_ssh(source_path)
+        elif backup_type == 'fanout':
+            result = self.backup_fanout(source_path)
+        else:
+            result = False, f'Nieobsługiwany typ kopii zapasowej: {backup_type}'
+        return self.finish_metrics(result)
+
+    def use_fanout(self):
+        return self.config['backup_locations'].get('type') == 'fanout'
+
+    def target_handler(self, config):
+        # Obsługa jednego miejsca docelowego trybu fanout - wspólna pula
+        # połączeń i wspólne pomiary uruchomienia
+        handler = FileHandler(config, self.pool)
+        handler.metrics = self.metrics
+        return handler
+
+    def fanout_targets(self):
+        return [(name, self.target_handler(config)) for name, config in target_configs(self.config)]
+
+    def upload_fanout(self, remote_name, produce):
+        # Jeden strumień produce(plik) wysyłany równocześnie do wszystkich
+        # miejsc docelowych, każde z własnym ograniczonym buforem; zwraca
+        # [(nazwa, obsługa miejsca, błąd lub None)]
+        settings = self.config['backup_settings']
+        targets = self.fanout_targets()
+
+        def upload(target, reader):
+            handler = target[1]
+            locations = handler.config['backup_locations']
+            handler.upload_reader(locations['type'], remote_name, reader, locations['destination'])
+
+        capacity = int(settings.get('fanout_buffer_mb', DEFAULT_BUFFER_MB) * 1024 * 1024)
+        errors = tee(produce, targets, upload, capacity, settings.get('fanout_lag_seconds', DEFAULT_LAG_SECONDS))
+        return [(name, handler, error) for (name, handler), error in zip(targets, errors)]
+
+    def finish_fanout(self, results, remote_name, finalize, kind='files'):
+        # finalize(obsługa) kończy kopię w miejscach, do których dotarła
+        # (indeks, katalog, retencja); pozostałe trafiają do kolejki
+        # replikacji, doganianej od razu z pierwszego udanego miejsca
+        pending = PendingReplicas(self.state_dir(), self.config.get('job_name'))
+        sources = [name for name, handler, error in results if error is None]
+        statuses = []
+        for name, handler, error in results:
+            if error is None:
+                finalize(handler)
+                statuses.append([name, 'ok', 'kopia zapisana'])
+            elif sources:
+                pending.add(remote_name, kind, name, sources[0])
+                statuses.append([name, 'pending', str(error)])
+            else:
+                statuses.append([name, 'error', str(error)])
+        for backup_name, target, status, message in self.replicate_pending():
+            print(f'Replikacja {backup_name} -> {target}: {message}')
+            for entry in statuses:
+                if backup_name == remote_name and entry[0] == target:
+                    entry[1:] = [status, f'{entry[2]}; {message}']
+        return statuses
+
+    def replicate_pending(self):
+        # Doganianie kopii z kolejki replikacji trybu fanout; zwraca
+        # [(kopia, miejsce docelowe, status, komunikat)]
+        pending = PendingReplicas(self.state_dir(), self.config.get('job_name'))
+        entries = pending.load()
+        if not entries:
+            return []
+        targets = dict(self.fanout_targets())
+        results = []
+        for entry in entries:
+            source = targets.get(entry['source'])
+            target = targets.get(entry['target'])
+            if source is None or target is None:
+                pending.remove(entry['name'], entry['target'])
+                results.append((entry['name'], entry['target'], 'dropped', 'miejsca docelowego nie ma już w konfiguracji'))
+                continue
+            try:
+                if self.replicate_backup(source, target, entry['name'], entry.get('kind', 'files')):
+                    results.append((entry['name'], entry['target'], 'replicated', f"dogoniono z {entry['source']}"))
+                else:
+                    results.append((entry['name'], entry['target'], 'dropped',
+                                    f"kopii nie ma już w {entry['source']} (usunięta przez retencję)"))
+                pending.remove(entry['name'], entry['target'])
+            except Exception as e:
+                results.append((entry['name'], entry['target'], 'pending', f'replikacja nieudana: {str(e)}'))
+        return results
+
+    def replicate_backup(self, source, target, backup_name, kind='files'):
+        # Kopia przesyłana strumieniowo z miejsca, w którym jest, z kontrolą
+        # SHA-256 z katalogu; razem z nią indeks członów i wpis w katalogu.
+        # False, gdy kopii nie ma już w miejscu źródłowym.
+        origin = source.config['backup_locations']
+        destination = target.config['backup_locations']
+        with source.open_destination(origin['type'], origin['destination']) as storage:
+            names = storage.listdir()
+            if backup_name not in names and not find_volumes(names, backup_name):
+                return False
+            catalog = source.catalog_store(origin['type'], origin['destination']).load(storage)
+            index = storage.read_bytes(index_name(backup_name)) if index_name(backup_name) in names else None
+        entry = catalog.entries.get(backup_name) if catalog is not None else None
+        digest = hashlib.sha256()
+
+        def produce(f):
+            def write(data):
+                digest.update(data)
+                f.write(data)
+            source.read_backup(origin['type'], backup_name, write, origin['destination'])
+            check_digest(backup_name, entry.get('sha256') if entry else None, digest.hexdigest())
+
+        with self.metrics.phase('replicate'):
+            target.upload_stream(destination['type'], backup_name, produce, destination['destination'])
+            if index is not None:
+                with target.open_destination(destination['type'], destination['destination']) as storage:
+                    storage.write_bytes(index_name(backup_name), index)
+        if entry is None:
+            entry = {'name': backup_name, 'created': None, 'size': None, 'sha256': digest.hexdigest(),
+                     'job': self.config.get('job_name'), 'kind': kind,
+                     'level': 'incremental' if '_inc.' in backup_name else 'full', 'parent': None}
+        target.update_catalog(destination['type'], lambda catalog: catalog.add(entry), destination['destination'])
+        return True
+
+    def backup_fanout(self, source_path):
+        # Jedno archiwum kompresowane raz i wysyłane do wszystkich miejsc
+        # docelowych z listy targets
+        if self.use_dedup() or self.use_mirror():
+            return False, 'Tryb fanout obsługuje tylko kopie w postaci archiwum (bez deduplikacji i kopii lustrzanej)'
+        try:
+            plan = self.plan_backup('fanout', source_path)
+            backup_name = self.backup_name_for('fanout', plan)
+            remote_name = self.archive_name(backup_name)
+            results = self.upload_fanout(remote_name, lambda f: self.write_archive(source_path, f, plan))
+
+            def finalize(handler):
+                locations = handler.config['backup_locations']
+                destination = locations['destination'] if locations['type'] == 'local' else None
+                handler.last_index = self.last_index
+                handler.store_member_index(locations['type'], remote_name, destination)
+                handler.record_backup(locations['type'], remote_name, destination, plan, stats=self.last_compression)
+                handler.cleanup_old_backups(destination, locations['type'])
+
+            statuses = self.finish_fanout(results, remote_name, finalize)
+            if plan is not None and any(error is None for name, handler, error in results):
+                plan.commit(backup_name)
+            return fanout_result(statuses, f'Kopia zapasowa {remote_name}', self.compression_summary())
+        except Exception as e:
+            return False, f'Błąd podczas tworzenia kopii zapasowej: {str(e)}'
+
+    def use_mirror(self):
+        return self.config['backup_settings'].get('local_mode', 'archive') == 'mirror'
+
+    def backup_mirror(self, source_path, destination_path):
+        # Kopia lustrzana bez kompresji: każda kopia to pełne drzewo plików,
+        # a niezmienione pliki są klonowane z poprzedniej kopii (reflink)
+        backup_name = self.create_backup_name('local') + MIRROR_SUFFIX
+        target = os.path.join(destination_path, backup_name)
+        tmp_path = target + '.tmp'
+        root_name = os.path.basename(os.path.normpath(source_path))
+        try:
+            os.makedirs(destination_path, exist_ok=True)
+            previous = sorted(name for name in self.list_backups('local') if is_mirror_name(name))
+            previous_root = os.path.join(destination_path, previous[-1], root_name) if previous else None
+            scanner = tree_scanner(source_path, self.config['backup_settings'])
+            with self.metrics.phase('archive'):
+                stats = mirror_tree(self.metrics.count_items(scanner.walk()), os.path.join(tmp_path, root_name),
+                                    previous_root)
+            os.rename(tmp_path, target)
+            self.record_backup('local', backup_name, destination_path, stats={'bytes_out': stats['bytes']})
+            self.cleanup_old_backups(destination_path)
+            return True, f'Kopia lustrzana {backup_name} została utworzona pomyślnie ({format_mirror_stats(stats)})'
+        except Exception as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False, f'Błąd podczas tworzenia kopii zapasowej: {str(e)}'
+
     def backup_local(self, source_path, destination_path):
+        if self.use_dedup():
+            return self.backup_dedup('local', source_path, destination_path)
+        if self.use_mirror():
+            return self.backup_mirror(source_path, destination_path)
+
         try:
-            backup_name = self.create_backup_name('local')
-            archive_path = self.compress_directory(source_path, backup_name)
+            plan = self.plan_backup('local', source_path, destination_path)
+            backup_name = self.backup_name_for('local', plan)
+            archive_path = self.compress_directory(source_path, backup_name, plan)
             
             # Utwórz katalog docelowy, jeśli nie istnieje
             os.makedirs(destination_path, exist_ok=True)
@@ -31,203 +891,454 @@ class FileHandler:
             # Przenieś archiwum do katalogu docelowego
             final_path = os.path.join(destination_path, os.path.basename(archive_path))
             shutil.move(archive_path, final_path)
+            self.store_member_index('local', os.path.basename(final_path), destination_path)
+            self.record_backup('local', os.path.basename(final_path), destination_path, plan)
+            if plan is not None:
+                plan.commit(backup_name)
             
             # Usuń stare kopie zapasowe, jeśli przekroczono limit
             self.cleanup_old_backups(destination_path)
             
-            return True, 'Kopia zapasowa została utworzona pomyślnie'
+            return True, 'Kopia zapasowa została utworzona pomyślnie' + self.compression_summary()
         except Exception as e:
             return False, f'Błąd podczas tworzenia kopii zapasowej: {str(e)}'
 
+    def remove_remote(self, backup_type, remote_name):
+        # Usuń niekompletny plik z serwera przez nowe połączenie z puli -
+        # to, na którym przesyłanie się nie powiodło, zostało już odrzucone
+        try:
+            with self.open_destination(backup_type) as storage:
+                if remote_name in storage.listdir():
+                    storage.delete(remote_name)
+        except Exception as e:
+            print(f'Nie udało się usunąć niekompletnego pliku {remote_name}: {str(e)}')
+
     def backup_ftp(self, source_path):
+        if self.use_dedup():
+            return self.backup_dedup('ftp', source_path)
+        if self.use_streaming():
+            return self.backup_ftp_stream(source_path)
+
+        self.resume_pending_uploads('ftp')
         archive_path = ''
         try:
-            backup_name = self.create_backup_name('ftp')
-            archive_path = self.compress_directory(source_path, backup_name)
+            plan = self.plan_backup('ftp', source_path)
+            backup_name = self.backup_name_for('ftp', plan)
+            archive_path = self.compress_directory(source_path, backup_name, plan)
+            pending = self.pending_backup(os.path.basename(archive_path), backup_name, plan)
             
-            # Połącz z serwerem FTP
-            ftp = FTP()
-            ftp.connect(
-                host=self.config['ftp_settings']['host'],
-                port=self.config['ftp_settings']['port']
-            )
-            ftp.login(
-                user=self.config['ftp_settings']['username'],
-                passwd=self.config['ftp_settings']['password']
-            )
-            
-            # Wyślij plik
-            with open(archive_path, 'rb') as f:
-                ftp.storbinary(f'STOR {os.path.basename(archive_path)}', f)
+            # Wyślij plik przez połączenie FTP z puli (duże archiwa wieloma strumieniami)
+            self.upload_archive('ftp', archive_path, pending)
+            self.store_member_index('ftp', os.path.basename(archive_path))
+            self.record_backup('ftp', os.path.basename(archive_path), plan=plan)
+            if plan is not None:
+                plan.commit(backup_name)
+            self.discard_pending_backup(pending)
             
             # Usuń lokalny plik archiwum
             os.remove(archive_path)
+            self.cleanup_old_backups(None, 'ftp')
             
-            ftp.quit()
-            return True, 'Kopia zapasowa FTP została utworzona pomyślnie'
+            return True, 'Kopia zapasowa FTP została utworzona pomyślnie' + self.compression_summary()
         except Exception as e:
-            if os.path.exists(archive_path):
-                os.remove(archive_path)
+            self.discard_transfer('ftp', archive_path, 'upload')
             return False, f'Błąd podczas tworzenia kopii zapasowej FTP: {str(e)}'
 
-    def backup_ssh(self, source_path):
-        archive_path = ''
+    def backup_ftp_stream(self, source_path):
         try:
-            backup_name = self.create_backup_name('ssh')
-            archive_path = self.compress_directory(source_path, backup_name)
-            
-            # Utwórz klienta SSH
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Połącz z serwerem SSH
-            ssh.connect(
-                hostname=self.config['ssh_settings']['host'],
-                port=self.config['ssh_settings']['port'],
-                username=self.config['ssh_settings']['username'],
-                key_filename=self.config['ssh_settings']['key_path']
-            )
+            plan = self.plan_backup('ftp', source_path)
+            backup_name = self.backup_name_for('ftp', plan)
+            remote_name = self.archive_name(backup_name)
             
-            # Utwórz SFTP session
-            sftp = ssh.open_sftp()
+            # Wysyłaj archiwum w trakcie kompresji, bez pliku lokalnego
+            self.upload_stream('ftp', remote_name, lambda pipe: self.write_archive(source_path, pipe, plan))
+            self.store_member_index('ftp', remote_name)
+            self.record_backup('ftp', remote_name, plan=plan)
+            if plan is not None:
+                plan.commit(backup_name)
+            self.cleanup_old_backups(None, 'ftp')
             
-            # Wyślij plik
-            sftp.put(archive_path, os.path.basename(archive_path))
+            return True, 'Kopia zapasowa FTP została utworzona pomyślnie' + self.compression_summary()
+        except Exception as e:
+            return False, f'Błąd podczas tworzenia kopii zapasowej FTP: {str(e)}'
+
+    def backup_ssh(self, source_path):
+        if self.use_dedup():
+            return self.backup_dedup('ssh', source_path)
+        if self.use_streaming():
+            return self.backup_ssh_stream(source_path)
+
+        self.resume_pending_uploads('ssh')
+        archive_path = ''
+        try:
+            plan = self.plan_backup('ssh', source_path)
+            backup_name = self.backup_name_for('ssh', plan)
+            archive_path = self.compress_directory(source_path, backup_name, plan)
+            pending = self.pending_backup(os.path.basename(archive_path), backup_name, plan)
             
-            # Zamknij połączenia
-            sftp.close()
-            ssh.close()
+            # Wyślij plik przez sesję SFTP z puli (duże archiwa wieloma strumieniami)
+            self.upload_archive('ssh', archive_path, pending)
+            self.store_member_index('ssh', os.path.basename(archive_path))
+            self.record_backup('ssh', os.path.basename(archive_path), plan=plan)
+            if plan is not None:
+                plan.commit(backup_name)
+            self.discard_pending_backup(pending)
             
             # Usuń lokalny plik archiwum
             os.remove(archive_path)
+            self.cleanup_old_backups(None, 'ssh')
             
-            return True, 'Kopia zapasowa SSH została utworzona pomyślnie'
+            return True, 'Kopia zapasowa SSH została utworzona pomyślnie' + self.compression_summary()
         except Exception as e:
-            if os.path.exists(archive_path):
-                os.remove(archive_path)
+            self.discard_transfer('ssh', archive_path, 'upload')
             return False, f'Błąd podczas tworzenia kopii zapasowej SSH: {str(e)}'
 
-    def restore_local(self, backup_path, destination_path):
+    def backup_ssh_stream(self, source_path):
         try:
-            with tarfile.open(backup_path, 'r:gz') as tar:
-                tar.extractall(path=destination_path)
+            plan = self.plan_backup('ssh', source_path)
+            backup_name = self.backup_name_for('ssh', plan)
+            remote_name = self.archive_name(backup_name)
+            
+            # Wysyłaj archiwum w trakcie kompresji, bez pliku lokalnego
+            self.upload_stream('ssh', remote_name, lambda pipe: self.write_archive(source_path, pipe, plan))
+            self.store_member_index('ssh', remote_name)
+            self.record_backup('ssh', remote_name, plan=plan)
+            if plan is not None:
+                plan.commit(backup_name)
+            self.cleanup_old_backups(None, 'ssh')
+            
+            return True, 'Kopia zapasowa SSH została utworzona pomyślnie' + self.compression_summary()
+        except Exception as e:
+            return False, f'Błąd podczas tworzenia kopii zapasowej SSH: {str(e)}'
+
+    def extract_members(self, tar, manifest, patterns=None):
+        # Manifest kopii nie jest rozpakowywany, tylko odczytywany
+        for member in tar:
+            if member.name == MANIFEST_NAME:
+                manifest.update(json.load(tar.extractfile(member)))
+                continue
+            if patterns and not match_member(member.name, patterns):
+                continue
+            yield member
+
+    def apply_deletions(self, manifest, destination_path, patterns=None):
+        # Kopia przyrostowa usuwa pliki skasowane od poprzedniej kopii
+        destination_root = os.path.realpath(destination_path)
+        for rel_path in manifest.get('deleted', []):
+            if patterns and not match_member(os.path.join(manifest['root'], rel_path), patterns):
+                continue
+            target = os.path.realpath(os.path.join(destination_root, manifest['root'], rel_path))
+            if not target.startswith(destination_root + os.sep):
+                continue
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target, ignore_errors=True)
+            elif os.path.lexists(target):
+                os.remove(target)
+
+    def unpack_archive(self, fileobj, codec, destination_path, patterns=None):
+        # Rozpakowanie bez usuwania plików z manifestu; zwraca manifest
+        manifest = {}
+        with tarfile.open(fileobj=open_decompressor(fileobj, codec), mode='r|') as tar:
+            tar.extractall(path=destination_path, members=self.extract_members(tar, manifest, patterns))
+        return manifest
+
+    def extract_archive(self, fileobj, codec, destination_path, patterns=None):
+        manifest = self.unpack_archive(fileobj, codec, destination_path, patterns)
+        self.apply_deletions(manifest, destination_path, patterns)
+
+    def move_into_place(self, staging_path, destination_path):
+        # Przeniesienie rozpakowanych plików z katalogu tymczasowego (na tym
+        # samym systemie plików) do miejsca docelowego z nadpisaniem
+        for entry in os.scandir(staging_path):
+            target = os.path.join(destination_path, entry.name)
+            if entry.is_dir(follow_symlinks=False) and os.path.isdir(target) and not os.path.islink(target):
+                self.move_into_place(entry.path, target)
+                shutil.copystat(entry.path, target)
+                continue
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            os.replace(entry.path, target)
+
+    def restore_local(self, backup_path, destination_path, patterns=None, checksum=None):
+        if is_snapshot_name(backup_path):
+            return self.restore_dedup('local', os.path.basename(backup_path), destination_path,
+                                      os.path.dirname(backup_path), patterns)
+        if is_mirror_name(backup_path):
+            try:
+                stats = restore_mirror(backup_path, destination_path, patterns)
+                return True, f'Kopia zapasowa została przywrócona pomyślnie ({format_mirror_stats(stats)})'
+            except Exception as e:
+                return False, f'Błąd podczas przywracania kopii zapasowej: {str(e)}'
+
+        try:
+            backup_name = os.path.basename(backup_path)
+            if checksum is None:
+                checksum = self.expected_checksum('local', backup_name, os.path.dirname(backup_path))
+            with open(backup_path, 'rb') as f:
+                self.extract_verified(f, backup_name, checksum, destination_path, patterns)
             return True, 'Kopia zapasowa została przywrócona pomyślnie'
         except Exception as e:
             return False, f'Błąd podczas przywracania kopii zapasowej: {str(e)}'
 
-    def restore_ftp(self, backup_name, destination_path):
+    def extract_verified(self, fileobj, backup_name, checksum, destination_path, patterns=None):
+        # Pliki trafiają najpierw do katalogu tymczasowego w miejscu docelowym
+        # i są przenoszone na miejsce dopiero po sprawdzeniu sumy kontrolnej,
+        # liczonej w trakcie rozpakowywania - bez drugiego odczytu archiwum
+        os.makedirs(destination_path, exist_ok=True)
+        staging_path = tempfile.mkdtemp(prefix='.restore_', dir=destination_path)
         try:
-            # Połącz z serwerem FTP
-            ftp = FTP()
-            ftp.connect(
-                host=self.config['ftp_settings']['host'],
-                port=self.config['ftp_settings']['port']
-            )
-            ftp.login(
-                user=self.config['ftp_settings']['username'],
-                passwd=self.config['ftp_settings']['password']
-            )
-            
-            # Pobierz plik
-            local_path = os.path.join('/tmp', backup_name)
-            with open(local_path, 'wb') as f:
-                ftp.retrbinary(f'RETR {backup_name}', f.write)
+            reader = HashingReader(fileobj)
+            manifest = self.unpack_archive(reader, codec_from_name(backup_name), staging_path, patterns)
+            # Dopełnienie za końcem archiwum tar też musi zostać odczytane
+            reader.drain()
+            check_digest(backup_name, checksum, reader.hexdigest())
+            self.move_into_place(staging_path, destination_path)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+        self.apply_deletions(manifest, destination_path, patterns)
+
+    def restore_stream(self, backup_type, backup_name, destination_path, patterns=None):
+        # Rozpakowywanie nakłada się na pobieranie, bez pliku w /tmp
+        try:
+            self.last_transfer = None
+            started = time.monotonic()
+            received = [0]
+            checksum = self.expected_checksum(backup_type, backup_name)
+            with self.download_stream(backup_type, backup_name, received) as stream:
+                self.extract_verified(stream, backup_name, checksum, destination_path, patterns)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.last_transfer = {
+                'streams': 1,
+                'bytes': received[0],
+                'seconds': elapsed,
+                'mb_per_s': received[0] / elapsed / (1024 * 1024)
+            }
+            return True, 'Kopia zapasowa została przywrócona pomyślnie' + self.transfer_summary()
+        except Exception as e:
+            return False, f'Błąd podczas przywracania kopii zapasowej {backup_type.upper()}: {str(e)}'
+
+    def restore_ftp(self, backup_name, destination_path, patterns=None):
+        if is_snapshot_name(backup_name):
+            return self.restore_dedup('ftp', backup_name, destination_path, patterns=patterns)
+        if self.use_streaming():
+            return self.restore_stream('ftp', backup_name, destination_path, patterns)
+
+        local_path = os.path.join('/tmp', backup_name)
+        try:
+            # Pobierz plik przez połączenie FTP z puli
+            checksum = self.expected_checksum('ftp', backup_name) or ''
+            self.download_archive('ftp', backup_name, local_path, checksum)
             
-            # Rozpakuj archiwum
-            success, message = self.restore_local(local_path, destination_path)
+            # Rozpakuj archiwum, sprawdzając sumę kontrolną z katalogu kopii
+            success, message = self.restore_local(local_path, destination_path, patterns, checksum)
+            if success:
+                message += self.transfer_summary()
             
             # Usuń tymczasowy plik
             os.remove(local_path)
             
-            ftp.quit()
             return success, message
         except Exception as e:
+            self.discard_transfer('ftp', local_path, 'download')
             return False, f'Błąd podczas przywracania kopii zapasowej FTP: {str(e)}'
 
-    def restore_ssh(self, backup_name, destination_path):
+    def restore_ssh(self, backup_name, destination_path, patterns=None):
+        if is_snapshot_name(backup_name):
+            return self.restore_dedup('ssh', backup_name, destination_path, patterns=patterns)
+        if self.use_streaming():
+            return self.restore_stream('ssh', backup_name, destination_path, patterns)
+
+        local_path = os.path.join('/tmp', backup_name)
         try:
-            # Utwórz klienta SSH
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Połącz z serwerem SSH
-            ssh.connect(
-                hostname=self.config['ssh_settings']['host'],
-                port=self.config['ssh_settings']['port'],
-                username=self.config['ssh_settings']['username'],
-                key_filename=self.config['ssh_settings']['key_path']
-            )
-            
-            # Utwórz SFTP session
-            sftp = ssh.open_sftp()
-            
-            # Pobierz plik
-            local_path = os.path.join('/tmp', backup_name)
-            sftp.get(backup_name, local_path)
+            # Pobierz plik przez sesję SFTP z puli
+            checksum = self.expected_checksum('ssh', backup_name) or ''
+            self.download_archive('ssh', backup_name, local_path, checksum)
             
-            # Rozpakuj archiwum
-            success, message = self.restore_local(local_path, destination_path)
+            # Rozpakuj archiwum, sprawdzając sumę kontrolną z katalogu kopii
+            success, message = self.restore_local(local_path, destination_path, patterns, checksum)
+            if success:
+                message += self.transfer_summary()
             
             # Usuń tymczasowy plik
             os.remove(local_path)
             
-            # Zamknij połączenia
-            sftp.close()
-            ssh.close()
-            
             return success, message
         except Exception as e:
+            self.discard_transfer('ssh', local_path, 'download')
             return False, f'Błąd podczas przywracania kopii zapasowej SSH: {str(e)}'
 
-    def cleanup_old_backups(self, backup_dir):
+    def restore_selected(self, backup_type, backup_name, patterns, destination_path, backup_dir=None):
+        # Przywracanie wybranych ścieżek: z indeksem pobierane są tylko bloki
+        # archiwum zawierające pasujące pliki, bez indeksu - całe archiwum
+        if is_snapshot_name(backup_name):
+            return self.restore_dedup(backup_type, backup_name, destination_path, backup_dir, patterns)
+
+        backup_dir = backup_dir or self.config['backup_locations']['destination']
         try:
-            # Pobierz listę plików kopii zapasowych
-            backups = [f for f in os.listdir(backup_dir) if f.startswith('backup_') and f.endswith('.tar.gz')]
-            backups.sort(reverse=True)  # Sortuj od najnowszych do najstarszych
-            
-            # Usuń nadmiarowe kopie
-            max_backups = self.config['backup_settings']['max_backups']
-            if len(backups) > max_backups:
-                for backup in backups[max_backups:]:
-                    os.remove(os.path.join(backup_dir, backup))
+            if backup_type == 'local':
+                storage = LocalStorage(backup_dir)
+            else:
+                storage = open_storage(self.config, backup_type, pool=self.pool)
+            with storage:
+                try:
+                    index = MemberIndex.from_bytes(storage.read_bytes(index_name(backup_name)))
+                except (OSError, error_perm):
+                    index = None
+                if index is not None and not index.has_checksums():
+                    # Bez sum kontrolnych bloków pobrane fragmenty nie dają się
+                    # sprawdzić - całe archiwum ze sprawdzeniem sumy z katalogu
+                    print(f'Indeks kopii {backup_name} nie ma sum kontrolnych bloków')
+                    index = None
+                if index is not None:
+                    names = storage.listdir()
+                    volumes = [backup_name] if backup_name in names else find_volumes(names, backup_name)
+                    if not volumes:
+                        raise FileNotFoundError(f'Nie znaleziono kopii zapasowej {backup_name}')
+                    parts = [(name, storage.size(name)) for name in volumes]
+                    # Każdy pobrany blok sprawdzany jest z sumą z indeksu; pliki
+                    # trafiają na miejsce dopiero, gdy wszystkie bloki są poprawne
+                    os.makedirs(destination_path, exist_ok=True)
+                    staging_path = tempfile.mkdtemp(prefix='.restore_', dir=destination_path)
+                    try:
+                        extracted, fetched = extract_selected(
+                            index, lambda offset, length: read_parts(storage, parts, offset, length),
+                            patterns, staging_path, (MANIFEST_NAME,)
+                        )
+                        self.move_into_place(staging_path, destination_path)
+                    finally:
+                        shutil.rmtree(staging_path, ignore_errors=True)
+                    if index.manifest:
+                        self.apply_deletions(index.manifest, destination_path, patterns)
         except Exception as e:
-            print(f'Błąd podczas czyszczenia starych kopii zapasowych: {str(e)}')
+            return False, f'Błąd podczas przywracania wybranych plików: {str(e)}'
+
+        if index is None:
+            print(f'Kopia {backup_name} jest przywracana z całego archiwum')
+            if backup_type == 'local':
+                return self.restore_local(os.path.join(backup_dir, backup_name), destination_path, patterns)
+            if backup_type == 'ftp':
+                return self.restore_ftp(backup_name, destination_path, patterns)
+            return self.restore_ssh(backup_name, destination_path, patterns)
+        total = sum(size for name, size in parts)
+        return True, (f'Przywrócono {extracted} elementów kopii zapasowej '
+                      f'(pobrano {fetched / (1024 * 1024):.1f} z {total / (1024 * 1024):.1f} MB)')
+
+    def backup_chain(self, backups, backup_name):
+        # Kopia przyrostowa wymaga odtworzenia ostatniej pełnej kopii
+        # i wszystkich kolejnych kopii przyrostowych, aż do wybranej
+        prefix = backup_name.rsplit('_', 3)[0] if '_inc.' in backup_name else None
+        if prefix is None:
+            return [backup_name]
+        candidates = sorted(b for b in backups if b.startswith(prefix + '_') and b <= backup_name)
+        chain = []
+        for backup in reversed(candidates):
+            chain.insert(0, backup)
+            if '_inc.' not in backup:
+                break
+        return chain
+
+    def cleanup_old_backups(self, backup_dir, backup_type='local'):
+        # Retencja po każdej kopii; błąd nie zmienia wyniku samej kopii
+        with self.metrics.phase('prune'):
+            success, message = self.prune_backups(backup_type, destination_path=backup_dir)
+        if not success:
+            print(message)
+
+    def expired_backups(self, backups):
+        # Kopie poza polityką retencji (max_backups lub retention), z
+        # zachowaniem łańcuchów kopii przyrostowych
+        return expired_backups(backups, retention_policy(self.config['backup_settings']))
+
+    def prune_backups(self, backup_type, dry_run=False, destination_path=None):
+        # Usuwa kopie poza polityką retencji w dowolnym miejscu docelowym,
+        # w jednej sesji; dry_run tylko podaje, co i ile miejsca zostałoby zwolnione
+        destination = destination_path or self.config['backup_locations']['destination']
+        try:
+            if self.use_dedup():
+                with self.open_repository(backup_type, destination if backup_type == 'local' else None) as repository:
+                    # Retencja (max_backups lub retention) tylko migawek tego zadania
+                    snapshots = repository.list_snapshots(self.backup_prefix())
+                    removed, orphans, reclaimed = repository.gc(self.expired_backups(snapshots), dry_run)
+                if dry_run:
+                    for snapshot_name in removed:
+                        print(f'Do usunięcia: {snapshot_name}')
+                return True, (f'{format_reclaimed(len(removed), reclaimed, dry_run)}, '
+                              f'nieużywanych fragmentów: {orphans}')
+
+            expired = self.expired_backups(self.list_backups(backup_type))
+            reclaimed = 0
+            if expired:
+                with self.open_destination(backup_type, destination) as storage:
+                    names = storage.listdir()
+                    removed = []
+                    for backup in expired:
+                        if backup_type == 'local' and is_mirror_name(backup):
+                            # Rozmiar pozorny - bloki współdzielone z innymi kopiami nie są zwalniane
+                            path = os.path.join(destination, backup)
+                            reclaimed += mirror_size(path)
+                            if dry_run:
+                                print(f'Do usunięcia: {backup}')
+                            else:
+                                shutil.rmtree(path)
+                            continue
+                        files = [backup] if backup in names else find_volumes(names, backup)
+                        if index_name(backup) in names:
+                            files.append(index_name(backup))
+                        if dry_run:
+                            for name in files:
+                                print(f'Do usunięcia: {name}')
+                        removed.extend(files)
+                    # Rozmiary i usunięcia wszystkich plików naraz - silnik
+                    # asyncio wysyła je bez czekania na kolejne odpowiedzi
+                    reclaimed += sum(storage.size_many(removed))
+                    if not dry_run:
+                        storage.delete_many(removed)
+                if not dry_run:
+                    self.uncatalog_backups(backup_type, expired, destination)
+            return True, format_reclaimed(len(expired), reclaimed, dry_run)
+        except Exception as e:
+            return False, f'Błąd podczas usuwania starych kopii zapasowych: {str(e)}'
 
     def list_backups(self, backup_type='local'):
         try:
-            if backup_type == 'local':
-                backup_dir = self.config['backup_locations']['destination']
-                if not os.path.exists(backup_dir):
-                    return []
-                return [f for f in os.listdir(backup_dir) if f.startswith('backup_') and f.endswith('.tar.gz')]
-            elif backup_type == 'ftp':
-                ftp = FTP()
-                ftp.connect(
-                    host=self.config['ftp_settings']['host'],
-                    port=self.config['ftp_settings']['port']
-                )
-                ftp.login(
-                    user=self.config['ftp_settings']['username'],
-                    passwd=self.config['ftp_settings']['password']
-                )
-                backups = [f for f in ftp.nlst() if f.startswith('backup_') and f.endswith('.tar.gz')]
-                ftp.quit()
-                return backups
-            elif backup_type == 'ssh':
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(
-                    hostname=self.config['ssh_settings']['host'],
-                    port=self.config['ssh_settings']['port'],
-                    username=self.config['ssh_settings']['username'],
-                    key_filename=self.config['ssh_settings']['key_path']
-                )
-                sftp = ssh.open_sftp()
-                backups = [f for f in sftp.listdir() if f.startswith('backup_') and f.endswith('.tar.gz')]
-                sftp.close()
-                ssh.close()
-                return backups
-            return []
+            if self.use_dedup():
+                destination = self.config['backup_locations']['destination'] if backup_type == 'local' else None
+                with self.open_repository(backup_type, destination) as repository:
+                    return repository.list_snapshots(self.backup_prefix())
+            prefix = self.backup_prefix()
+            catalog = self.load_catalog(backup_type, 'files', prefix)
+            if catalog is not None:
+                return catalog.names(prefix, 'files')
+            # Brak katalogu: listowanie miejsca docelowego i uzupełnienie katalogu
+            names = self.scan_backups(backup_type)
+            if backup_type != 'local' or os.path.exists(self.config['backup_locations']['destination']):
+                self.seed_catalog(backup_type, names, 'files', prefix)
+            return names
         except Exception as e:
             print(f'Błąd podczas listowania kopii zapasowych: {str(e)}')
-            return []
\ No newline at end of file
+            return []
+
+    def scan_backups(self, backup_type='local'):
+        # Listowanie archiwów kopii bezpośrednio w miejscu docelowym
+        if backup_type == 'local':
+            backup_dir = self.config['backup_locations']['destination']
+            if not os.path.exists(backup_dir):
+                return []
+            names = os.listdir(backup_dir)
+        elif backup_type in ('ftp', 'ssh'):
+            with self.open_destination(backup_type) as storage:
+                names = storage.listdir()
+            if backup_type == 'ftp':
+                names = group_volumes(names)
+        else:
+            return []
+        return [f for f in names if matches_prefix(f, self.backup_prefix()) and (is_archive_name(f) or is_mirror_name(f))]
+
+    def refresh_catalog(self, backup_type='local'):
+        # Odbudowa katalogu po zmianach wykonanych poza programem
+        try:
+            names = self.scan_backups(backup_type)
+            self.seed_catalog(backup_type, names, 'files', self.backup_prefix(), replace=True)
+            return True, f'Katalog kopii zapasowych odświeżony (kopie plików: {len(names)})'
+        except Exception as e:
+            return False, f'Błąd podczas odświeżania katalogu kopii zapasowych: {str(e)}'
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+from datetime import datetime
+from scanner import TreeScanner, tree_scanner
+from throttle import default_throttle
+
+MANIFEST_NAME = '.backup_manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            default_throttle.consume('read_kbps', len(chunk))
+            digest.update(chunk)
+    return digest.digest()
+
+
+class FileIndex:
+    # Indeks stanu plików (ścieżka -> rozmiar, mtime, inode, skrót) w SQLite.
+    # Tabela bez rowid jest zwarta, a całość wczytywana jest jednym zapytaniem.
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash BLOB'
+            ') WITHOUT ROWID'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        return conn
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}, {}
+        conn = self._connect(self.path)
+        try:
+            entries = {row[0]: row[1:] for row in conn.execute('SELECT * FROM files')}
+            meta = {key: json.loads(value) for key, value in conn.execute('SELECT * FROM meta')}
+        finally:
+            conn.close()
+        return entries, meta
+
+    def save(self, entries, meta):
+        # Nowy indeks zapisywany jest obok i podmieniany atomowo
+        tmp_path = f'{self.path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connect(tmp_path)
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+                    ((path,) + tuple(entry) for path, entry in entries.items())
+                )
+                conn.executemany(
+                    'INSERT INTO meta VALUES (?, ?)',
+                    ((key, json.dumps(value)) for key, value in meta.items())
+                )
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.path)
+
+
+class BackupPlan:
+    def __init__(self, index, kind, entries, members, deleted, meta):
+        self.index = index
+        self.kind = kind
+        self.entries = entries
+        self.members = members
+        self.deleted = deleted
+        self.meta = meta
+
+    @property
+    def is_incremental(self):
+        return self.kind == 'incremental'
+
+    def manifest(self, root):
+        return {
+            'kind': self.kind,
+            'root': root,
+            'parent': self.meta.get('last_backup'),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'deleted': self.deleted
+        }
+
+    def committed_meta(self, backup_name):
+        meta = dict(self.meta)
+        meta['last_backup'] = backup_name
+        if self.is_incremental:
+            meta['incremental_count'] = meta.get('incremental_count', 0) + 1
+        else:
+            meta['last_full'] = datetime.now().isoformat(timespec='seconds')
+            meta['incremental_count'] = 0
+        return meta
+
+    def commit(self, backup_name):
+        # Wywoływane dopiero po udanym zapisaniu kopii w miejscu docelowym
+        self.index.save(self.entries, self.committed_meta(backup_name))
+
+    def stage(self, backup_name, path):
+        # Indeks po kopii zapisany obok - podmieniany przy dokończeniu
+        # przerwanego wysyłania w kolejnym uruchomieniu
+        FileIndex(path).save(self.entries, self.committed_meta(backup_name))
+
+
+def scan_tree(source_path, previous, scanner=None):
+    # Skrót liczony jest tylko dla plików nowych lub ze zmienionymi metadanymi
+    entries = {}
+    changed = []
+    scanner = scanner or TreeScanner(source_path)
+    for rel_path, full_path, st in scanner.walk():
+        old = previous.get(rel_path)
+        if stat.S_ISDIR(st.st_mode):
+            entry = (0, 0, st.st_ino, None)
+            if old is None:
+                changed.append(rel_path)
+        elif old is not None and old[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            entry = old
+        else:
+            try:
+                digest = file_digest(full_path) if stat.S_ISREG(st.st_mode) else None
+            except FileNotFoundError:
+                continue
+            entry = (st.st_size, st.st_mtime_ns, st.st_ino, digest)
+            if old is None or old[0] != st.st_size or digest is None or old[3] != digest:
+                changed.append(rel_path)
+        entries[rel_path] = entry
+    deleted = sorted(path for path in previous if path not in entries)
+    return entries, changed, deleted
+
+
+def needs_full_backup(meta, settings):
+    if not meta.get('last_backup') or not meta.get('last_full'):
+        return True
+    full_every = settings.get('full_backup_every', 7)
+    if full_every and meta.get('incremental_count', 0) >= full_every:
+        return True
+    interval_days = settings.get('full_backup_interval_days')
+    if interval_days:
+        age = datetime.now() - datetime.fromisoformat(meta['last_full'])
+        if age.total_seconds() >= interval_days * 86400:
+            return True
+    return False
+
+
+def plan_backup(index_path, source_path, settings):
+    index = FileIndex(index_path)
+    previous, meta = index.load()
+    full = needs_full_backup(meta, settings)
+    entries, changed, deleted = scan_tree(source_path, previous, tree_scanner(source_path, settings))
+    if full:
+        return BackupPlan(index, 'full', entries, None, [], meta)
+    return BackupPlan(index, 'incremental', entries, changed, deleted, meta)
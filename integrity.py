@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import hashlib
+import time
+
+READ_SIZE = 256 * 1024
+
+
+class ChecksumMismatch(IOError):
+    pass
+
+
+class HashingReader:
+    # Plik tylko do odczytu liczący SHA-256 z danych przechodzących przez
+    # niego do rozpakowywania - suma sprawdzana jest bez ponownego odczytu
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def drain(self):
+        # Dane za końcem archiwum (dopełnienie tar, koniec strumienia
+        # kompresji) też wchodzą do sumy kontrolnej
+        while self.read(READ_SIZE):
+            pass
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+class RateLimiter:
+    # Ogranicza średnią przepustowość do bytes_per_second; 0 - bez limitu
+    def __init__(self, bytes_per_second=0):
+        self.rate = bytes_per_second
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, size):
+        if self.rate <= 0:
+            return
+        self.consumed += size
+        delay = self.consumed / self.rate - (time.monotonic() - self.started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def check_digest(backup_name, expected, actual):
+    if expected and expected != actual:
+        raise ChecksumMismatch(f'Suma kontrolna kopii {backup_name} nie zgadza się '
+                               f'(oczekiwano {expected[:16]}, obliczono {actual[:16]}) - archiwum jest uszkodzone')
+
+
+def format_verify_summary(results):
+    counts = {'ok': 0, 'corrupt': 0, 'unknown': 0, 'error': 0}
+    for name, status, message in results:
+        counts[status] += 1
+    return (f"Sprawdzono kopii zapasowych: {len(results)}, poprawnych: {counts['ok']}, "
+            f"uszkodzonych: {counts['corrupt']}, bez sumy kontrolnej: {counts['unknown']}, "
+            f"błędów odczytu: {counts['error']}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from catalog import RESERVED_JOB_NAMES
+from db_handler import DatabaseHandler
+from file_handler import FileHandler
+
+DEFAULT_MAX_CONCURRENT_JOBS = 4
+DEFAULT_DESTINATION_CONCURRENCY = {
+    'local': 2,
+    'ftp': 2,
+    'ssh': 2,
+    'database': 1
+}
+SETTINGS_SECTIONS = ('ftp_settings', 'ssh_settings', 'database_settings', 'backup_settings')
+
+
+def load_jobs(config, names=None):
+    jobs = config.get('jobs', [])
+    seen = set()
+    for job in jobs:
+        name = job.get('name')
+        if not name:
+            raise ValueError('Każde zadanie na liście jobs musi mieć nazwę')
+        if name in seen:
+            raise ValueError(f'Powtórzona nazwa zadania: {name}')
+        if name in RESERVED_JOB_NAMES:
+            raise ValueError(f'Nazwa zadania {name} jest zarezerwowana dla typu kopii')
+        seen.add(name)
+    if names:
+        missing = set(names) - seen
+        if missing:
+            raise ValueError(f'Nieznane zadania: {", ".join(sorted(missing))}')
+        jobs = [job for job in jobs if job['name'] in names]
+    return jobs
+
+
+def job_config(config, job):
+    # Konfiguracja zadania: ustawienia globalne nadpisane polami zadania
+    merged = copy.deepcopy(config)
+    merged.pop('jobs', None)
+    merged['job_name'] = job['name']
+    merged['backup_locations'] = {
+        'source': job.get('source', ''),
+        'destination': job.get('destination', ''),
+        'type': job.get('type', 'local'),
+        'targets': job.get('targets', [])
+    }
+    for section in SETTINGS_SECTIONS:
+        merged.setdefault(section, {}).update(job.get(section, {}))
+    if 'max_backups' in job:
+        merged['backup_settings']['max_backups'] = job['max_backups']
+    if 'retention' in job:
+        merged['backup_settings']['retention'] = job['retention']
+    return merged
+
+
+def destination_key(config, kind):
+    # Zadania korzystające z tego samego dysku lub serwera dzielą jeden limit
+    if kind == 'database':
+        return 'database', config['database_settings'].get('host', '')
+    backup_type = config['backup_locations']['type']
+    if backup_type == 'fanout':
+        # Kopie do wielu miejsc naraz - bez wpisu w destination_concurrency po jednej
+        return ('fanout',)
+    if backup_type in ('ftp', 'ssh'):
+        settings = config[f'{backup_type}_settings']
+        return backup_type, settings.get('host', ''), settings.get('port')
+    path = os.path.abspath(config['backup_locations']['destination'] or '.')
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return 'local', os.stat(path).st_dev
+
+
+class JobRunner:
+    # Zadania z listy jobs wykonywane w ograniczonej puli wątków. Limit na
+    # miejsce docelowe sprawia, że kompresja na lokalny dysk i wysyłanie na
+    # serwery z różnych zadań nakładają się, a jeden serwer nie dostaje
+    # więcej równoczesnych kopii niż destination_concurrency
+    def __init__(self, config):
+        settings = config.get('backup_settings', {})
+        self.config = config
+        self.workers = max(1, settings.get('max_concurrent_jobs', DEFAULT_MAX_CONCURRENT_JOBS))
+        self.limits = dict(DEFAULT_DESTINATION_CONCURRENCY)
+        self.limits.update(settings.get('destination_concurrency', {}))
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def semaphore(self, key):
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(max(1, self.limits.get(key[0], 1)))
+            return self._semaphores[key]
+
+    def prepare(self, job):
+        config = job_config(self.config, job)
+        settings = config['backup_settings']
+        # Równoległe zadania dzielą rdzenie zamiast każde zajmować wszystkie
+        if not settings.get('compression_workers') and 'compression_workers' not in job.get('backup_settings', {}):
+            settings['compression_workers'] = max(1, (os.cpu_count() or 1) // self.workers)
+        return config
+
+    def run_job(self, job):
+        queued = time.monotonic()
+        kind = job.get('kind', 'files')
+        result = {'name': job['name'], 'kind': kind, 'success': False, 'message': '', 'wait': 0.0, 'seconds': 0.0}
+        try:
+            config = self.prepare(job)
+            semaphore = self.semaphore(destination_key(config, kind))
+        except Exception as e:
+            result['message'] = f'Błąd konfiguracji zadania: {str(e)}'
+            return result
+        with semaphore:
+            started = time.monotonic()
+            result['wait'] = started - queued
+            # Jedno wywołanie zapisu na wiersz, aby wiersze zadań się nie przeplatały
+            print(f'[{job["name"]}] Rozpoczęto zadanie\n', end='')
+            try:
+                if kind == 'database':
+                    success, message = DatabaseHandler(config).backup_database()
+                elif not config['backup_locations']['source']:
+                    success, message = False, 'Błąd: Nie skonfigurowano ścieżki źródłowej!'
+                else:
+                    locations = config['backup_locations']
+                    success, message = FileHandler(config).backup(locations['source'], locations['destination'])
+            except Exception as e:
+                success, message = False, f'Nieoczekiwany błąd: {str(e)}'
+            result['seconds'] = time.monotonic() - started
+        result['success'] = success
+        result['message'] = message
+        print(f'[{job["name"]}] {message}\n', end='')
+        return result
+
+    def run(self, names=None):
+        jobs = load_jobs(self.config, names)
+        if not jobs:
+            return [], 0.0
+        started = time.monotonic()
+        with ThreadPoolExecutor(min(self.workers, len(jobs)), thread_name_prefix='job') as executor:
+            results = list(executor.map(self.run_job, jobs))
+        return results, time.monotonic() - started
+
+
+def format_job_summary(results, elapsed):
+    lines = [f"{'Zadanie':<24} {'Rodzaj':<9} {'Wynik':<6} {'Czas [s]':>9} {'Oczekiwanie [s]':>16}"]
+    for result in results:
+        status = 'OK' if result['success'] else 'BŁĄD'
+        lines.append(f"{result['name']:<24} {result['kind']:<9} {status:<6} "
+                     f"{result['seconds']:>9.1f} {result['wait']:>16.1f}")
+    failed = sum(1 for result in results if not result['success'])
+    total = sum(result['seconds'] for result in results)
+    lines.append(f'Zadania: {len(results)}, błędy: {failed}, czas całkowity {elapsed:.1f} s '
+                 f'(suma czasów zadań {total:.1f} s)')
+    return '\n'.join(lines)
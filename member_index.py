@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import bisect
+import fnmatch
+import json
+import tarfile
+import hashlib
+import zlib
+from compression import decompress_block
+from integrity import ChecksumMismatch
+
+INDEX_SUFFIX = '.index'
+FETCH_SIZE = 8 * 1024 * 1024
+
+
+def index_name(archive_name):
+    return archive_name + INDEX_SUFFIX
+
+
+def match_member(name, patterns):
+    # Ścieżka pasuje, gdy jest wskazana wprost, leży w podanym katalogu
+    # lub pasuje do wzorca w stylu powłoki (np. */etc/*.conf)
+    for pattern in patterns:
+        pattern = pattern.strip('/')
+        if name == pattern or name.startswith(pattern + '/') or fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+class MemberIndex:
+    # Indeks archiwum zapisywany obok kopii: początek każdego członu w
+    # nieskompresowanym strumieniu tar oraz położenie niezależnie
+    # skompresowanych bloków w pliku archiwum
+    def __init__(self, codec='none', members=None, blocks=None, end=0, manifest=None):
+        self.codec = codec
+        self.members = members if members is not None else []
+        self.blocks = blocks if blocks is not None else []
+        self.end = end
+        self.manifest = manifest
+
+    def record(self, tarinfo, offset):
+        # Wywoływane tuż przed zapisem nagłówka członu
+        self.members.append([tarinfo.name, offset])
+        return tarinfo
+
+    def finish(self, end, compressor, manifest=None):
+        self.end = end
+        self.codec = compressor.codec
+        self.blocks = [list(block) for block in compressor.blocks]
+        self.manifest = manifest
+
+    def to_bytes(self):
+        return zlib.compress(json.dumps({
+            'codec': self.codec,
+            'end': self.end,
+            'members': self.members,
+            'blocks': self.blocks,
+            'manifest': self.manifest
+        }).encode())
+
+    @classmethod
+    def from_bytes(cls, data):
+        index = json.loads(zlib.decompress(data))
+        return cls(index['codec'], index['members'], index['blocks'], index['end'], index.get('manifest'))
+
+    def ranges(self, patterns):
+        # Zakresy pasujących członów; człony leżące obok siebie czytane są razem
+        ranges = []
+        for i, (name, start) in enumerate(self.members):
+            if not match_member(name, patterns):
+                continue
+            end = self.members[i + 1][1] if i + 1 < len(self.members) else self.end
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def has_checksums(self):
+        # Indeksy sprzed sum kontrolnych bloków nie pozwalają sprawdzić
+        # pobranych fragmentów archiwum
+        return bool(self.blocks) and all(len(block) > 4 for block in self.blocks)
+
+    def block_at(self, offset):
+        return bisect.bisect_right([block[0] for block in self.blocks], offset) - 1
+
+
+class IndexedReader:
+    # Plik tylko do odczytu obejmujący zakres [start, end) strumienia tar.
+    # Pobiera i rozpakowuje wyłącznie bloki, w które ten zakres wpada.
+    def __init__(self, index, read_compressed, start, end):
+        self.index = index
+        self.read_compressed = read_compressed
+        self.end = end
+        self.block = index.block_at(start)
+        self.skip = start - index.blocks[self.block][0] if index.blocks else 0
+        self.buffer = bytearray()
+        self.fetched = 0
+
+    def _has_blocks(self):
+        blocks = self.index.blocks
+        return 0 <= self.block < len(blocks) and blocks[self.block][0] < self.end
+
+    def _fill(self):
+        blocks = self.index.blocks
+        first = last = self.block
+        length = blocks[first][2]
+        # Sąsiednie bloki pobierane jednym żądaniem, do FETCH_SIZE bajtów
+        while (last + 1 < len(blocks) and blocks[last + 1][0] < self.end
+               and length + blocks[last + 1][2] <= FETCH_SIZE):
+            last += 1
+            length += blocks[last][2]
+        data = self.read_compressed(blocks[first][1], length)
+        if len(data) != length:
+            raise IOError('Niekompletny odczyt bloków archiwum')
+        self.fetched += length
+        position = 0
+        for block in blocks[first:last + 1]:
+            raw_offset, out_offset, out_size = block[:3]
+            chunk = data[position:position + out_size]
+            if len(block) > 4 and hashlib.sha256(chunk).hexdigest() != block[4]:
+                raise ChecksumMismatch(f'Suma kontrolna bloku archiwum (przesunięcie {out_offset}) '
+                                       f'nie zgadza się - archiwum jest uszkodzone')
+            raw = decompress_block(self.index.codec, chunk)
+            position += out_size
+            self.buffer += raw[:self.end - raw_offset]
+        self.block = last + 1
+        if self.skip:
+            del self.buffer[:self.skip]
+            self.skip = 0
+
+    def read(self, size=-1):
+        while (size is None or size < 0 or len(self.buffer) < size) and self._has_blocks():
+            self._fill()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def read_parts(storage, parts, offset, length):
+    # Odczyt zakresu archiwum, które może być podzielone na woluminy
+    data = bytearray()
+    part_start = 0
+    for name, size in parts:
+        part_end = part_start + size
+        if offset < part_end and offset + length > part_start:
+            begin = max(offset, part_start) - part_start
+            stop = min(offset + length, part_end) - part_start
+            data += storage.read_range(name, begin, stop - begin)
+        part_start = part_end
+    return bytes(data)
+
+
+def extract_selected(index, read_compressed, patterns, destination_path, skip_names=()):
+    # Zwraca liczbę przywróconych członów i liczbę pobranych bajtów archiwum
+    counts = {'extracted': 0, 'fetched': 0}
+
+    def selected(tar):
+        for member in tar:
+            if member.name in skip_names:
+                continue
+            counts['extracted'] += 1
+            yield member
+
+    for start, end in index.ranges(patterns):
+        reader = IndexedReader(index, read_compressed, start, end)
+        with tarfile.open(fileobj=reader, mode='r|') as tar:
+            tar.extractall(path=destination_path, members=selected(tar))
+        counts['fetched'] += reader.fetched
+    return counts['extracted'], counts['fetched']
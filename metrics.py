@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import glob
+import json
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROGRESS_INTERVAL = 0.5
+REPORT_DIR = 'reports'
+PROMETHEUS_PREFIX = 'backup'
+# Metryki eksportowane do Prometheusa: nazwa -> (klucz raportu, opis)
+PROMETHEUS_GAUGES = {
+    'duration_seconds': ('seconds', 'Czas trwania ostatniego uruchomienia kopii'),
+    'files': ('files', 'Liczba plików w ostatniej kopii'),
+    'bytes_read': ('bytes_read', 'Bajty plików źródłowych odczytane w ostatniej kopii'),
+    'bytes_in': ('bytes_in', 'Bajty przed kompresją w ostatniej kopii'),
+    'bytes_out': ('bytes_out', 'Bajty po kompresji w ostatniej kopii'),
+    'bytes_sent': ('bytes_sent', 'Bajty wysłane do miejsca docelowego w ostatniej kopii'),
+    'compression_ratio': ('compression_ratio', 'Współczynnik kompresji ostatniej kopii'),
+    'files_per_second': ('files_per_s', 'Liczba plików na sekundę w ostatniej kopii'),
+    'throughput_bytes_per_second': ('bytes_per_s', 'Przepustowość ostatniej kopii w bajtach na sekundę'),
+    'connections': ('connects', 'Nowe połączenia z serwerem w ostatniej kopii'),
+    'connect_seconds': ('connect_seconds', 'Czas nawiązywania połączeń w ostatniej kopii')
+}
+
+_write_lock = threading.Lock()
+
+
+class RunMetrics:
+    # Pomiary jednego uruchomienia kopii: czasy faz, liczniki bajtów i
+    # plików oraz wartości pochodne. Faza liczona jest jako czas ścienny, w
+    # którym trwa przynajmniej jedno jej wystąpienie - równoległe wysyłanie
+    # z kilku wątków nie sumuje się ponad czas rzeczywisty. W trybie
+    # strumieniowym fazy archive/dump i upload nakładają się na siebie.
+    def __init__(self, name='', kind='files', progress=None):
+        self.name = name
+        self.kind = kind
+        self.progress = progress
+        self.started = datetime.now()
+        self.started_monotonic = time.monotonic()
+        self.finished = None
+        self.phases = {}
+        self.counters = {}
+        self.current_phase = None
+        self.success = None
+        self.message = ''
+        self._active = {}
+        self._last_tick = 0.0
+        self._lock = threading.Lock()
+        self._tick_lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        now = time.monotonic()
+        with self._lock:
+            count, since = self._active.get(name, (0, now))
+            self._active[name] = (count + 1, since)
+            self.phases.setdefault(name, 0.0)
+            self.current_phase = name
+        self.tick(force=True)
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                count, since = self._active[name]
+                if count == 1:
+                    del self._active[name]
+                    self.phases[name] += now - since
+                    if self.current_phase == name:
+                        # Pasek postępu wraca do fazy, która nadal trwa
+                        self.current_phase = next(reversed(self._active), None)
+                else:
+                    self._active[name] = (count - 1, since)
+
+    def add(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_compression(self, stats):
+        self.add('bytes_in', stats.get('bytes_in', 0))
+        self.add('bytes_out', stats.get('bytes_out', 0))
+        self.add('compress_seconds', stats.get('seconds', 0.0))
+
+    def add_connections(self, before, after):
+        # Różnica metryk puli połączeń (wspólnej dla wszystkich zadań procesu)
+        self.add('connects', after['connects'] - before['connects'])
+        self.add('connect_seconds', after['connect_seconds_total'] - before['connect_seconds_total'])
+
+    def count_items(self, items):
+        # Wynik skanowania przekazywany dalej z licznikiem plików i bajtów
+        # oraz czasem, przez który zapis archiwum czekał na skaner
+        iterator = iter(items)
+        while True:
+            started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            st = item[2]
+            with self._lock:
+                self.counters['scan_wait_seconds'] = self.counters.get('scan_wait_seconds', 0.0) + time.monotonic() - started
+                if stat.S_ISREG(st.st_mode):
+                    self.counters['files'] = self.counters.get('files', 0) + 1
+                    self.counters['bytes_read'] = self.counters.get('bytes_read', 0) + st.st_size
+            self.tick()
+            yield item
+
+    def tick(self, force=False):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_tick < PROGRESS_INTERVAL:
+            return
+        # Pasek postępu odświeża jeden wątek naraz, pozostałe go pomijają
+        if not self._tick_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_tick = now
+            self.progress(self)
+        finally:
+            self._tick_lock.release()
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return max(end - self.started_monotonic, 1e-6)
+
+    def finish(self, success, message):
+        self.finished = time.monotonic()
+        self.success = success
+        self.message = message
+        if self.progress is not None and hasattr(self.progress, 'close'):
+            self.progress.close(self)
+
+    def to_dict(self):
+        with self._lock:
+            phases = dict(self.phases)
+            now = time.monotonic()
+            for name, (count, since) in self._active.items():
+                phases[name] += now - since
+            counters = dict(self.counters)
+        seconds = self.elapsed()
+        report = {
+            'name': self.name,
+            'kind': self.kind,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round(seconds, 3),
+            'success': self.success,
+            'message': self.message,
+            'phases': {name: round(value, 3) for name, value in phases.items()}
+        }
+        report.update({name: round(value, 3) if isinstance(value, float) else value
+                       for name, value in counters.items()})
+        bytes_in = counters.get('bytes_in', 0)
+        bytes_out = counters.get('bytes_out', 0)
+        report['compression_ratio'] = round(bytes_in / bytes_out, 3) if bytes_out else 0.0
+        report['files_per_s'] = round(counters.get('files', 0) / seconds, 1)
+        report['bytes_per_s'] = round(max(bytes_in, counters.get('bytes_read', 0)) / seconds)
+        report['mb_per_s'] = round(report['bytes_per_s'] / (1024 * 1024), 2)
+        upload_seconds = phases.get('upload', 0.0)
+        if upload_seconds and counters.get('bytes_sent'):
+            report['upload_mb_per_s'] = round(counters['bytes_sent'] / upload_seconds / (1024 * 1024), 2)
+        return report
+
+
+class CountingReader:
+    # Plik do odczytu liczący bajty wysłane do miejsca docelowego
+    def __init__(self, fileobj, metrics, counter='bytes_sent'):
+        self.fileobj = fileobj
+        self.metrics = metrics
+        self.counter = counter
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if data:
+            self.metrics.add(self.counter, len(data))
+            self.metrics.tick()
+        return data
+
+
+class ProgressBar:
+    # Postęp kopii w jednym wierszu terminala (tryb interaktywny)
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.width = 0
+
+    def __call__(self, metrics):
+        counters = metrics.counters
+        megabytes = max(counters.get('bytes_read', 0), counters.get('bytes_in', 0)) / (1024 * 1024)
+        line = (f"[{metrics.current_phase or '-'}] plików: {counters.get('files', 0)}, "
+                f"odczytano {megabytes:.1f} MB, wysłano {counters.get('bytes_sent', 0) / (1024 * 1024):.1f} MB, "
+                f"{megabytes / metrics.elapsed():.1f} MB/s, {metrics.elapsed():.0f} s")
+        self.stream.write('\r' + line.ljust(self.width))
+        self.stream.flush()
+        self.width = len(line)
+
+    def close(self, metrics):
+        if self.width:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.width = 0
+
+
+def report_name(metrics):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', metrics.name)
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_report(metrics, report_dir):
+    # Ostatni raport każdego zadania: <report_dir>/<nazwa>.json
+    path = os.path.join(report_dir, report_name(metrics) + '.json')
+    with _write_lock:
+        write_atomic(path, json.dumps(metrics.to_dict(), indent=2))
+    return path
+
+
+def load_reports(report_dir):
+    reports = []
+    for path in sorted(glob.glob(os.path.join(report_dir, '*.json'))):
+        try:
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return reports
+
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(reports):
+    # Format tekstowy node_exporter (textfile collector): ostatnie
+    # uruchomienie każdego zadania
+    lines = []
+
+    def gauge(metric, help_text, samples):
+        name = f'{PROMETHEUS_PREFIX}_{metric}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{prometheus_label(label)}"' for key, label in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}')
+
+    def labels(report, **extra):
+        return dict({'name': report['name'], 'kind': report['kind']}, **extra)
+
+    gauge('last_run_timestamp_seconds', 'Początek ostatniego uruchomienia kopii',
+          [(labels(r), int(datetime.fromisoformat(r['started']).timestamp())) for r in reports])
+    gauge('last_run_success', 'Czy ostatnie uruchomienie kopii zakończyło się powodzeniem',
+          [(labels(r), 1 if r.get('success') else 0) for r in reports])
+    gauge('phase_seconds', 'Czas fazy ostatniego uruchomienia kopii',
+          [(labels(r, phase=phase), seconds) for r in reports for phase, seconds in r.get('phases', {}).items()])
+    for metric, (key, help_text) in PROMETHEUS_GAUGES.items():
+        gauge(metric, help_text, [(labels(r), r[key]) for r in reports if key in r])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(report_dir, path):
+    with _write_lock:
+        write_atomic(path, format_prometheus(load_reports(report_dir)))
+
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import errno
+import fcntl
+import os
+import stat
+from member_index import match_member
+from scanner import ExcludeRules, TreeScanner
+from sparse import data_segments
+from throttle import default_throttle
+
+MIRROR_SUFFIX = '.mirror'
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# Błędy, po których copy_file_range zastępowane jest zwykłym kopiowaniem
+COPY_RANGE_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+def is_mirror_name(name):
+    return name.endswith(MIRROR_SUFFIX)
+
+
+def copy_segments(source, target, segments, copy_range):
+    for offset, length in segments:
+        position = offset
+        end = offset + length
+        while position < end:
+            count = min(COPY_CHUNK_SIZE, end - position)
+            if copy_range:
+                copied = os.copy_file_range(source.fileno(), target.fileno(), count, position, position)
+            else:
+                source.seek(position)
+                target.seek(position)
+                copied = target.write(source.read(count))
+            if not copied:
+                raise IOError(f'Plik {source.name} skrócił się w trakcie kopiowania')
+            default_throttle.consume('read_kbps', copied)
+            position += copied
+
+
+def clone_file(source_path, target_path):
+    # Kolejno: reflink (FICLONE, btrfs/xfs - bloki współdzielone, bez
+    # kopiowania danych), copy_file_range (kopiowanie w jądrze, na części
+    # systemów plików również bez kopiowania) i zwykłe kopiowanie.
+    # Dziury w plikach rzadkich zostają zachowane. Zwraca użytą metodę.
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+        size = os.fstat(source.fileno()).st_size
+        segments = data_segments(source.fileno(), size) or [(0, size)]
+        try:
+            copy_segments(source, target, segments, True)
+            method = 'copy_file_range'
+        except OSError as e:
+            if e.errno not in COPY_RANGE_UNSUPPORTED:
+                raise
+            copy_segments(source, target, segments, False)
+            method = 'copy'
+        target.truncate(size)
+        return method
+
+
+def mirror_tree(items, target_root, previous_root=None, patterns=None, root_name=''):
+    # Kopia drzewa jako zwykłe pliki. Plik niezmieniony od poprzedniej kopii
+    # lustrzanej (rozmiar i mtime) klonowany jest z niej, więc na btrfs/xfs
+    # kolejna kopia kosztuje prawie wyłącznie operacje na metadanych.
+    stats = {'files': 0, 'bytes': 0, 'reused': 0, 'reflink': 0, 'copy_file_range': 0, 'copy': 0}
+    directories = []
+    os.makedirs(target_root, exist_ok=True)
+    for rel_path, path, st in items:
+        if patterns and not match_member(os.path.join(root_name, rel_path), patterns):
+            continue
+        target = os.path.join(target_root, rel_path)
+        if stat.S_ISDIR(st.st_mode):
+            os.makedirs(target, exist_ok=True)
+            directories.append((target, st))
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.lexists(target):
+            os.remove(target)
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(path), target)
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        source = path
+        if previous_root is not None:
+            previous = os.path.join(previous_root, rel_path)
+            try:
+                previous_st = os.lstat(previous)
+                if (stat.S_ISREG(previous_st.st_mode) and previous_st.st_size == st.st_size
+                        and previous_st.st_mtime_ns == st.st_mtime_ns):
+                    source = previous
+                    stats['reused'] += 1
+            except FileNotFoundError:
+                pass
+        try:
+            stats[clone_file(source, target)] += 1
+        except FileNotFoundError:
+            # Plik usunięty między skanowaniem a kopiowaniem
+            continue
+        os.chmod(target, stat.S_IMODE(st.st_mode))
+        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+        stats['files'] += 1
+        stats['bytes'] += st.st_size
+    # Atrybuty katalogów ustawiane po zapisaniu ich zawartości
+    for target, st in reversed(directories):
+        os.chmod(target, stat.S_IMODE(st.st_mode))
+        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return stats
+
+
+def restore_mirror(mirror_path, destination_path, patterns=None):
+    # Kopia lustrzana zawiera katalog źródłowy - odtwarzany jest w destination_path
+    totals = {'files': 0, 'bytes': 0, 'reused': 0, 'reflink': 0, 'copy_file_range': 0, 'copy': 0}
+    for root_name in sorted(os.listdir(mirror_path)):
+        source = os.path.join(mirror_path, root_name)
+        if not os.path.isdir(source):
+            continue
+        scanner = TreeScanner(source, ExcludeRules(ignore_file=None))
+        stats = mirror_tree(scanner.walk(), os.path.join(destination_path, root_name),
+                            patterns=patterns, root_name=root_name)
+        for key, value in stats.items():
+            totals[key] += value
+    return totals
+
+
+def mirror_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def format_mirror_stats(stats):
+    return (f"plików: {stats['files']}, {stats['bytes'] / (1024 * 1024):.1f} MB, "
+            f"z poprzedniej kopii: {stats['reused']}, reflink: {stats['reflink']}, "
+            f"copy_file_range: {stats['copy_file_range']}, kopiowanie: {stats['copy']}")
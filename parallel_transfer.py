@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import all_errors
+from integrity import check_digest
+from resumable import retry_with_backoff
+from throttle import ThrottledReader, default_throttle
+
+BLOCK_SIZE = 256 * 1024
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+VOLUME_PATTERN = re.compile(r'^(?P<base>.+)\.part(?P<index>\d{3})$')
+
+
+def volume_name(remote_name, index):
+    return f'{remote_name}.part{index:03d}'
+
+
+def group_volumes(names):
+    # Archiwum wysłane w woluminach (nazwa.part000, ...) widoczne jest pod nazwą bazową
+    grouped = []
+    for name in names:
+        match = VOLUME_PATTERN.match(name)
+        base = match.group('base') if match else name
+        if base not in grouped:
+            grouped.append(base)
+    return grouped
+
+
+def find_volumes(names, remote_name):
+    matches = (VOLUME_PATTERN.match(name) for name in names)
+    return sorted(match.group(0) for match in matches if match and match.group('base') == remote_name)
+
+
+def segment_ranges(size, streams, min_segment=MIN_SEGMENT_SIZE):
+    count = max(1, min(streams, -(-size // min_segment)))
+    segment = -(-size // count) if size else 0
+    if not segment:
+        return [(0, 0)]
+    return [(offset, min(segment, size - offset)) for offset in range(0, size, segment)]
+
+
+class ParallelTransfer:
+    # Przesyłanie jednego archiwum w segmentach po N połączeniach naraz.
+    # SFTP zapisuje i czyta z przesunięciem, FTP pobiera segmenty przez REST.
+    # Wiele serwerów FTP odrzuca REST poza końcem pliku przy STOR, dlatego
+    # wysyłka FTP dzieli archiwum na woluminy składane przy pobieraniu.
+    # Pojedynczy strumień TCP nie wysyca łącza o dużym opóźnieniu.
+    def __init__(self, pool, kind, settings, streams, retries=0, backoff=5):
+        self.pool = pool
+        self.kind = kind
+        self.settings = settings
+        self.streams = max(1, int(streams))
+        self.retries = retries
+        self.backoff = backoff
+
+    def _stats(self, size, started, segments):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        return {
+            'streams': segments,
+            'bytes': size,
+            'seconds': elapsed,
+            'mb_per_s': size / elapsed / (1024 * 1024)
+        }
+
+    def _run(self, worker, tasks, *args, completed=None):
+        with ThreadPoolExecutor(min(len(tasks), self.streams), thread_name_prefix='transfer') as executor:
+            # Każdy segment ponawiany jest niezależnie - pozostałe nie czekają
+            futures = [executor.submit(retry_with_backoff, lambda task=task: worker(*args, *task),
+                                       self.retries, self.backoff) for task in tasks]
+            for task, future in zip(tasks, futures):
+                future.result()
+                if completed is not None:
+                    completed(*task)
+
+    @staticmethod
+    def _hash_range(digest, local_path, offset, length):
+        # Zakresy dodawane w kolejności pliku, gdy ich segment jest gotowy -
+        # liczenie sumy nakłada się na przesyłanie pozostałych segmentów
+        with open(local_path, 'rb') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+
+    def upload(self, local_path, remote_name, checksum=None):
+        # checksum - SHA-256 archiwum z kompresora; suma wysłanych segmentów
+        # złożonych w kolejności musi się z nią zgadzać
+        started = time.monotonic()
+        size = os.path.getsize(local_path)
+        ranges = segment_ranges(size, self.streams)
+        digest = hashlib.sha256()
+        if self.kind == 'ftp':
+            names = [volume_name(remote_name, i) for i in range(len(ranges))] if len(ranges) > 1 else [remote_name]
+            self._run(self._upload_ftp_volume, list(zip(names, ranges)), local_path,
+                      completed=lambda name, segment: self._hash_range(digest, local_path, *segment))
+        else:
+            with self.pool.connection('ssh', self.settings) as connection:
+                connection.sftp.open(remote_name, 'wb').close()
+            self._run(self._upload_sftp_segment, ranges, local_path, remote_name,
+                      completed=lambda offset, length: self._hash_range(digest, local_path, offset, length))
+            names = [remote_name]
+        check_digest(remote_name, checksum, digest.hexdigest())
+
+        # Weryfikacja złożonego pliku po stronie serwera
+        remote_size = sum(self.remote_sizes(names))
+        if remote_size != size:
+            raise IOError(f'Niezgodny rozmiar pliku na serwerze: {remote_size} zamiast {size} bajtów')
+        return self._stats(size, started, len(ranges))
+
+    def download(self, remote_name, local_path, volumes=None, checksum=None):
+        # checksum - SHA-256 z katalogu kopii, sprawdzany na złożonym pliku
+        started = time.monotonic()
+        if volumes:
+            # Woluminy pobierane równolegle w miejsca wynikające z ich rozmiarów
+            sizes = self.remote_sizes(volumes)
+            offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+            tasks = [(name, 0, offset, length, True) for name, offset, length in zip(volumes, offsets, sizes)]
+            size = sum(sizes)
+        else:
+            size = self.remote_sizes([remote_name])[0]
+            tasks = [(remote_name, offset, offset, length, offset + length == size)
+                     for offset, length in segment_ranges(size, self.streams)]
+        with open(local_path, 'wb') as f:
+            f.truncate(size)
+        worker = self._download_ftp_segment if self.kind == 'ftp' else self._download_sftp_segment
+        digest = hashlib.sha256()
+
+        def completed(name, remote_offset, local_offset, length, to_end):
+            self._hash_range(digest, local_path, local_offset, length)
+
+        self._run(worker, tasks, local_path, completed=completed)
+        if os.path.getsize(local_path) != size:
+            raise IOError(f'Niekompletne pobranie pliku {remote_name}')
+        check_digest(remote_name, checksum, digest.hexdigest())
+        return self._stats(size, started, len(tasks))
+
+    def remote_sizes(self, remote_names):
+        with self.pool.connection(self.kind, self.settings) as connection:
+            if self.kind == 'ftp':
+                connection.ftp.voidcmd('TYPE I')
+                return [connection.ftp.size(name) for name in remote_names]
+            return [connection.sftp.stat(name).st_size for name in remote_names]
+
+    def _upload_ftp_volume(self, local_path, remote_name, segment):
+        offset, length = segment
+        with self.pool.connection('ftp', self.settings) as connection:
+            with open(local_path, 'rb') as f:
+                f.seek(offset)
+                connection.ftp.storbinary(f'STOR {remote_name}', ThrottledReader(SegmentReader(f, length), 'upload_kbps'), BLOCK_SIZE)
+
+    def _upload_sftp_segment(self, local_path, remote_name, offset, length):
+        with self.pool.connection('ssh', self.settings) as connection:
+            with open(local_path, 'rb') as f, connection.sftp.open(remote_name, 'r+b') as remote_file:
+                remote_file.set_pipelined(True)
+                f.seek(offset)
+                remote_file.seek(offset)
+                remaining = length
+                while remaining:
+                    data = f.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    default_throttle.consume('upload_kbps', len(data))
+                    remote_file.write(data)
+                    remaining -= len(data)
+
+    def _download_ftp_segment(self, local_path, remote_name, remote_offset, local_offset, length, to_end):
+        connection = self.pool.acquire('ftp', self.settings)
+        try:
+            ftp = connection.ftp
+            ftp.voidcmd('TYPE I')
+            with open(local_path, 'r+b') as f:
+                f.seek(local_offset)
+                remaining = length
+                with ftp.transfercmd(f'RETR {remote_name}', rest=remote_offset or None) as conn:
+                    while remaining:
+                        data = conn.recv(min(BLOCK_SIZE, remaining))
+                        if not data:
+                            break
+                        f.write(data)
+                        remaining -= len(data)
+            if remaining:
+                raise IOError(f'Przerwane pobieranie segmentu {remote_offset} pliku {remote_name}')
+        except BaseException:
+            self.pool.discard(connection)
+            raise
+        if not to_end:
+            # Transfer przerwany przed końcem pliku - odpowiedź serwera (226/426)
+            # jest nieprzewidywalna, więc sesja nie wraca do puli
+            self.pool.discard(connection)
+            return
+        try:
+            ftp.voidresp()
+        except all_errors:
+            self.pool.discard(connection)
+            return
+        self.pool.release(connection)
+
+    def _download_sftp_segment(self, local_path, remote_name, remote_offset, local_offset, length, to_end):
+        with self.pool.connection('ssh', self.settings) as connection:
+            with open(local_path, 'r+b') as f, connection.sftp.open(remote_name, 'rb') as remote_file:
+                f.seek(local_offset)
+                # readv wysyła wiele żądań odczytu naraz, bez czekania na odpowiedzi
+                end = remote_offset + length
+                chunks = [(position, min(BLOCK_SIZE, end - position))
+                          for position in range(remote_offset, end, BLOCK_SIZE)]
+                for data in remote_file.readv(chunks):
+                    f.write(data)
+
+
+class SegmentReader:
+    # Odczyt ograniczony do jednego segmentu pliku
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def format_transfer_stats(stats):
+    return f"strumienie: {stats['streams']}, {stats['mb_per_s']:.1f} MB/s"
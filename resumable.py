@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import json
+import os
+import time
+from ftplib import error_perm, error_reply, error_temp
+import paramiko
+from throttle import ThrottledReader, default_throttle
+
+BLOCK_SIZE = 256 * 1024
+# Zakres jednego readv przy pobieraniu SFTP - ogranicza pamięć buforowaną
+# przez żądania w locie
+DOWNLOAD_WINDOW = 64 * BLOCK_SIZE
+MAX_BACKOFF = 300
+
+# Błędy sieciowe, po których ma sens ponowienie transferu. Błędy trwałe
+# FTP (5xx, np. brak uprawnień) są zgłaszane od razu.
+TRANSIENT_ERRORS = (OSError, EOFError, error_temp, error_reply, paramiko.SSHException)
+
+
+def retry_with_backoff(operation, retries=3, backoff=5):
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except error_perm:
+            raise
+        except TRANSIENT_ERRORS as e:
+            if attempt >= retries:
+                raise
+            delay = min(backoff * 2 ** attempt, MAX_BACKOFF)
+            print(f'Błąd transferu ({str(e)}), ponowienie za {delay:.0f} s...')
+            time.sleep(delay)
+            attempt += 1
+
+
+class Checkpoint:
+    # Stan przerwanego transferu: ile bajtów serwer potwierdził
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, state):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def update(self, **changes):
+        state = self.load() or {}
+        state.update(changes)
+        self.save(state)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ResumableTransfer:
+    # Transfer wznawiany od ostatniego potwierdzonego bajtu: FTP przez
+    # APPE/REST, SFTP przez przesunięcie w pliku. Rozmiar pliku po drugiej
+    # stronie jest źródłem prawdy o tym, co dotarło.
+    def __init__(self, pool, kind, settings, state_dir, retries=3, backoff=5):
+        self.pool = pool
+        self.kind = kind
+        self.settings = settings
+        self.state_dir = state_dir
+        self.retries = retries
+        self.backoff = backoff
+
+    def checkpoint(self, remote_name, direction):
+        return Checkpoint(os.path.join(self.state_dir, f'{self.kind}_{direction}_{remote_name}.checkpoint'))
+
+    def remote_size(self, connection, remote_name):
+        try:
+            if self.kind == 'ftp':
+                connection.ftp.voidcmd('TYPE I')
+                return connection.ftp.size(remote_name)
+            return connection.sftp.stat(remote_name).st_size
+        except (error_perm, IOError):
+            return 0
+
+    def upload(self, local_path, remote_name, backup=None):
+        # backup - dane potrzebne do zarejestrowania kopii, gdy wysyłanie
+        # zostanie dokończone dopiero w kolejnym uruchomieniu
+        size = os.path.getsize(local_path)
+        checkpoint = self.checkpoint(remote_name, 'upload')
+        previous = checkpoint.load()
+        checkpoint.save({
+            'kind': self.kind,
+            'local_path': os.path.abspath(local_path),
+            'remote_name': remote_name,
+            'size': size,
+            'confirmed': (previous or {}).get('confirmed', 0),
+            'backup': backup if backup is not None else (previous or {}).get('backup')
+        })
+        # Istniejący plik na serwerze jest kontynuowany tylko, jeśli to ten
+        # sam transfer - nowe wysyłanie zawsze zaczyna się od zera
+        resuming = [previous is not None]
+
+        def attempt():
+            with self.pool.connection(self.kind, self.settings) as connection:
+                confirmed = self.remote_size(connection, remote_name) if resuming[0] else 0
+                resuming[0] = True
+                if confirmed > size:
+                    confirmed = 0
+                checkpoint.update(confirmed=confirmed)
+                with open(local_path, 'rb') as f:
+                    f.seek(confirmed)
+                    if self.kind == 'ftp':
+                        command = 'APPE' if confirmed else 'STOR'
+                        connection.ftp.storbinary(f'{command} {remote_name}', ThrottledReader(f, 'upload_kbps'), BLOCK_SIZE)
+                    else:
+                        with connection.sftp.open(remote_name, 'r+b' if confirmed else 'wb') as remote_file:
+                            remote_file.set_pipelined(True)
+                            remote_file.seek(confirmed)
+                            for data in iter(lambda: f.read(BLOCK_SIZE), b''):
+                                default_throttle.consume('upload_kbps', len(data))
+                                remote_file.write(data)
+                uploaded = self.remote_size(connection, remote_name)
+                checkpoint.update(confirmed=uploaded)
+                if uploaded != size:
+                    raise IOError(f'Niekompletny plik na serwerze: {uploaded} z {size} bajtów')
+
+        retry_with_backoff(attempt, self.retries, self.backoff)
+        checkpoint.remove()
+
+    def download(self, remote_name, local_path):
+        # Częściowo pobrany plik (.part) jest kontynuowany przy kolejnej próbie
+        part_path = f'{local_path}.part'
+        checkpoint = self.checkpoint(remote_name, 'download')
+
+        def attempt():
+            with self.pool.connection(self.kind, self.settings) as connection:
+                size = self.remote_size(connection, remote_name)
+                confirmed = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                if confirmed > size:
+                    confirmed = 0
+                checkpoint.save({'kind': self.kind, 'remote_name': remote_name,
+                                 'local_path': os.path.abspath(part_path), 'size': size, 'confirmed': confirmed})
+                with open(part_path, 'r+b' if confirmed else 'wb') as f:
+                    f.seek(confirmed)
+                    f.truncate()
+                    if self.kind == 'ftp':
+                        connection.ftp.retrbinary(f'RETR {remote_name}', f.write, BLOCK_SIZE, rest=confirmed or None)
+                    else:
+                        # readv w oknach: wiele żądań w locie przy stałym zużyciu
+                        # pamięci (prefetch buforowałby całą resztę pliku)
+                        with connection.sftp.open(remote_name, 'rb') as remote_file:
+                            for offset in range(confirmed, size, DOWNLOAD_WINDOW):
+                                end = min(offset + DOWNLOAD_WINDOW, size)
+                                chunks = [(position, min(BLOCK_SIZE, end - position))
+                                          for position in range(offset, end, BLOCK_SIZE)]
+                                for data in remote_file.readv(chunks):
+                                    f.write(data)
+                if os.path.getsize(part_path) != size:
+                    raise IOError(f'Niekompletne pobranie pliku {remote_name}')
+
+        retry_with_backoff(attempt, self.retries, self.backoff)
+        os.replace(part_path, local_path)
+        checkpoint.remove()
+
+    def pending_uploads(self):
+        if not os.path.isdir(self.state_dir):
+            return []
+        pending = []
+        for name in sorted(os.listdir(self.state_dir)):
+            if name.startswith(f'{self.kind}_upload_') and name.endswith('.checkpoint'):
+                state = Checkpoint(os.path.join(self.state_dir, name)).load()
+                if state:
+                    pending.append(state)
+        return pending
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import re
+from datetime import datetime
+
+BACKUP_TIME = re.compile(r'(\d{8}_\d{6})')
+PERIODS = ('hourly', 'daily', 'weekly', 'monthly')
+
+
+def backup_time(name):
+    # Czas utworzenia zapisany w nazwie kopii (..._RRRRMMDD_GGMMSS...)
+    matches = BACKUP_TIME.findall(name)
+    if not matches:
+        return None
+    try:
+        return datetime.strptime(matches[-1], '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+
+
+def is_incremental(name):
+    return '_inc.' in name
+
+
+def period_key(moment, period):
+    if period == 'hourly':
+        return moment.strftime('%Y%m%d%H')
+    if period == 'daily':
+        return moment.strftime('%Y%m%d')
+    if period == 'weekly':
+        year, week, _ = moment.isocalendar()
+        return f'{year}W{week:02d}'
+    return moment.strftime('%Y%m')
+
+
+def retention_policy(settings):
+    # keep_last domyślnie równe max_backups; keep_hourly/daily/weekly/monthly
+    # zachowują najnowszą kopię z każdej z N ostatnich godzin, dni, tygodni
+    # i miesięcy (dziadek-ojciec-syn)
+    policy = {'keep_last': settings.get('max_backups', 0)}
+    policy.update({f'keep_{period}': 0 for period in PERIODS})
+    policy.update(settings.get('retention', {}))
+    return policy
+
+
+def order_backups(backups):
+    # Od najnowszej według czasu w nazwie, a nie kolejności alfabetycznej,
+    # więc różne prefiksy (backup_local_, backup_ftp_) nie wypierają się nawzajem
+    return sorted(backups, key=lambda name: (backup_time(name) or datetime.min, name), reverse=True)
+
+
+def kept_backups(backups, policy):
+    ordered = order_backups(backups)
+    limits = [policy.get('keep_last', 0)] + [policy.get(f'keep_{period}', 0) for period in PERIODS]
+    if not any(limit > 0 for limit in limits):
+        return set(ordered)
+
+    kept = set(ordered[:max(0, policy.get('keep_last', 0))])
+    for period in PERIODS:
+        count = policy.get(f'keep_{period}', 0)
+        seen = set()
+        for name in ordered:
+            moment = backup_time(name)
+            if moment is None:
+                continue
+            key = period_key(moment, period)
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            kept.add(name)
+
+    # Zachowana kopia przyrostowa wymaga wszystkich starszych kopii
+    # łańcucha aż do pełnej kopii bazowej
+    for i, name in enumerate(ordered):
+        if name in kept and is_incremental(name):
+            for older in ordered[i + 1:]:
+                kept.add(older)
+                if not is_incremental(older):
+                    break
+    return kept
+
+
+def expired_backups(backups, policy):
+    kept = kept_backups(backups, policy)
+    return [name for name in order_backups(backups) if name not in kept]
+
+
+def format_reclaimed(count, size, dry_run=False):
+    megabytes = size / (1024 * 1024)
+    if dry_run:
+        return f'Do usunięcia kopii zapasowych: {count}, do odzyskania {megabytes:.1f} MB (próba bez usuwania)'
+    return f'Usunięto kopii zapasowych: {count}, odzyskano {megabytes:.1f} MB'
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+import fnmatch
+import grp
+import io
+import os
+import posixpath
+import pwd
+import stat
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sparse import SPARSE_MIN_SIZE, sparse_member
+from throttle import ThrottledReader, default_throttle
+
+IGNORE_FILE = '.backupignore'
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_PREFETCH_SIZE = 64 * 1024 * 1024
+PREFETCH_THRESHOLD = 1024 * 1024
+MAX_PENDING_PER_WORKER = 64
+
+
+class ExcludeRules:
+    # Wzorce wykluczeń w stylu .gitignore (bez negacji): wzorzec bez '/'
+    # pasuje do nazwy na dowolnym poziomie, z '/' - do ścieżki względem
+    # katalogu, w którym go zdefiniowano, a '/' na końcu oznacza tylko
+    # katalogi. Pliki .backupignore dokładają wzorce dla swojego poddrzewa.
+    def __init__(self, patterns=(), max_file_size=0, ignore_file=IGNORE_FILE):
+        self.rules = [('', pattern) for pattern in patterns]
+        self.max_file_size = max_file_size
+        self.ignore_file = ignore_file
+
+    def load(self, path, rel_path, inherited):
+        if not self.ignore_file:
+            return inherited
+        try:
+            with open(os.path.join(path, self.ignore_file), 'r') as f:
+                lines = [line.strip() for line in f]
+        except (FileNotFoundError, NotADirectoryError):
+            return inherited
+        patterns = [(rel_path, line) for line in lines if line and not line.startswith(('#', '!'))]
+        return inherited + patterns if patterns else inherited
+
+    def excluded(self, rel_path, is_dir, size, rules):
+        if self.max_file_size and not is_dir and size > self.max_file_size:
+            return True
+        for base, pattern in rules:
+            if base:
+                if not rel_path.startswith(base + '/'):
+                    continue
+                path = rel_path[len(base) + 1:]
+            else:
+                path = rel_path
+            if pattern.endswith('/'):
+                if not is_dir:
+                    continue
+                pattern = pattern.rstrip('/')
+            if '/' in pattern:
+                if fnmatch.fnmatchcase(path, pattern.lstrip('/')):
+                    return True
+            elif fnmatch.fnmatchcase(posixpath.basename(path), pattern):
+                return True
+        return False
+
+
+class TreeScanner:
+    # Przeglądanie drzewa przez os.scandir w puli wątków: katalogi
+    # podrzędne są listowane z wyprzedzeniem, a wynik ma ustaloną kolejność
+    # (jak tar.add - nazwy posortowane, zawartość katalogu tuż po nim).
+    # Wykluczone katalogi nie są w ogóle odwiedzane.
+    def __init__(self, source_path, excludes=None, workers=DEFAULT_SCAN_WORKERS):
+        self.source_path = source_path
+        self.excludes = excludes or ExcludeRules()
+        self.workers = max(1, workers)
+
+    def _list(self, path, rel_path, inherited):
+        rules = self.excludes.load(path, rel_path, inherited)
+        entries = []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                entry_path = posixpath.join(rel_path, entry.name) if rel_path else entry.name
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                is_dir = stat.S_ISDIR(st.st_mode)
+                if self.excludes.excluded(entry_path, is_dir, st.st_size, rules):
+                    continue
+                entries.append((entry.name, entry_path, entry.path, st))
+        entries.sort(key=lambda item: item[0])
+        return entries, rules
+
+    def _walk(self, executor, listing):
+        entries, rules = listing.result()
+        children = {}
+        for name, rel_path, path, st in entries:
+            if stat.S_ISDIR(st.st_mode):
+                children[rel_path] = executor.submit(self._list, path, rel_path, rules)
+        for name, rel_path, path, st in entries:
+            yield rel_path, path, st
+            if rel_path in children:
+                yield from self._walk(executor, children.pop(rel_path))
+
+    def walk(self):
+        # Zwraca (ścieżka względna, pełna ścieżka, wynik lstat) bez katalogu głównego
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='scan',
+                                initializer=default_throttle.lower_thread_priority) as executor:
+            yield from self._walk(executor, executor.submit(self._list, self.source_path, '', self.excludes.rules))
+
+
+def tree_scanner(source_path, settings):
+    return TreeScanner(
+        source_path,
+        ExcludeRules(settings.get('exclude', []),
+                     int(settings.get('max_file_size_mb', 0) * 1024 * 1024),
+                     settings.get('ignore_file', IGNORE_FILE)),
+        settings.get('scan_workers', DEFAULT_SCAN_WORKERS)
+    )
+
+
+def read_small_file(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    default_throttle.consume('read_kbps', len(data))
+    return data
+
+
+def prefetch(items, workers=DEFAULT_SCAN_WORKERS, buffer_size=DEFAULT_PREFETCH_SIZE,
+             threshold=PREFETCH_THRESHOLD):
+    # Zawartość małych plików czytana z wyprzedzeniem w puli wątków, w
+    # granicach buffer_size bajtów; duże pliki czyta później zapis tar.
+    # Zwraca (ścieżka względna, pełna ścieżka, lstat, dane lub None) w
+    # kolejności wejścia.
+    pending = deque()
+    buffered = 0
+    max_pending = max(1, workers) * MAX_PENDING_PER_WORKER
+    with ThreadPoolExecutor(max(1, workers), thread_name_prefix='prefetch',
+                            initializer=default_throttle.lower_thread_priority) as executor:
+        for rel_path, path, st in items:
+            small = stat.S_ISREG(st.st_mode) and 0 < st.st_size <= threshold
+            size = st.st_size if small else 0
+            while pending and (buffered + size > buffer_size or len(pending) >= max_pending):
+                item, future, item_size = pending.popleft()
+                buffered -= item_size
+                yield item + (future.result() if future is not None else None,)
+            future = executor.submit(read_small_file, path) if small else None
+            pending.append(((rel_path, path, st), future, size))
+            buffered += size
+        while pending:
+            item, future, item_size = pending.popleft()
+            yield item + (future.result() if future is not None else None,)
+
+
+class TarInfoBuilder:
+    # TarInfo z wyniku lstat uzyskanego podczas skanowania - bez ponownego
+    # stat dla każdego pliku; nazwy użytkowników i grup zapamiętywane
+    def __init__(self, tar):
+        self.tar = tar
+        self.users = {}
+        self.groups = {}
+
+    def user(self, uid):
+        if uid not in self.users:
+            try:
+                self.users[uid] = pwd.getpwuid(uid)[0]
+            except KeyError:
+                self.users[uid] = ''
+        return self.users[uid]
+
+    def group(self, gid):
+        if gid not in self.groups:
+            try:
+                self.groups[gid] = grp.getgrgid(gid)[0]
+            except KeyError:
+                self.groups[gid] = ''
+        return self.groups[gid]
+
+    def build(self, path, arcname, st):
+        info = tarfile.TarInfo(arcname)
+        mode = st.st_mode
+        info.size = 0
+        if stat.S_ISREG(mode):
+            key = (st.st_ino, st.st_dev)
+            if st.st_nlink > 1 and key in self.tar.inodes:
+                # Kolejne dowiązanie twarde zapisywane jako odwołanie
+                info.type = tarfile.LNKTYPE
+                info.linkname = self.tar.inodes[key]
+            else:
+                info.type = tarfile.REGTYPE
+                info.size = st.st_size
+                if st.st_nlink > 1:
+                    self.tar.inodes[key] = arcname
+        elif stat.S_ISDIR(mode):
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+        elif stat.S_ISFIFO(mode):
+            info.type = tarfile.FIFOTYPE
+        elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+            info.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+            info.devmajor = os.major(st.st_rdev)
+            info.devminor = os.minor(st.st_rdev)
+        else:
+            # Gniazda i inne typy pomijane, jak w tar.add
+            return None
+        info.mode = stat.S_IMODE(mode)
+        info.uid = st.st_uid
+        info.gid = st.st_gid
+        info.mtime = st.st_mtime
+        info.uname = self.user(st.st_uid)
+        info.gname = self.group(st.st_gid)
+        return info
+
+
+def add_tree(tar, source_path, arcname, items, member_filter=None, sparse=False):
+    # Zapis drzewa do archiwum w kolejności skanowania; items pochodzą z
+    # prefetch(). sparse - duże pliki z dziurami jako człony GNU sparse.
+    builder = TarInfoBuilder(tar)
+    root = builder.build(source_path, arcname, os.lstat(source_path))
+    if member_filter is not None:
+        root = member_filter(root)
+    if root is not None:
+        tar.addfile(root)
+    for rel_path, path, st, data in items:
+        info = builder.build(path, posixpath.join(arcname, rel_path), st)
+        if info is None:
+            continue
+        fileobj = None
+        if info.type == tarfile.REGTYPE and info.size:
+            if data is not None:
+                # Rozmiar z chwili odczytu, gdyby plik zmienił się po skanowaniu
+                info.size = len(data)
+                fileobj = io.BytesIO(data)
+            else:
+                try:
+                    fileobj = open(path, 'rb')
+                except FileNotFoundError:
+                    # Plik usunięty między skanowaniem a archiwizacją
+                    continue
+        source = fileobj
+        try:
+            if sparse and source is not None and info.size >= SPARSE_MIN_SIZE and data is None:
+                fileobj = sparse_member(info, source) or source
+            if fileobj is not None and data is None:
+                # Limit odczytu źródła (read_kbps) dotyczy danych faktycznie czytanych z dysku
+                fileobj = ThrottledReader(fileobj, 'read_kbps')
+            if member_filter is not None:
+                info = member_filter(info)
+            if info is not None:
+                tar.addfile(info, fileobj)
+        finally:
+            if source is not None:
+                source.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import fcntl
+import os
+import random
+import signal
+import time
+from datetime import datetime, timedelta
+
+KEEPALIVE_INTERVAL = 30
+DEFAULT_JITTER = 300
+
+
+def parse_time(text):
+    hour, minute = text.split(':')
+    return int(hour), int(minute)
+
+
+def next_run(schedule, now):
+    # backup_schedule: hourly[@MM], daily[@HH:MM], weekly[@HH:MM] (poniedziałek),
+    # monthly[@HH:MM] (pierwszy dzień miesiąca) lub odstęp, np. 30m, 6h
+    schedule = str(schedule).strip().lower()
+    kind, _, at = schedule.partition('@')
+    if kind[:-1].isdigit() and kind[-1:] in ('m', 'h'):
+        minutes = int(kind[:-1]) * (60 if kind[-1] == 'h' else 1)
+        return now + timedelta(minutes=max(minutes, 1))
+    if kind == 'hourly':
+        candidate = now.replace(minute=int(at or 0), second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(hours=1)
+        return candidate
+
+    hour, minute = parse_time(at) if at else (0, 0)
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if kind == 'daily':
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        return candidate
+    if kind == 'weekly':
+        candidate -= timedelta(days=candidate.weekday())
+        if candidate <= now:
+            candidate += timedelta(days=7)
+        return candidate
+    if kind == 'monthly':
+        candidate = candidate.replace(day=1)
+        if candidate <= now:
+            candidate = (candidate + timedelta(days=32)).replace(day=1)
+        return candidate
+    raise ValueError(f'Nieobsługiwany harmonogram kopii zapasowych: {schedule}')
+
+
+class RunLock:
+    # Blokada pliku: drugie uruchomienie (cron lub demon) nie nakłada się
+    # na trwającą kopię. Blokada znika razem z procesem, nawet po awarii.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.file = open(self.path, 'a+')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            self.file = None
+            return False
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+        return True
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+class Scheduler:
+    # Tryb demona: zadanie uruchamiane zgodnie z harmonogramem, z losowym
+    # opóźnieniem, aby wiele hostów nie łączyło się z serwerem jednocześnie.
+    # Między zadaniami pula połączeń jest regularnie odświeżana.
+    def __init__(self, schedule, job, lock_path, jitter=DEFAULT_JITTER, pool=None):
+        self.schedule = schedule
+        self.job = job
+        self.lock_path = lock_path
+        self.jitter = jitter
+        self.pool = pool
+        self.running = True
+
+    def stop(self, *args):
+        self.running = False
+
+    def wait_until(self, moment):
+        while self.running:
+            remaining = (moment - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, KEEPALIVE_INTERVAL))
+            if self.pool is not None:
+                self.pool.keepalive()
+        return False
+
+    def run_once(self):
+        lock = RunLock(self.lock_path)
+        if not lock.acquire():
+            print('Poprzednie uruchomienie kopii zapasowej nadal trwa - pomijam')
+            return None
+        try:
+            return self.job()
+        finally:
+            lock.release()
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while self.running:
+            # Termin liczony po zakończeniu zadania - zbyt długie zadanie
+            # pomija kolejny termin zamiast się na niego nakładać
+            moment = next_run(self.schedule, datetime.now()) + timedelta(seconds=random.uniform(0, self.jitter))
+            print(f'Następna kopia zapasowa: {moment:%Y-%m-%d %H:%M:%S}')
+            if not self.wait_until(moment):
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f'Błąd podczas wykonywania zaplanowanej kopii zapasowej: {str(e)}')
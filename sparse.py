@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import errno
+import os
+import tarfile
+
+SPARSE_MIN_SIZE = 1024 * 1024
+SPARSE_MIN_HOLE = 64 * 1024
+# Rozmiar członu zapisywany jest w nagłówku ustar; większe wymagałyby
+# nagłówka PAX 'size', który nadpisałby rozmiar rzeczywisty pliku
+MAX_STORED_SIZE = 8 ** 11 - 1
+
+
+def data_segments(fd, size):
+    # Obszary z danymi według SEEK_DATA/SEEK_HOLE; None, gdy system plików
+    # nie zgłasza dziur. Dziura na końcu zapisywana jest jako (size, 0).
+    segments = []
+    offset = 0
+    try:
+        while offset < size:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            if start >= size:
+                break
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            segments.append((start, end - start))
+            offset = end
+    except OSError as e:
+        if e.errno != errno.ENXIO:
+            return None
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+    if not segments or segments[-1][0] + segments[-1][1] < size:
+        segments.append((size, 0))
+    return segments
+
+
+def is_sparse(segments, size):
+    return segments is not None and size - sum(length for offset, length in segments) >= SPARSE_MIN_HOLE
+
+
+def sparse_map(segments):
+    # Mapa formatu GNU sparse 1.0 na początku danych członu, dopełniona do bloku
+    lines = [str(len(segments))]
+    for offset, length in segments:
+        lines += [str(offset), str(length)]
+    data = ('\n'.join(lines) + '\n').encode()
+    return data + tarfile.NUL * (-len(data) % tarfile.BLOCKSIZE)
+
+
+class SparseReader:
+    # Dane członu rzadkiego: mapa, a po niej kolejne obszary z danymi;
+    # dziury nie są ani czytane, ani kompresowane
+    def __init__(self, fileobj, segments):
+        self.fileobj = fileobj
+        self.parts = [(None, sparse_map(segments))] + [segment for segment in segments if segment[1]]
+        self.remaining = None
+
+    def read(self, size=-1):
+        chunks = []
+        while self.parts and (size is None or size < 0 or size > 0):
+            source, value = self.parts[0]
+            if source is None:
+                data = value[:size] if size is not None and size >= 0 else value
+                rest = value[len(data):]
+                if rest:
+                    self.parts[0] = (None, rest)
+                else:
+                    self.parts.pop(0)
+            else:
+                if self.remaining is None:
+                    self.fileobj.seek(source)
+                    self.remaining = value
+                count = self.remaining if size is None or size < 0 else min(size, self.remaining)
+                data = self.fileobj.read(count)
+                if not data:
+                    raise IOError('Plik rzadki skrócił się w trakcie archiwizacji')
+                self.remaining -= len(data)
+                if not self.remaining:
+                    self.remaining = None
+                    self.parts.pop(0)
+            chunks.append(data)
+            if size is not None and size >= 0:
+                size -= len(data)
+        return b''.join(chunks)
+
+
+def sparse_member(info, fileobj):
+    # Zamienia TarInfo pliku z dziurami na człon GNU sparse 1.0 (PAX);
+    # zwraca None, gdy plik nie ma wystarczająco dużych dziur
+    segments = data_segments(fileobj.fileno(), info.size)
+    if not is_sparse(segments, info.size):
+        return None
+    stored = len(sparse_map(segments)) + sum(length for offset, length in segments)
+    if stored > MAX_STORED_SIZE:
+        return None
+    info.pax_headers = dict(info.pax_headers, **{
+        'GNU.sparse.major': '1',
+        'GNU.sparse.minor': '0',
+        'GNU.sparse.name': info.name,
+        'GNU.sparse.realsize': str(info.size)
+    })
+    info.size = stored
+    return SparseReader(fileobj, segments)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+import io
+import os
+import posixpath
+import shutil
+from ftplib import error_perm, error_temp
+from throttle import ThrottledReader, default_throttle
+from transport import default_pool
+
+READ_BLOCK_SIZE = 256 * 1024
+
+
+class LocalStorage:
+    # Wspólny interfejs miejsc docelowych: ścieżki względne wobec katalogu głównego
+    def __init__(self, root):
+        self.root = root
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(failed=exc_type is not None)
+
+    def path(self, name=''):
+        return os.path.join(self.root, name) if name else self.root
+
+    def makedirs(self, name=''):
+        os.makedirs(self.path(name), exist_ok=True)
+
+    def listdir(self, name=''):
+        try:
+            return os.listdir(self.path(name))
+        except FileNotFoundError:
+            return []
+
+    def read_bytes(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def read_range(self, name, offset, length):
+        with open(self.path(name), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def version(self, name):
+        # Rozmiar i czas modyfikacji pliku; None, gdy plik nie istnieje
+        try:
+            st = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def write_bytes(self, name, data):
+        # Zapis do pliku tymczasowego i atomowa podmiana nazwy
+        tmp_path = self.path(name) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+
+    def rename(self, source, name):
+        # Podmiana nazwy z nadpisaniem istniejącego pliku
+        os.replace(self.path(source), self.path(name))
+
+    def delete(self, name):
+        os.remove(self.path(name))
+
+    def rmdir(self, name):
+        os.rmdir(self.path(name))
+
+    def upload_file(self, local_path, name):
+        tmp_path = self.path(name) + '.tmp'
+        shutil.copyfile(local_path, tmp_path)
+        os.replace(tmp_path, self.path(name))
+
+    def download_file(self, name, local_path):
+        shutil.copyfile(self.path(name), local_path)
+
+    # Operacje na wielu plikach: tutaj kolejno, silnik asyncio
+    # (async_transport) wykonuje je z wieloma żądaniami w locie
+    def write_many(self, items):
+        for name, data in items:
+            self.write_bytes(name, data)
+
+    def read_many(self, names):
+        return [self.read_bytes(name) for name in names]
+
+    def size_many(self, names):
+        return [self.size(name) for name in names]
+
+    def delete_many(self, names):
+        for name in names:
+            self.delete(name)
+
+    def close(self, failed=False):
+        pass
+
+
+class FTPStorage(LocalStorage):
+    # Połączenie pobierane jest z puli i do niej zwracane przy zamknięciu
+    def __init__(self, connection, root='', pool=default_pool):
+        super().__init__(root)
+        self.connection = connection
+        self.pool = pool
+        self.ftp = connection.ftp
+
+    def path(self, name=''):
+        return posixpath.join(self.root, name) if self.root else name
+
+    def makedirs(self, name=''):
+        current = ''
+        for part in self.path(name).split('/'):
+            if not part:
+                continue
+            current = posixpath.join(current, part) if current else part
+            try:
+                self.ftp.mkd(current)
+            except error_perm:
+                pass
+
+    def listdir(self, name=''):
+        try:
+            names = self.ftp.nlst(self.path(name)) if self.path(name) else self.ftp.nlst()
+        except error_perm:
+            return []
+        return [posixpath.basename(n) for n in names]
+
+    def read_bytes(self, name):
+        buffer = io.BytesIO()
+        self.ftp.retrbinary(f'RETR {self.path(name)}', buffer.write)
+        return buffer.getvalue()
+
+    def read_range(self, name, offset, length):
+        # Odczyt od przesunięcia (REST) przerwany po potrzebnej liczbie bajtów
+        self.ftp.voidcmd('TYPE I')
+        buffer = bytearray()
+        with self.ftp.transfercmd(f'RETR {self.path(name)}', rest=offset or None) as conn:
+            while len(buffer) < length:
+                data = conn.recv(min(READ_BLOCK_SIZE, length - len(buffer)))
+                if not data:
+                    break
+                buffer += data
+        try:
+            self.ftp.voidresp()
+        except error_temp:
+            # 426 - serwer potwierdza przerwanie transferu przed końcem pliku
+            pass
+        return bytes(buffer)
+
+    def size(self, name):
+        self.ftp.voidcmd('TYPE I')
+        return self.ftp.size(self.path(name))
+
+    def version(self, name):
+        try:
+            size = self.size(name)
+            modified = self.ftp.sendcmd(f'MDTM {self.path(name)}').split()[-1]
+        except error_perm:
+            return None
+        return [size, modified]
+
+    def write_bytes(self, name, data):
+        self.ftp.storbinary(f'STOR {self.path(name)}.tmp', ThrottledReader(io.BytesIO(data), 'upload_kbps'))
+        self.rename(name + '.tmp', name)
+
+    def rename(self, source, name):
+        try:
+            self.ftp.rename(self.path(source), self.path(name))
+        except error_perm:
+            # Część serwerów nie nadpisuje istniejącego pliku przy RNTO
+            self.ftp.delete(self.path(name))
+            self.ftp.rename(self.path(source), self.path(name))
+
+    def delete(self, name):
+        self.ftp.delete(self.path(name))
+
+    def rmdir(self, name):
+        self.ftp.rmd(self.path(name))
+
+    def upload_file(self, local_path, name):
+        with open(local_path, 'rb') as f:
+            self.ftp.storbinary(f'STOR {self.path(name)}', ThrottledReader(f, 'upload_kbps'), READ_BLOCK_SIZE)
+
+    def download_file(self, name, local_path):
+        with open(local_path, 'wb') as f:
+            self.ftp.retrbinary(f'RETR {self.path(name)}', f.write, READ_BLOCK_SIZE)
+
+    def close(self, failed=False):
+        if failed:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.release(self.connection)
+
+
+class SFTPStorage(FTPStorage):
+    def __init__(self, connection, root='', pool=default_pool):
+        LocalStorage.__init__(self, root)
+        self.connection = connection
+        self.pool = pool
+        self.sftp = connection.sftp
+
+    def makedirs(self, name=''):
+        current = ''
+        for part in self.path(name).split('/'):
+            if not part:
+                continue
+            current = posixpath.join(current, part) if current else part
+            try:
+                self.sftp.stat(current)
+            except IOError:
+                self.sftp.mkdir(current)
+
+    def listdir(self, name=''):
+        try:
+            return self.sftp.listdir(self.path(name) or '.')
+        except IOError:
+            return []
+
+    def read_bytes(self, name):
+        with self.sftp.open(self.path(name), 'rb') as f:
+            f.prefetch()
+            return f.read()
+
+    def read_range(self, name, offset, length):
+        end = offset + length
+        chunks = [(position, min(READ_BLOCK_SIZE, end - position)) for position in range(offset, end, READ_BLOCK_SIZE)]
+        with self.sftp.open(self.path(name), 'rb') as f:
+            return b''.join(f.readv(chunks))
+
+    def size(self, name):
+        return self.sftp.stat(self.path(name)).st_size
+
+    def version(self, name):
+        try:
+            st = self.sftp.stat(self.path(name))
+        except IOError:
+            return None
+        return [st.st_size, st.st_mtime]
+
+    def write_bytes(self, name, data):
+        with self.sftp.open(self.path(name) + '.tmp', 'wb') as f:
+            f.set_pipelined(True)
+            default_throttle.consume('upload_kbps', len(data))
+            f.write(data)
+        self.rename(name + '.tmp', name)
+
+    def rename(self, source, name):
+        try:
+            self.sftp.posix_rename(self.path(source), self.path(name))
+        except IOError:
+            self.sftp.rename(self.path(source), self.path(name))
+
+    def delete(self, name):
+        self.sftp.remove(self.path(name))
+
+    def rmdir(self, name):
+        self.sftp.rmdir(self.path(name))
+
+    def upload_file(self, local_path, name):
+        with open(local_path, 'rb') as f, self.sftp.open(self.path(name), 'wb') as remote_file:
+            remote_file.set_pipelined(True)
+            shutil.copyfileobj(ThrottledReader(f, 'upload_kbps'), remote_file, READ_BLOCK_SIZE)
+
+    def download_file(self, name, local_path):
+        self.sftp.get(self.path(name), local_path)
+
+
+def open_storage(config, backup_type, root='', pool=default_pool):
+    if backup_type in ('ftp', 'ssh') and config['backup_settings'].get('transport_engine', 'sync') == 'async':
+        from async_transport import open_async_storage
+
+        return open_async_storage(config, backup_type, root)
+    if backup_type == 'local':
+        return LocalStorage(os.path.join(config['backup_locations']['destination'], root))
+    if backup_type == 'ftp':
+        return FTPStorage(pool.acquire('ftp', config['ftp_settings']), root, pool)
+    if backup_type == 'ssh':
+        return SFTPStorage(pool.acquire('ssh', config['ssh_settings']), root, pool)
+    raise ValueError(f'Nieobsługiwany typ kopii zapasowej: {backup_type}')
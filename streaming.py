@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class BoundedPipe:
+    # Bufor w pamięci łączący wątek producenta (np. tarfile) z konsumentem
+    # (np. storbinary). Zapis blokuje się, gdy bufor jest pełny, więc zużycie
+    # pamięci jest ograniczone, a wolny odbiorca spowalnia kompresję.
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE):
+        self.capacity = max(int(capacity), 1)
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._error = None
+        self._aborted = False
+
+    def write(self, data, timeout=None):
+        # timeout ogranicza łączny czas oczekiwania na miejsce w pełnym
+        # buforze; po jego upływie zapis kończy się błędem TimeoutError
+        data = memoryview(data).cast('B')
+        total = len(data)
+        position = 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while position < total:
+                while len(self._buffer) >= self.capacity and not self._aborted:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError('Odbiorca strumienia nie nadąża z odczytem')
+                    self._cond.wait(remaining)
+                if self._aborted:
+                    raise BrokenPipeError('Odbiorca strumienia przerwał transfer')
+                size = min(self.capacity - len(self._buffer), total - position)
+                self._buffer += data[position:position + size]
+                position += size
+                self._cond.notify_all()
+        return total
+
+    def write_some(self, data, timeout):
+        # Zapis tylu bajtów, ile zmieści się w buforze w ciągu timeout;
+        # zwraca ich liczbę (0 - bufor cały czas pełny)
+        data = memoryview(data).cast('B')
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._buffer) >= self.capacity and not self._aborted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return 0
+                self._cond.wait(remaining)
+            if self._aborted:
+                raise BrokenPipeError('Odbiorca strumienia przerwał transfer')
+            size = min(self.capacity - len(self._buffer), len(data))
+            self._buffer += data[:size]
+            self._cond.notify_all()
+            return size
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def read(self, size=-1):
+        with self._cond:
+            while not self._buffer and not self._eof and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if size is None or size < 0:
+                size = len(self._buffer)
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._cond.notify_all()
+            return chunk
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # Koniec danych od strony producenta
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        # Błąd producenta - konsument dostanie go przy najbliższym odczycie
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def abort(self):
+        # Konsument przerwał odczyt - odblokuj producenta
+        with self._cond:
+            self._aborted = True
+            self._buffer.clear()
+            self._cond.notify_all()
+
+
+@contextmanager
+def producer_stream(produce, capacity=DEFAULT_BUFFER_SIZE):
+    # Uruchamia produce(pipe) w osobnym wątku i udostępnia pipe do odczytu
+    pipe = BoundedPipe(capacity)
+    errors = []
+
+    def run():
+        try:
+            produce(pipe)
+            pipe.close()
+        except BaseException as e:
+            errors.append(e)
+            pipe.fail(e)
+
+    thread = threading.Thread(target=run, name='backup-producer', daemon=True)
+    thread.start()
+    try:
+        yield pipe
+    except BaseException:
+        pipe.abort()
+        thread.join()
+        raise
+    pipe.abort()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+@contextmanager
+def consumer_stream(consume, capacity=DEFAULT_BUFFER_SIZE):
+    # Odwrotność producer_stream: consume(pipe) czyta w osobnym wątku to,
+    # co zostanie zapisane do udostępnionego pipe
+    pipe = BoundedPipe(capacity)
+    errors = []
+
+    def run():
+        try:
+            consume(pipe)
+        except BaseException as e:
+            errors.append(e)
+            pipe.abort()
+
+    thread = threading.Thread(target=run, name='backup-consumer', daemon=True)
+    thread.start()
+    try:
+        yield pipe
+    except BaseException as e:
+        pipe.fail(e)
+        thread.join()
+        if errors and isinstance(e, BrokenPipeError):
+            raise errors[0]
+        raise
+    pipe.close()
+    thread.join()
+    if errors:
+        raise errors[0]
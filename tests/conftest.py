@@ -0,0 +1,77 @@
+import os
+import sys
+import textwrap
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Na końcu - benchmarks/transport.py nie może przesłonić modułu transport
+sys.path.append(os.path.join(ROOT, 'benchmarks'))
+
+
+def start_server(kind, tmp_path):
+    servers = pytest.importorskip('servers')
+    if kind == 'ftp':
+        pytest.importorskip('pyftpdlib')
+        return servers.FTPServer(str(tmp_path / 'remote')).start()
+    return servers.SFTPServer(str(tmp_path / 'remote'), str(tmp_path / 'keys')).start()
+
+
+@pytest.fixture(params=['ftp', 'ssh'])
+def server(request, tmp_path):
+    # Lokalny serwer FTP lub SFTP z benchmarks/servers.py; pliki w tmp_path/remote
+    server = start_server(request.param, tmp_path)
+    server.kind = request.param
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    server = start_server('ftp', tmp_path)
+    server.kind = 'ftp'
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    # Konfiguracja domyślna z katalogiem stanu w tmp_path i miejscem docelowym
+    # na lokalnym serwerze (lub w katalogu, gdy server=None)
+    from backup_manager import default_config
+
+    def make(source, server=None, **backup_settings):
+        config = default_config()
+        config['backup_locations'].update(source=str(source), type=server.kind if server else 'local',
+                                          destination='' if server else str(tmp_path / 'backups'))
+        if server is not None:
+            config[f'{server.kind}_settings'].update(server.settings())
+        config['backup_settings'].update(progress=False, state_dir=str(tmp_path / 'state'),
+                                         retry_backoff=0, **backup_settings)
+        return config
+    return make
+
+
+@pytest.fixture
+def fake_program(tmp_path, monkeypatch):
+    # Narzędzia bazy danych (mysqldump, pg_dump...) zastąpione skryptami
+    # Pythona w katalogu na początku PATH
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def make(name, code):
+        path = bin_dir / name
+        path.write_text(f'#!{sys.executable}\nimport os, sys\n' + textwrap.dedent(code))
+        path.chmod(0o755)
+    return make
+
+
+@pytest.fixture
+def db_config(make_config, tmp_path):
+    def make(db_type, server=None, **database_settings):
+        config = make_config(tmp_path, server)
+        config['database_settings'].update(type=db_type, host='localhost', port=3306, database='app',
+                                           username='kopie', password='haslo', **database_settings)
+        return config
+    return make
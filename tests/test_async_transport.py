@@ -0,0 +1,69 @@
+import itertools
+import os
+import pytest
+from async_transport import AsyncEngine, AsyncStorage, default_engine, session_type
+from file_handler import FileHandler
+from transport import ConnectionPool, default_pool
+
+
+def test_storage_batches_round_trip(server):
+    pool = ConnectionPool()
+    engine = AsyncEngine(pool)
+    storage = AsyncStorage(engine, server.kind, server.settings(), 'kopie', max_in_flight=4)
+    storage.makedirs()
+    items = [(f'plik_{number}.bin', os.urandom(1000 + number)) for number in range(10)]
+    storage.write_many(items)
+    assert sorted(storage.listdir()) == sorted(name for name, data in items)
+    assert storage.read_many([name for name, data in items]) == [data for name, data in items]
+    assert storage.size_many(['plik_3.bin', 'plik_0.bin']) == [1003, 1000]
+    assert storage.read_range('plik_9.bin', 10, 20) == items[9][1][10:30]
+
+    storage.write_bytes('plik_0.bin', b'nowa wersja')
+    assert storage.read_bytes('plik_0.bin') == b'nowa wersja'
+    storage.delete_many([name for name, data in items])
+    assert storage.listdir() == []
+    engine.close_all()
+    pool.close_all()
+
+
+def test_missing_file_raises_file_not_found(server):
+    pool = ConnectionPool()
+    engine = AsyncEngine(pool)
+    storage = AsyncStorage(engine, server.kind, server.settings())
+    with pytest.raises(OSError):
+        storage.read_bytes('brak.bin')
+    assert storage.version('brak.bin') is None
+    # Sesja nadal działa po błędzie operacji
+    storage.write_bytes('jest.bin', b'dane')
+    assert storage.read_bytes('jest.bin') == b'dane'
+    engine.close_all()
+    pool.close_all()
+
+
+def test_backup_and_restore_with_async_engine(server, make_config, tmp_path, monkeypatch):
+    counter = itertools.count(1)
+    monkeypatch.setattr(FileHandler, 'create_backup_name',
+                        lambda self, backup_type: f'{self.backup_prefix()}{backup_type}_20240101_{next(counter):06d}')
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.bin').write_bytes(os.urandom(512 * 1024))
+    handler = FileHandler(make_config(source, server, transport_engine='async', max_backups=1))
+    try:
+        assert handler.backup(str(source))[0]
+        assert handler.backup(str(source))[0]
+        backups = handler.list_backups(server.kind)
+        # Starsza kopia usunięta operacjami zbiorczymi silnika
+        assert len(backups) == 1
+        restored = tmp_path / 'restored'
+        success, message = getattr(handler, f'restore_{server.kind}')(backups[0], str(restored))
+        assert success, message
+        assert (restored / 'dane' / 'plik.bin').read_bytes() == (source / 'plik.bin').read_bytes()
+    finally:
+        default_engine.close_all()
+        default_pool.close_all()
+
+
+def test_session_type_falls_back_to_threads(monkeypatch):
+    monkeypatch.setattr('async_transport.asyncssh', None)
+    monkeypatch.setattr('async_transport.aioftp', None)
+    assert session_type('ssh') == 'threads' and session_type('ftp') == 'threads'
@@ -0,0 +1,63 @@
+from catalog import Catalog, CatalogStore
+from file_handler import FileHandler
+from storage import LocalStorage
+from transport import ConnectionPool
+
+
+class CountingStorage(LocalStorage):
+    def __init__(self, root):
+        super().__init__(root)
+        self.reads = 0
+
+    def read_bytes(self, name):
+        self.reads += 1
+        return super().read_bytes(name)
+
+
+def entry(name, kind='files'):
+    return {'name': name, 'created': None, 'size': 1, 'sha256': None, 'job': None, 'kind': kind,
+            'level': 'full', 'parent': None}
+
+
+def test_catalog_names_and_find():
+    catalog = Catalog()
+    for name in ('backup_local_20240101_000000.tar.gz', 'backup_www_local_20240101_000000.tar.gz'):
+        catalog.add(entry(name))
+    catalog.add(entry('backup_db_20240101_000000.sql.gz', 'database'))
+    assert catalog.names('backup_', 'files') == ['backup_local_20240101_000000.tar.gz']
+    assert catalog.names('backup_db_', 'database') == ['backup_db_20240101_000000.sql.gz']
+    assert catalog.find('backup_www_local_20240101_000000') == 'backup_www_local_20240101_000000.tar.gz'
+    assert Catalog.from_bytes(catalog.to_bytes()).entries == catalog.entries
+
+
+def test_store_reads_catalog_only_after_it_changes(tmp_path):
+    storage = CountingStorage(str(tmp_path))
+    store = CatalogStore(str(tmp_path / 'state'), 'local:test')
+    assert store.load(storage) is None
+    store.update(storage, lambda catalog: catalog.add(entry('a.tar.gz')))
+    assert list(store.load(storage).entries) == ['a.tar.gz']
+    assert storage.reads == 0
+
+    # Zmiana z innego hosta (bez lokalnej kopii) - katalog pobierany ponownie
+    CatalogStore(str(tmp_path / 'other'), 'local:test').update(storage, lambda catalog: catalog.add(entry('b.tar.gz')))
+    assert sorted(store.load(storage).entries) == ['a.tar.gz', 'b.tar.gz']
+    assert storage.reads == 2
+
+
+def test_listing_uses_catalog_until_refresh(ftp_server, make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.txt').write_text('dane')
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, ftp_server), pool)
+    assert handler.backup(str(source))[0]
+    backups = handler.list_backups('ftp')
+    assert len(backups) == 1
+    assert handler.expected_checksum('ftp', backups[0]) is not None
+
+    # Archiwum dodane z pominięciem programu widać dopiero po odświeżeniu katalogu
+    (tmp_path / 'remote' / 'backup_ftp_20000101_000000.tar.gz').write_bytes(b'')
+    assert handler.list_backups('ftp') == backups
+    assert handler.refresh_catalog('ftp')[0]
+    assert handler.list_backups('ftp') == ['backup_ftp_20000101_000000.tar.gz'] + backups
+    pool.close_all()
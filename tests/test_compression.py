@@ -0,0 +1,63 @@
+import hashlib
+import io
+import os
+import tarfile
+import pytest
+import compression
+from compression import ParallelCompressor, codec_from_name, is_archive_name, open_decompressor, resolve_codec
+
+CODECS = ['gzip', 'xz', 'none',
+          pytest.param('zstd', marks=pytest.mark.skipif(compression.zstandard is None, reason='brak zstandard')),
+          pytest.param('lz4', marks=pytest.mark.skipif(compression.lz4frame is None, reason='brak lz4'))]
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('workers', [1, 4])
+def test_parallel_compressor_round_trip(codec, workers):
+    data = os.urandom(300 * 1024) + b'abc' * 200000 + os.urandom(1000)
+    output = io.BytesIO()
+    compressor = ParallelCompressor(output, codec=codec, workers=workers, block_size=64 * 1024)
+    for offset in range(0, len(data), 50000):
+        compressor.write(data[offset:offset + 50000])
+    compressor.close()
+
+    stats = compressor.stats()
+    archive = output.getvalue()
+    assert stats['bytes_in'] == len(data)
+    assert stats['bytes_out'] == len(archive)
+    assert stats['sha256'] == hashlib.sha256(archive).hexdigest()
+    # Bloki w oryginalnej kolejności, bez przerw w danych wejściowych
+    assert [block[0] for block in compressor.blocks] == list(range(0, len(data), 64 * 1024))
+    reader = open_decompressor(io.BytesIO(archive), codec)
+    assert b''.join(iter(lambda: reader.read(65536), b'')) == data
+
+
+def test_resolve_codec():
+    assert resolve_codec(True) == 'gzip'
+    assert resolve_codec(False) == 'none'
+    assert resolve_codec('LZMA') == 'xz'
+    with pytest.raises(ValueError):
+        resolve_codec('brotli')
+
+
+def test_codec_from_archive_name():
+    assert codec_from_name('kopia_20240101.tar.zst') == 'zstd'
+    assert codec_from_name('kopia_20240101.tar') == 'none'
+    assert is_archive_name('kopia.tar.xz') and not is_archive_name('kopia.tar.xz.tmp')
+
+
+@pytest.mark.parametrize('codec', ['xz', 'none'])
+def test_backup_archive_uses_configured_codec(make_config, tmp_path, codec):
+    from file_handler import FileHandler
+
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.bin').write_bytes(os.urandom(2 * 1024 * 1024))
+    handler = FileHandler(make_config(source, compress=codec, compression_workers=4))
+    success, message = handler.backup(str(source), str(tmp_path / 'backups'))
+    assert success, message
+    archive = [name for name in os.listdir(tmp_path / 'backups') if is_archive_name(name)][0]
+    assert codec_from_name(archive) == codec
+    with open(tmp_path / 'backups' / archive, 'rb') as f:
+        with tarfile.open(fileobj=open_decompressor(f, codec), mode='r|') as tar:
+            assert 'dane/plik.bin' in [member.name for member in tar]
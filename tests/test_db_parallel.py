@@ -0,0 +1,64 @@
+import json
+import os
+import tarfile
+from db_handler import DatabaseHandler, TableTimer
+
+PG_DUMP = '''
+    import json
+    ARGS = os.environ['FAKE_ARGS']
+    path = next(arg for arg in sys.argv if arg.startswith('--file='))[len('--file='):]
+    os.makedirs(path)
+    for number, table in enumerate(['klienci', 'zamowienia'], 3000):
+        sys.stderr.write(f'pg_dump: dumping contents of table "public.{table}"\\n')
+        open(os.path.join(path, f'{number}.dat.gz'), 'wb').write(table.encode())
+    open(os.path.join(path, 'toc.dat'), 'wb').write(b'PGDMP')
+    open(os.path.join(ARGS, 'pg_dump'), 'w').write(json.dumps(sys.argv[1:]))
+'''
+
+PG_RESTORE = '''
+    import json
+    ARGS = os.environ['FAKE_ARGS']
+    open(os.path.join(ARGS, 'pg_restore'), 'w').write(json.dumps(sys.argv[1:] + sorted(os.listdir(sys.argv[-1]))))
+    sys.stderr.write('pg_restore: processing item 3000 TABLE DATA public klienci\\n')
+    sys.stderr.write('pg_restore: finished item 3000 TABLE DATA public klienci\\n')
+'''
+
+
+def test_postgresql_directory_dump_and_restore(db_config, fake_program, tmp_path, monkeypatch):
+    args = tmp_path / 'args'
+    args.mkdir()
+    monkeypatch.setenv('FAKE_ARGS', str(args))
+    fake_program('pg_dump', PG_DUMP)
+    fake_program('pg_restore', PG_RESTORE)
+    handler = DatabaseHandler(db_config('postgresql', dump_format='directory', dump_jobs=3, restore_jobs=2))
+    success, message = handler.backup_database()
+    assert success, message
+    assert '--jobs=3' in json.loads((args / 'pg_dump').read_text())
+    assert set(handler.last_table_times) == {'klienci', 'zamowienia'}
+    backup_name = [name for name in os.listdir(tmp_path / 'backups') if name.endswith('.pgdump.tar')][0]
+    with tarfile.open(tmp_path / 'backups' / backup_name) as tar:
+        assert sorted(tar.getnames()) == ['dump', 'dump/3000.dat.gz', 'dump/3001.dat.gz', 'dump/toc.dat']
+
+    success, message = handler.restore_database(backup_name)
+    assert success, message
+    restore_args = json.loads((args / 'pg_restore').read_text())
+    assert '--jobs=2' in restore_args and '--clean' in restore_args
+    assert restore_args[-3:] == ['3000.dat.gz', '3001.dat.gz', 'toc.dat']
+
+
+def test_failed_directory_dump_reports_last_lines(db_config, fake_program, tmp_path):
+    fake_program('pg_dump', '''
+        sys.stderr.write('pg_dump: error: connection to server failed\\n')
+        sys.exit(1)
+    ''')
+    success, message = DatabaseHandler(db_config('postgresql', dump_format='directory')).backup_database()
+    assert not success
+    assert 'connection to server failed' in message
+
+
+def test_table_timer_reads_verbose_lines():
+    timer = TableTimer()
+    timer.feed('pg_restore: processing item 3000 TABLE DATA public klienci')
+    timer.feed('pg_restore: launching item 3001 TABLE DATA public zamowienia')
+    timer.feed('pg_restore: finished item 3000 TABLE DATA public klienci')
+    assert set(timer.times) == {'klienci'} and set(timer.started) == {'zamowienia'}
@@ -0,0 +1,39 @@
+import gzip
+import os
+from db_handler import DatabaseHandler
+
+DUMP = b'CREATE TABLE t (id INT);\n' + b'INSERT INTO t VALUES (1);\n' * 5000
+
+
+def test_dump_streams_to_destination_and_back(db_config, fake_program, tmp_path):
+    (tmp_path / 'dump.sql').write_bytes(DUMP)
+    fake_program('mysqldump', f'''
+        sys.stdout.buffer.write(open({str(tmp_path / 'dump.sql')!r}, 'rb').read())
+    ''')
+    fake_program('mysql', f'''
+        open({str(tmp_path / 'loaded.sql')!r}, 'wb').write(sys.stdin.buffer.read())
+    ''')
+    handler = DatabaseHandler(db_config('mysql'))
+    success, message = handler.backup_database()
+    assert success, message
+    names = [name for name in os.listdir(tmp_path / 'backups') if name.startswith('backup_db_')]
+    # Tylko skompresowany zrzut w miejscu docelowym, bez nieskompresowanej kopii
+    assert len(names) == 1 and names[0].endswith('.sql.gz')
+    assert gzip.decompress((tmp_path / 'backups' / names[0]).read_bytes()) == DUMP
+    assert handler.list_backups() == names
+
+    success, message = handler.restore_database(names[0])
+    assert success, message
+    assert (tmp_path / 'loaded.sql').read_bytes() == DUMP
+
+
+def test_failed_dump_reports_stderr(db_config, fake_program, tmp_path):
+    fake_program('pg_dump', '''
+        sys.stdout.write('-- częściowy zrzut\\n')
+        sys.stderr.write('FATAL: password authentication failed\\n')
+        sys.exit(1)
+    ''')
+    success, message = DatabaseHandler(db_config('postgresql')).backup_database()
+    assert not success
+    assert 'password authentication failed' in message
+    assert [name for name in os.listdir(tmp_path / 'backups') if name.startswith('backup_db_')] == []
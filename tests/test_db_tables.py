@@ -0,0 +1,71 @@
+import gzip
+import json
+import os
+from db_handler import DatabaseHandler, group_tables, table_files
+
+MYSQL = '''
+    ARGS = os.environ['FAKE_ARGS']
+    args = sys.argv[1:]
+    if any(arg.startswith('--execute=') for arg in args):
+        print('klienci\\t300\\nzamowienia\\t100\\nlogi\\t200')
+    elif '--unbuffered' in args:
+        # Sesja trzymająca FLUSH TABLES WITH READ LOCK
+        for line in sys.stdin:
+            open(os.path.join(ARGS, 'lock.log'), 'a').write(line)
+            if line.startswith("SELECT 'locked'"):
+                print('locked', flush=True)
+    else:
+        open(os.path.join(ARGS, 'loaded.sql'), 'ab').write(sys.stdin.buffer.read())
+'''
+
+MYSQLDUMP = '''
+    args = sys.argv[1:]
+    if '--no-data' in args:
+        sys.stdout.write('-- triggers\\n' if '--triggers' in args else '-- schema\\n')
+    else:
+        sys.stdout.write('/*!40101 SET NAMES utf8mb4 */;\\n')
+        for table in args[args.index('app') + 1:]:
+            sys.stdout.write(f'-- Dumping data for table `{table}`\\n')
+            sys.stdout.write(f'INSERT INTO `{table}` VALUES (1);\\n')
+'''
+
+
+def test_group_tables_balances_sizes():
+    groups = group_tables([('a', 500), ('b', 300), ('c', 250), ('d', 100)], 2)
+    assert groups == [['a', 'd'], ['b', 'c']]
+    assert group_tables([('a', 1)], 4) == [['a']]
+
+
+def test_table_files_avoid_collisions():
+    files = table_files(['Klienci', 'klienci', 'zamówienia'], '.gz')
+    assert files == {'Klienci': 'Klienci.sql.gz', 'klienci': 'klienci_1.sql.gz', 'zamówienia': 'zam_wienia.sql.gz'}
+
+
+def test_mysql_tables_dump_and_restore(db_config, fake_program, tmp_path, monkeypatch):
+    args = tmp_path / 'args'
+    args.mkdir()
+    monkeypatch.setenv('FAKE_ARGS', str(args))
+    fake_program('mysql', MYSQL)
+    fake_program('mysqldump', MYSQLDUMP)
+    handler = DatabaseHandler(db_config('mysql', dump_format='tables', dump_jobs=2, restore_jobs=2))
+    success, message = handler.backup_database()
+    assert success, message
+    # Wszystkie procesy mysqldump rozpoczęły transakcję pod wspólną blokadą
+    assert (args / 'lock.log').read_text().splitlines() == [
+        'FLUSH TABLES WITH READ LOCK;', "SELECT 'locked';", 'UNLOCK TABLES;']
+
+    backup_dir = [name for name in os.listdir(tmp_path / 'backups') if name.endswith('.tables')][0]
+    path = tmp_path / 'backups' / backup_dir
+    manifest = json.loads((path / 'manifest.json').read_text())
+    assert [table['name'] for table in manifest['tables']] == ['klienci', 'zamowienia', 'logi']
+    for table in manifest['tables']:
+        data = gzip.decompress((path / table['file']).read_bytes()).decode()
+        # Każdy plik tabeli ma nagłówek sesji i da się go wczytać osobno
+        assert data.startswith('/*!40101 SET NAMES utf8mb4 */;\n')
+        assert f"INSERT INTO `{table['name']}`" in data and data.count('INSERT') == 1
+
+    success, message = handler.restore_database(backup_dir)
+    assert success, message
+    loaded = (args / 'loaded.sql').read_text()
+    assert loaded.startswith('-- schema\n') and loaded.endswith('-- triggers\n')
+    assert loaded.count('INSERT') == 3
@@ -0,0 +1,147 @@
+import io
+import json
+import os
+import time
+import random
+import pytest
+import dedup
+from dedup import Chunker, DedupRepository, RepositoryLocked
+from file_index import FileIndex
+from storage import LocalStorage
+
+
+def chunk_sizes(chunker, data):
+    return [len(chunk) for chunk in chunker.chunks(io.BytesIO(data))]
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+@pytest.mark.parametrize('avg_size', [4096, 64 * 1024])
+def test_boundary_matches_byte_loop(avg_size):
+    chunker = Chunker(avg_size)
+    for seed, size in enumerate([chunker.min_size - 1, chunker.min_size + 1, avg_size, 3 * avg_size + 7,
+                                 chunker.max_size, chunker.max_size + 100]):
+        data = bytearray(random_bytes(size, seed))
+        end = min(len(data), chunker.max_size)
+        expected = len(data) if len(data) <= chunker.min_size else chunker.scan_bytes(data, min(avg_size, end), end)
+        assert chunker.boundary(data) == expected
+
+
+def test_chunks_without_numpy_are_identical(monkeypatch):
+    chunker = Chunker(8192)
+    data = random_bytes(400 * 1024, 1)
+    vectorised = chunk_sizes(chunker, data)
+    monkeypatch.setattr(dedup, 'numpy', None)
+    assert chunk_sizes(chunker, data) == vectorised
+
+
+def test_chunk_size_limits_and_content():
+    chunker = Chunker(8192)
+    data = random_bytes(1024 * 1024, 2) + b'\0' * 200000
+    chunks = list(chunker.chunks(io.BytesIO(data)))
+    assert b''.join(chunks) == data
+    assert all(chunker.min_size <= len(chunk) <= chunker.max_size for chunk in chunks[:-1])
+
+
+def test_insertion_shifts_only_nearby_boundaries():
+    chunker = Chunker(8192)
+    data = random_bytes(1024 * 1024, 3)
+    before = set(chunker.chunks(io.BytesIO(data)))
+    after = list(chunker.chunks(io.BytesIO(b'inserted' + data)))
+    # Fragmenty zależne od treści - wstawka na początku zmienia tylko pierwsze z nich
+    assert sum(1 for chunk in after if chunk in before) >= len(after) - 3
+
+
+def test_repository_round_trip_reuses_unchanged_files(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'a.bin').write_bytes(random_bytes(300 * 1024, 4))
+    (source / 'sub' / 'b.txt').write_text('zawartość')
+    index = FileIndex(str(tmp_path / 'index.db'))
+
+    with DedupRepository(LocalStorage(str(tmp_path / 'repo')), Chunker(16 * 1024)) as repository:
+        first, stats = repository.backup(str(source), 'backup_local_20240101_000000', index=index)
+        assert stats['duplicate_chunks'] == 0
+        second, stats = repository.backup(str(source), 'backup_local_20240102_000000', index=index)
+        assert stats['new_chunks'] == 0
+        assert stats['bytes_in'] == 300 * 1024 + len('zawartość'.encode())
+
+        (source / 'sub' / 'b.txt').write_text('zmieniona zawartość')
+        os.utime(source / 'sub' / 'b.txt', ns=(0, 10 ** 9))
+        third, stats = repository.backup(str(source), 'backup_local_20240103_000000', index=index)
+        assert stats['new_chunks'] == 1
+
+        repository.restore(third, str(tmp_path / 'out'))
+        repository.restore(first, str(tmp_path / 'old'))
+    assert (tmp_path / 'out' / 'src' / 'a.bin').read_bytes() == (source / 'a.bin').read_bytes()
+    assert (tmp_path / 'out' / 'src' / 'sub' / 'b.txt').read_text() == 'zmieniona zawartość'
+    assert (tmp_path / 'old' / 'src' / 'sub' / 'b.txt').read_text() == 'zawartość'
+
+
+def test_gc_removes_only_unreferenced_chunks(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    with DedupRepository(LocalStorage(str(tmp_path / 'repo')), Chunker(16 * 1024)) as repository:
+        (source / 'a.bin').write_bytes(random_bytes(100 * 1024, 5))
+        old, _ = repository.backup(str(source), 'backup_local_20240101_000000')
+        (source / 'a.bin').write_bytes(random_bytes(100 * 1024, 6))
+        new, _ = repository.backup(str(source), 'backup_local_20240102_000000')
+
+        removed, orphans, reclaimed = repository.gc([old], dry_run=True)
+        assert removed == [old] and orphans > 0 and reclaimed > 0
+        assert repository.list_snapshots() == [old, new]
+
+        assert repository.gc([old])[:2] == (removed, orphans)
+        assert repository.list_snapshots() == [new]
+        repository.restore(new, str(tmp_path / 'out'))
+    assert (tmp_path / 'out' / 'src' / 'a.bin').read_bytes() == (source / 'a.bin').read_bytes()
+
+
+def test_lock_heartbeat_keeps_long_running_lock_active(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, 'LOCK_REFRESH_SECONDS', 0.05)
+    repository = DedupRepository(LocalStorage(str(tmp_path / 'repo')))
+    with repository.lock():
+        time.sleep(0.3)
+        name = os.listdir(tmp_path / 'repo' / 'locks')[0]
+        info = json.loads((tmp_path / 'repo' / 'locks' / name).read_bytes())
+        assert info['refreshed'] > info['created']
+        # Kopia trwająca dłużej niż LOCK_STALE_SECONDS nadal blokuje odśmiecanie
+        monkeypatch.setattr(dedup, 'LOCK_STALE_SECONDS', time.time() - info['created'] - 0.01)
+        with pytest.raises(RepositoryLocked):
+            repository.gc([])
+    assert os.listdir(tmp_path / 'repo' / 'locks') == []
+
+
+def test_lock_without_refresh_is_stale(tmp_path):
+    storage = LocalStorage(str(tmp_path / 'repo'))
+    storage.makedirs('locks')
+    old = time.time() - dedup.LOCK_STALE_SECONDS - 1
+    storage.write_bytes('locks/shared-przerwana', json.dumps({'created': old, 'refreshed': old}).encode())
+    storage.write_bytes('locks/shared-stara', json.dumps({'created': old}).encode())
+    storage.write_bytes('locks/shared-trwa', json.dumps({'created': old, 'refreshed': time.time()}).encode())
+    repository = DedupRepository(storage)
+    assert repository.active_locks() == ['shared-trwa']
+
+
+def test_remote_backup_refreshes_lock_in_own_session(server, make_config, tmp_path, monkeypatch):
+    from file_handler import FileHandler
+    from transport import ConnectionPool
+
+    # Odświeżanie w trakcie wysyłania fragmentów nie może przeplatać się z
+    # poleceniami głównej sesji FTP/SFTP
+    monkeypatch.setattr(dedup, 'LOCK_REFRESH_SECONDS', 0.01)
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'a.bin').write_bytes(random_bytes(2 * 1024 * 1024, 7))
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server, repository_format='dedup', chunk_size_kb=64), pool)
+    success, message = handler.backup(str(source))
+    assert success, message
+    assert os.listdir(tmp_path / 'remote' / 'backup_repo' / 'locks') == []
+    snapshot = handler.list_backups(server.kind)[0]
+    success, message = getattr(handler, f'restore_{server.kind}')(snapshot, str(tmp_path / 'out'))
+    assert success, message
+    assert (tmp_path / 'out' / 'dane' / 'a.bin').read_bytes() == (source / 'a.bin').read_bytes()
+    pool.close_all()
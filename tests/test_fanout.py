@@ -0,0 +1,61 @@
+import time
+from fanout import LagExceeded, tee
+
+DATA = [bytes([i]) * 10000 for i in range(50)]
+
+
+def produce(writer):
+    for block in DATA:
+        writer.write(block)
+
+
+def collect(received, fail=None, delay=0):
+    def upload(target, reader):
+        chunks = []
+        while True:
+            data = reader.read(4096)
+            if not data:
+                break
+            if target == fail:
+                raise IOError('serwer odrzucił zapis')
+            time.sleep(delay if target == 'slow' else 0)
+            chunks.append(data)
+        received[target] = b''.join(chunks)
+    return upload
+
+
+def test_tee_delivers_same_stream_to_every_target():
+    received = {}
+    errors = tee(produce, ['a', 'b', 'c'], collect(received), capacity=16 * 1024)
+    assert errors == [None, None, None]
+    assert received == {name: b''.join(DATA) for name in 'abc'}
+
+
+def test_failed_target_does_not_stop_others():
+    received = {}
+    errors = tee(produce, ['a', 'b'], collect(received, fail='b'), capacity=16 * 1024)
+    assert errors[0] is None and isinstance(errors[1], IOError)
+    assert received['a'] == b''.join(DATA)
+
+
+def test_lagging_target_is_detached():
+    received = {}
+    errors = tee(produce, ['fast', 'slow'], collect(received, delay=0.05), capacity=8 * 1024, lag_seconds=0.2)
+    assert errors[0] is None and isinstance(errors[1], LagExceeded)
+    assert received['fast'] == b''.join(DATA)
+
+
+def test_equally_fast_targets_all_finish():
+    # Producent szybszy od wszystkich miejsc - żadne nie zostaje w tyle za innym
+    received = {}
+
+    def upload(target, reader):
+        chunks = []
+        for data in iter(lambda: reader.read(4096), b''):
+            time.sleep(0.005)
+            chunks.append(data)
+        received[target] = b''.join(chunks)
+
+    errors = tee(produce, ['a', 'b', 'c'], upload, capacity=16 * 1024, lag_seconds=0.2)
+    assert errors == [None, None, None]
+    assert received == {name: b''.join(DATA) for name in 'abc'}
@@ -0,0 +1,49 @@
+import itertools
+import os
+import tarfile
+from datetime import datetime, timedelta
+from file_handler import FileHandler
+from file_index import needs_full_backup
+
+
+def test_incremental_chain_restores_latest_state(make_config, tmp_path, monkeypatch):
+    # Kolejne kopie w tej samej sekundzie dostają kolejne znaczniki czasu
+    counter = itertools.count(1)
+    monkeypatch.setattr(FileHandler, 'create_backup_name',
+                        lambda self, backup_type: f'{self.backup_prefix()}{backup_type}_20240101_{next(counter):06d}')
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'a.txt').write_text('pierwsza wersja')
+    (source / 'b.txt').write_text('do usunięcia')
+    backups = tmp_path / 'backups'
+    handler = FileHandler(make_config(source, incremental=True))
+    assert handler.backup(str(source), str(backups))[0]
+
+    (source / 'a.txt').write_text('druga, dłuższa wersja')
+    (source / 'b.txt').unlink()
+    (source / 'c.txt').write_text('nowy plik')
+    assert handler.backup(str(source), str(backups))[0]
+
+    names = handler.list_backups('local')
+    assert len(names) == 2 and '_inc.' in names[1]
+    with tarfile.open(backups / names[1]) as tar:
+        # Kopia przyrostowa zawiera tylko zmienione pliki i manifest
+        assert sorted(tar.getnames()) == ['.backup_manifest.json', 'dane/a.txt', 'dane/c.txt']
+
+    restored = tmp_path / 'restored'
+    chain = handler.backup_chain(names, names[1])
+    assert chain == names
+    for name in chain:
+        assert handler.restore_local(str(backups / name), str(restored))[0]
+    assert sorted(os.listdir(restored / 'dane')) == ['a.txt', 'c.txt']
+    assert (restored / 'dane' / 'a.txt').read_text() == 'druga, dłuższa wersja'
+
+
+def test_periodic_full_backup():
+    last_full = datetime.now().isoformat(timespec='seconds')
+    meta = {'last_backup': 'kopia', 'last_full': last_full, 'incremental_count': 2}
+    assert not needs_full_backup(meta, {'full_backup_every': 3})
+    assert needs_full_backup(dict(meta, incremental_count=3), {'full_backup_every': 3})
+    old = (datetime.now() - timedelta(days=8)).isoformat(timespec='seconds')
+    assert needs_full_backup(dict(meta, last_full=old), {'full_backup_every': 0, 'full_backup_interval_days': 7})
+    assert needs_full_backup({}, {})
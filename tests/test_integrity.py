@@ -0,0 +1,80 @@
+import os
+from compression import is_archive_name
+from file_handler import FileHandler
+from member_index import MemberIndex, index_name
+from transport import ConnectionPool
+
+
+def make_backup(make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'duzy.bin').write_bytes(os.urandom(3 * 1024 * 1024))
+    (source / 'maly.txt').write_bytes(b'maly plik\n' * 100)
+    handler = FileHandler(make_config(source))
+    success, message = handler.backup(str(source), str(tmp_path / 'backups'))
+    assert success, message
+    archive = [name for name in os.listdir(tmp_path / 'backups') if is_archive_name(name)][0]
+    return handler, tmp_path / 'backups', archive
+
+
+def test_restore_local_verifies_while_unpacking(make_config, tmp_path):
+    handler, backups, archive = make_backup(make_config, tmp_path)
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_local(str(backups / archive), str(restored))
+    assert success, message
+    assert (restored / 'dane' / 'maly.txt').read_bytes() == b'maly plik\n' * 100
+
+    # Niezgodna suma - nic nie trafia na miejsce, katalog tymczasowy znika
+    other = tmp_path / 'other'
+    success, message = handler.restore_local(str(backups / archive), str(other), checksum='0' * 64)
+    assert not success
+    assert 'Suma kontrolna' in message
+    assert os.listdir(other) == []
+
+
+def test_restore_selected_checks_fetched_blocks(make_config, tmp_path):
+    handler, backups, archive = make_backup(make_config, tmp_path)
+    index = MemberIndex.from_bytes((backups / index_name(archive)).read_bytes())
+    assert index.has_checksums()
+    start = index.ranges(['dane/maly.txt'])[0][0]
+    block = index.blocks[index.block_at(start)]
+    data = bytearray((backups / archive).read_bytes())
+    data[block[1] + block[2] // 2] ^= 0xff
+    (backups / archive).write_bytes(bytes(data))
+
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_selected('local', archive, ['dane/maly.txt'], str(restored), str(backups))
+    assert not success
+    assert 'Suma kontrolna bloku' in message
+    assert os.listdir(restored) == []
+
+
+def test_restore_selected_without_block_checksums_reads_whole_archive(make_config, tmp_path):
+    handler, backups, archive = make_backup(make_config, tmp_path)
+    index = MemberIndex.from_bytes((backups / index_name(archive)).read_bytes())
+    index.blocks = [block[:4] for block in index.blocks]
+    (backups / index_name(archive)).write_bytes(index.to_bytes())
+
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_selected('local', archive, ['dane/maly.txt'], str(restored), str(backups))
+    assert success, message
+    assert os.listdir(restored / 'dane') == ['maly.txt']
+
+
+def test_verify_reports_corrupted_backup(server, make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.bin').write_bytes(os.urandom(256 * 1024))
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server), pool)
+    assert handler.backup(str(source))[0]
+    backup_name = handler.list_backups(server.kind)[0]
+    success, message = handler.verify_backups(server.kind)
+    assert success and 'poprawnych: 1' in message
+
+    data = bytearray((tmp_path / 'remote' / backup_name).read_bytes())
+    data[-100] ^= 0xff
+    (tmp_path / 'remote' / backup_name).write_bytes(bytes(data))
+    success, message = handler.verify_backups(server.kind, bandwidth_kbps=1024)
+    assert not success and 'uszkodzonych: 1' in message
+    pool.close_all()
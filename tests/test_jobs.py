@@ -0,0 +1,65 @@
+import pytest
+from catalog import matches_prefix
+from file_handler import FileHandler
+from jobs import JobRunner, destination_key, job_config, load_jobs
+
+
+@pytest.mark.parametrize('jobs, message', [
+    ([{'source': '/srv'}], 'musi mieć nazwę'),
+    ([{'name': 'www'}, {'name': 'www'}], 'Powtórzona'),
+    ([{'name': 'ftp'}], 'zarezerwowana'),
+])
+def test_load_jobs_rejects_invalid_names(jobs, message):
+    with pytest.raises(ValueError, match=message):
+        load_jobs({'jobs': jobs})
+
+
+def test_load_jobs_selects_by_name():
+    config = {'jobs': [{'name': 'www'}, {'name': 'poczta'}]}
+    assert [job['name'] for job in load_jobs(config, ['poczta'])] == ['poczta']
+    with pytest.raises(ValueError, match='Nieznane zadania: inne'):
+        load_jobs(config, ['inne'])
+
+
+def test_job_config_overrides_global_settings(make_config, tmp_path):
+    config = make_config(tmp_path)
+    merged = job_config(config, {'name': 'www', 'type': 'ftp', 'max_backups': 3,
+                                 'ftp_settings': {'host': 'kopie.example'}})
+    assert merged['job_name'] == 'www'
+    assert merged['backup_locations']['type'] == 'ftp'
+    assert merged['backup_settings']['max_backups'] == 3
+    assert merged['ftp_settings']['host'] == 'kopie.example'
+    assert 'jobs' not in merged and config['ftp_settings']['host'] != 'kopie.example'
+
+
+def test_destination_key(make_config, tmp_path):
+    first = job_config(make_config(tmp_path), {'name': 'a', 'destination': str(tmp_path / 'a' / 'nowy')})
+    second = job_config(make_config(tmp_path), {'name': 'b', 'destination': str(tmp_path / 'b')})
+    # Ten sam dysk - wspólny limit, także dla katalogu, który jeszcze nie istnieje
+    assert destination_key(first, 'files') == destination_key(second, 'files')
+    remote = job_config(make_config(tmp_path), {'name': 'c', 'type': 'ssh', 'ssh_settings': {'host': 'h', 'port': 22}})
+    assert destination_key(remote, 'files') == ('ssh', 'h', 22)
+    assert destination_key(remote, 'database')[0] == 'database'
+
+
+def test_matches_prefix():
+    assert matches_prefix('backup_local_20240101_120000.tar.gz', 'backup_')
+    assert not matches_prefix('backup_www_local_20240101_120000.tar.gz', 'backup_')
+    assert matches_prefix('backup_www_local_20240101_120000.tar.gz', 'backup_www_')
+    assert matches_prefix('backup_db_www_20240101_120000.sql.gz', 'backup_db_www_')
+
+
+def test_jobs_sharing_destination_keep_separate_lists(make_config, tmp_path):
+    config = make_config(tmp_path)
+    destination = str(tmp_path / 'backups')
+    config['jobs'] = []
+    for name in ('www', 'poczta'):
+        source = tmp_path / name
+        source.mkdir()
+        (source / 'plik.txt').write_text(name)
+        config['jobs'].append({'name': name, 'source': str(source), 'destination': destination})
+    results, elapsed = JobRunner(config).run()
+    assert [result['success'] for result in results] == [True, True], results
+    for job in config['jobs']:
+        backups = FileHandler(job_config(config, job)).list_backups('local')
+        assert len(backups) == 1 and backups[0].startswith(f"backup_{job['name']}_local_")
@@ -0,0 +1,34 @@
+import os
+import re
+from file_handler import FileHandler
+from member_index import match_member
+from transport import ConnectionPool
+
+
+def test_match_member():
+    assert match_member('dane/etc/app.conf', ['dane/etc'])
+    assert match_member('dane/etc/app.conf', ['/dane/etc/'])
+    assert match_member('dane/etc/app.conf', ['*/etc/*.conf'])
+    assert not match_member('dane/etcetera/app.conf', ['dane/etc'])
+
+
+def test_selected_restore_fetches_only_needed_blocks(server, make_config, tmp_path):
+    source = tmp_path / 'dane'
+    (source / 'etc').mkdir(parents=True)
+    (source / 'duzy.bin').write_bytes(os.urandom(4 * 1024 * 1024))
+    (source / 'etc' / 'app.conf').write_text('port = 8080\n')
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server), pool)
+    success, message = handler.backup(str(source))
+    assert success, message
+    backup_name = handler.list_backups(server.kind)[0]
+    assert os.path.exists(tmp_path / 'remote' / (backup_name + '.index'))
+
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_selected(server.kind, backup_name, ['dane/etc'], str(restored))
+    assert success, message
+    assert os.listdir(restored / 'dane') == ['etc']
+    assert (restored / 'dane' / 'etc' / 'app.conf').read_text() == 'port = 8080\n'
+    fetched, total = map(float, re.search(r'pobrano ([\d.]+) z ([\d.]+) MB', message).groups())
+    assert fetched < total / 2
+    pool.close_all()
@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import threading
+import time
+from file_handler import FileHandler
+from metrics import ProgressBar, RunMetrics, format_prometheus
+
+
+def test_overlapping_phase_counts_wall_time():
+    metrics = RunMetrics('pliki')
+
+    def upload():
+        with metrics.phase('upload'):
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=upload) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with metrics.phase('archive'):
+        time.sleep(0.05)
+    metrics.finish(True, 'ok')
+    report = metrics.to_dict()
+    # Trzy równoległe wysyłania liczą się jako jeden odcinek czasu
+    assert 0.2 <= report['phases']['upload'] < 0.4
+    assert report['phases']['archive'] >= 0.05
+    assert report['success'] is True and metrics.current_phase is None
+
+
+def test_counters_and_derived_values():
+    metrics = RunMetrics('pliki')
+    metrics.add_compression({'bytes_in': 4000, 'bytes_out': 1000, 'seconds': 0.5})
+    metrics.add_connections({'connects': 1, 'connect_seconds_total': 0.5}, {'connects': 3, 'connect_seconds_total': 0.75})
+    st = os.stat(__file__)
+    items = list(metrics.count_items([('a', 'a', st), ('b', 'b', os.stat(os.path.dirname(__file__)))]))
+    assert len(items) == 2
+    report = metrics.to_dict()
+    assert report['compression_ratio'] == 4.0
+    assert report['files'] == 1 and report['bytes_read'] == st.st_size
+    assert report['connects'] == 2 and report['connect_seconds'] == 0.25
+
+
+def test_progress_bar_line():
+    stream = io.StringIO()
+    metrics = RunMetrics('pliki', progress=ProgressBar(stream))
+    with metrics.phase('archive'):
+        metrics.add('bytes_read', 2 * 1024 * 1024)
+    metrics.finish(True, 'ok')
+    output = stream.getvalue()
+    assert output.startswith('\r[archive] plików: 0, odczytano 0.0 MB') and output.endswith('\n')
+
+
+def test_prometheus_format():
+    report = {'name': 'www "główne"', 'kind': 'files', 'started': '2024-01-01T00:00:00', 'success': False,
+              'phases': {'upload': 1.5}, 'seconds': 2.0, 'files': 3}
+    text = format_prometheus([report])
+    assert 'backup_last_run_success{name="www \\"główne\\"",kind="files"} 0' in text
+    assert 'backup_phase_seconds{name="www \\"główne\\"",kind="files",phase="upload"} 1.5' in text
+    assert 'backup_files{name="www \\"główne\\"",kind="files"} 3' in text
+    assert 'backup_bytes_out' in text and 'backup_bytes_out{' not in text
+
+
+def test_backup_writes_report_and_textfile(make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.txt').write_text('dane ' * 1000)
+    textfile = tmp_path / 'backup.prom'
+    handler = FileHandler(make_config(source, report_dir=str(tmp_path / 'raporty'), prometheus_textfile=str(textfile)))
+    assert handler.backup(str(source), str(tmp_path / 'backups'))[0]
+    report = json.loads((tmp_path / 'raporty' / 'files.json').read_text())
+    assert report['success'] and report['files'] == 1 and report['bytes_in'] >= 5000
+    assert 'archive' in report['phases']
+    assert 'backup_last_run_success{name="files",kind="files"} 1' in textfile.read_text()
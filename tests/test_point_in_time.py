@@ -0,0 +1,79 @@
+import os
+from db_handler import DatabaseHandler
+
+MYSQL = '''
+    ARGS = os.environ['FAKE_ARGS']
+    query = next((arg[len('--execute='):] for arg in sys.argv if arg.startswith('--execute=')), None)
+    if query == 'SHOW MASTER STATUS':
+        print('binlog.000002\\t157')
+    elif query == 'SHOW BINARY LOGS':
+        for name in os.environ['FAKE_BINLOGS'].split(','):
+            print(f'{name}\\t1000')
+    elif query is None:
+        open(os.path.join(ARGS, 'loaded.sql'), 'ab').write(sys.stdin.buffer.read())
+'''
+
+MYSQLDUMP = '''
+    sys.stdout.write("-- CHANGE MASTER TO MASTER_LOG_FILE='binlog.000002', MASTER_LOG_POS=157;\\n")
+    sys.stdout.write('INSERT INTO `klienci` VALUES (1);\\n')
+'''
+
+MYSQLBINLOG = '''
+    args = sys.argv[1:]
+    if '--read-from-remote-server' in args:
+        directory = next(arg for arg in args if arg.startswith('--result-file='))[len('--result-file='):]
+        open(os.path.join(directory, args[-1]), 'w').write(f'-- zdarzenia {args[-1]}\\n')
+    else:
+        options = [arg for arg in args if arg.startswith('--')]
+        sys.stdout.write('-- odtwarzanie ' + ' '.join(options) + '\\n')
+        for path in args[len(options):]:
+            sys.stdout.write(open(path).read())
+'''
+
+
+def prepare(db_config, fake_program, tmp_path, monkeypatch, binlogs):
+    args = tmp_path / 'args'
+    args.mkdir()
+    monkeypatch.setenv('FAKE_ARGS', str(args))
+    monkeypatch.setenv('FAKE_BINLOGS', ','.join(binlogs))
+    fake_program('mysql', MYSQL)
+    fake_program('mysqldump', MYSQLDUMP)
+    fake_program('mysqlbinlog', MYSQLBINLOG)
+    handler = DatabaseHandler(db_config('mysql', point_in_time=True))
+    success, message = handler.backup_database()
+    assert success, message
+    backup_name = [name for name in os.listdir(tmp_path / 'backups')
+                   if name.startswith('backup_db_2') and not name.endswith('.json')][0]
+    return handler, backup_name, args
+
+
+def test_base_backup_ships_binlogs_and_replays_to_target(db_config, fake_program, tmp_path, monkeypatch):
+    binlogs = ['binlog.000001', 'binlog.000002', 'binlog.000003', 'binlog.000004']
+    handler, backup_name, args = prepare(db_config, fake_program, tmp_path, monkeypatch, binlogs)
+    # Wysyłane od pliku z pozycji kopii bazowej, bez bieżącego (otwartego) pliku
+    assert sorted(os.listdir(tmp_path / 'backups' / 'backup_db_logs')) == ['binlog.000002.gz', 'binlog.000003.gz']
+
+    success, message = handler.restore_database(backup_name, '2024-01-01 12:00:00')
+    assert success, message
+    assert 'odtworzone pliki binlog: 2' in message
+    loaded = (args / 'loaded.sql').read_text()
+    assert loaded.startswith("-- CHANGE MASTER TO MASTER_LOG_FILE='binlog.000002'")
+    assert '-- odtwarzanie --start-position=157 --stop-datetime=2024-01-01 12:00:00\n' in loaded
+    assert loaded.endswith('-- zdarzenia binlog.000002\n-- zdarzenia binlog.000003\n')
+
+
+def test_target_time_without_binlogs_fails(db_config, fake_program, tmp_path, monkeypatch, capsys):
+    # Bieżący plik z pozycji kopii bazowej nie został jeszcze zamknięty i wysłany
+    handler, backup_name, args = prepare(db_config, fake_program, tmp_path, monkeypatch, ['binlog.000002'])
+
+    success, message = handler.restore_database(backup_name, '2024-01-01 12:00:00')
+    assert not success
+    assert 'Brak plików binlog od binlog.000002' in message
+    assert not (args / 'loaded.sql').exists()
+
+    # Bez czasu docelowego przywracana jest sama kopia bazowa, z ostrzeżeniem
+    success, message = handler.restore_database(backup_name)
+    assert success, message
+    assert 'odtworzone pliki binlog: 0' in message
+    assert 'Ostrzeżenie: brak plików binlog' in capsys.readouterr().out
+    assert 'INSERT INTO `klienci`' in (args / 'loaded.sql').read_text()
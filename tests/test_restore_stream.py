@@ -0,0 +1,34 @@
+import os
+from file_handler import FileHandler
+from transport import ConnectionPool
+
+
+def test_restore_extracts_from_download_stream(server, make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    data = os.urandom(2 * 1024 * 1024)
+    (source / 'plik.bin').write_bytes(data)
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server, streaming=True), pool)
+    success, message = handler.backup(str(source))
+    assert success, message
+    backup_name = handler.list_backups(server.kind)[0]
+
+    restore = handler.restore_ftp if server.kind == 'ftp' else handler.restore_ssh
+    restored = tmp_path / 'restored'
+    success, message = restore(backup_name, str(restored))
+    assert success, message
+    assert (restored / 'dane' / 'plik.bin').read_bytes() == data
+    assert handler.last_transfer['bytes'] == os.path.getsize(tmp_path / 'remote' / backup_name)
+    # Bez pliku pośredniego w /tmp
+    assert not os.path.exists(os.path.join('/tmp', backup_name))
+
+    # Uszkodzone archiwum - nic nie trafia do miejsca docelowego
+    archive = bytearray((tmp_path / 'remote' / backup_name).read_bytes())
+    archive[len(archive) // 2] ^= 0xff
+    (tmp_path / 'remote' / backup_name).write_bytes(bytes(archive))
+    other = tmp_path / 'other'
+    success, message = restore(backup_name, str(other))
+    assert not success
+    assert os.listdir(other) == []
+    pool.close_all()
@@ -0,0 +1,95 @@
+import json
+import os
+import pytest
+import resumable
+from file_handler import FileHandler
+from file_index import FileIndex
+from resumable import ResumableTransfer
+from transport import ConnectionPool
+
+DATA = os.urandom(3 * 1024 * 1024 + 11)
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_upload_continues_partial_file(server, pool, tmp_path):
+    root = tmp_path / 'remote'
+    archive = tmp_path / 'archive.tar.gz'
+    archive.write_bytes(DATA)
+    transfer = ResumableTransfer(pool, server.kind, server.settings(), str(tmp_path / 'state'), retries=0)
+    # Przerwany transfer: połowa pliku na serwerze i punkt kontrolny
+    (root / 'archive.tar.gz').write_bytes(DATA[:len(DATA) // 2])
+    transfer.checkpoint('archive.tar.gz', 'upload').save({'confirmed': len(DATA) // 2})
+
+    transfer.upload(str(archive), 'archive.tar.gz')
+    assert (root / 'archive.tar.gz').read_bytes() == DATA
+    assert transfer.pending_uploads() == []
+
+
+def test_download_continues_part_file(server, pool, tmp_path):
+    (tmp_path / 'remote' / 'archive.tar.gz').write_bytes(DATA)
+    (tmp_path / 'downloaded.part').write_bytes(DATA[:1000])
+
+    transfer = ResumableTransfer(pool, server.kind, server.settings(), str(tmp_path / 'state'), retries=0)
+    transfer.download('archive.tar.gz', str(tmp_path / 'downloaded'))
+    assert (tmp_path / 'downloaded').read_bytes() == DATA
+    assert not (tmp_path / 'downloaded.part').exists()
+
+
+def test_sftp_download_reads_in_bounded_windows(server, pool, tmp_path, monkeypatch):
+    import paramiko
+
+    if server.kind != 'ssh':
+        pytest.skip('readv dotyczy tylko SFTP')
+    (tmp_path / 'remote' / 'archive.tar.gz').write_bytes(DATA)
+    (tmp_path / 'downloaded.part').write_bytes(DATA[:1000])
+    monkeypatch.setattr(resumable, 'DOWNLOAD_WINDOW', 1024 * 1024)
+    windows = []
+    readv = paramiko.SFTPFile.readv
+
+    def counting_readv(self, chunks, *args, **kwargs):
+        windows.append(sum(length for offset, length in chunks))
+        return readv(self, chunks, *args, **kwargs)
+
+    monkeypatch.setattr(paramiko.SFTPFile, 'readv', counting_readv)
+    monkeypatch.setattr(paramiko.SFTPFile, 'prefetch', lambda self, *args: pytest.fail('prefetch całego pliku'))
+    transfer = ResumableTransfer(pool, server.kind, server.settings(), str(tmp_path / 'state'), retries=0)
+    transfer.download('archive.tar.gz', str(tmp_path / 'downloaded'))
+    assert (tmp_path / 'downloaded').read_bytes() == DATA
+    assert max(windows) == 1024 * 1024 and sum(windows) == len(DATA) - 1000
+
+
+def test_resumed_upload_is_recorded(ftp_server, make_config, tmp_path, monkeypatch):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'a.txt').write_text('zawartość')
+    config = make_config(source, ftp_server, resumable=True, incremental=True, member_index=True,
+                         transfer_retries=0)
+    original = ResumableTransfer.upload
+
+    def interrupted(self, local_path, remote_name, backup=None):
+        self.checkpoint(remote_name, 'upload').save({'local_path': os.path.abspath(local_path),
+                                                     'remote_name': remote_name, 'backup': backup})
+        raise IOError('zerwane połączenie')
+
+    monkeypatch.setattr(resumable.ResumableTransfer, 'upload', interrupted)
+    monkeypatch.chdir(tmp_path)
+    assert not FileHandler(config).backup_ftp(str(source))[0]
+    monkeypatch.setattr(resumable.ResumableTransfer, 'upload', original)
+
+    handler = FileHandler(config)
+    handler.resume_pending_uploads('ftp')
+    names = handler.list_backups('ftp')
+    assert len(names) == 1
+    # Wpis w katalogu z sumą kontrolną, indeks członów i zatwierdzony indeks stanu plików
+    catalog = json.loads((tmp_path / 'remote' / 'backup_catalog.json').read_text())
+    assert catalog['entries'][0]['sha256']
+    assert (tmp_path / 'remote' / f'{names[0]}.index').exists()
+    index_path = handler.index_path('ftp', str(source))
+    assert FileIndex(index_path).load()[1]['last_backup'] + '.tar.gz' == names[0]
+    assert not [name for name in os.listdir(tmp_path / 'state') if name.startswith('pending_')]
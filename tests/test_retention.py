@@ -0,0 +1,66 @@
+import itertools
+import os
+from retention import expired_backups, retention_policy
+
+
+def names(*stamps, prefix='backup_local_', suffix='.tar.gz'):
+    return [f'{prefix}{stamp}{suffix}' for stamp in stamps]
+
+
+def test_keep_last_orders_by_timestamp_not_name():
+    backups = names('20240103_000000', prefix='backup_ftp_') + names('20240101_000000', '20240102_000000')
+    assert expired_backups(backups, {'keep_last': 2}) == names('20240101_000000')
+
+
+def test_no_limits_keeps_everything():
+    assert expired_backups(names('20240101_000000', '20240102_000000'), retention_policy({})) == []
+
+
+def test_grandfather_father_son():
+    backups = names('20240101_010000', '20240101_020000', '20240102_010000',
+                    '20240103_010000', '20240103_020000', '20240201_010000')
+    policy = retention_policy({'max_backups': 1, 'retention': {'keep_daily': 2, 'keep_monthly': 2}})
+    # Ostatnia kopia oraz najnowsze z dwóch ostatnich dni i dwóch ostatnich miesięcy
+    assert expired_backups(backups, policy) == names('20240103_010000', '20240102_010000',
+                                                     '20240101_020000', '20240101_010000')
+
+
+def test_kept_incremental_keeps_its_chain():
+    backups = [
+        'backup_local_20240101_000000.tar.gz',
+        'backup_local_20240102_000000_inc.tar.gz',
+        'backup_local_20240103_000000_inc.tar.gz',
+        'backup_local_20231201_000000.tar.gz'
+    ]
+    assert expired_backups(backups, {'keep_last': 1}) == ['backup_local_20231201_000000.tar.gz']
+
+
+def test_prune_remote_destination(server, make_config, tmp_path, monkeypatch):
+    from file_handler import FileHandler
+    from transport import ConnectionPool
+
+    counter = itertools.count(1)
+    monkeypatch.setattr(FileHandler, 'create_backup_name',
+                        lambda self, backup_type: f'{self.backup_prefix()}{backup_type}_20240101_{next(counter):06d}')
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.txt').write_text('dane')
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server), pool)
+    for _ in range(3):
+        assert handler.backup(str(source))[0]
+    remote = tmp_path / 'remote'
+    before = sorted(os.listdir(remote))
+
+    handler.config['backup_settings']['max_backups'] = 1
+    success, message = handler.prune_backups(server.kind, dry_run=True)
+    assert success and 'Do usunięcia kopii zapasowych: 2' in message
+    assert sorted(os.listdir(remote)) == before
+
+    success, message = handler.prune_backups(server.kind)
+    assert success and 'Usunięto kopii zapasowych: 2' in message
+    latest = f'backup_{server.kind}_20240101_000003.tar.gz'
+    # Razem z archiwami usuwane są ich indeksy członów
+    assert sorted(os.listdir(remote)) == ['backup_catalog.json', latest, latest + '.index']
+    assert handler.list_backups(server.kind) == [latest]
+    pool.close_all()
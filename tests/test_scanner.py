@@ -0,0 +1,55 @@
+import io
+import os
+import tarfile
+from scanner import ExcludeRules, TreeScanner, add_tree, prefetch
+
+
+def make_tree(root):
+    for path, data in {'a/x.txt': b'x', 'a/b/y.log': b'y' * 10, 'a/cache/z': b'z', 'c.txt': b'c' * 3000,
+                       'duzy.bin': b'd' * 5000, 'm/cache/n.txt': b'n'}.items():
+        os.makedirs(root / os.path.dirname(path), exist_ok=True)
+        (root / path).write_bytes(data)
+    os.symlink('c.txt', root / 'link')
+    os.link(root / 'c.txt', root / 'twardy')
+
+
+def test_walk_order_matches_sorted_depth_first(tmp_path):
+    make_tree(tmp_path)
+    paths = [rel_path for rel_path, path, st in TreeScanner(str(tmp_path), workers=4).walk()]
+    assert paths == ['a', 'a/b', 'a/b/y.log', 'a/cache', 'a/cache/z', 'a/x.txt', 'c.txt', 'duzy.bin',
+                     'link', 'm', 'm/cache', 'm/cache/n.txt', 'twardy']
+
+
+def test_exclude_rules_and_ignore_file(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / 'a' / '.backupignore').write_text('# komentarz\ncache/\n')
+    rules = ExcludeRules(['*.log', '/m/cache'], max_file_size=4000)
+    paths = [rel_path for rel_path, path, st in TreeScanner(str(tmp_path), rules).walk()]
+    assert paths == ['a', 'a/.backupignore', 'a/b', 'a/x.txt', 'c.txt', 'link', 'm', 'twardy']
+
+
+def test_prefetch_keeps_order_and_reads_small_files(tmp_path):
+    make_tree(tmp_path)
+    items = list(TreeScanner(str(tmp_path)).walk())
+    result = list(prefetch(items, workers=3, buffer_size=4096, threshold=4000))
+    assert [item[0] for item in result] == [item[0] for item in items]
+    data = {item[0]: item[3] for item in result}
+    assert data['c.txt'] == b'c' * 3000 and data['duzy.bin'] is None and data['a'] is None
+
+
+def test_add_tree_matches_tar_add(tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    make_tree(source)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        add_tree(tar, str(source), 'dane', prefetch(TreeScanner(str(source)).walk()))
+    expected = io.BytesIO()
+    with tarfile.open(fileobj=expected, mode='w') as tar:
+        tar.add(str(source), 'dane')
+    buffer.seek(0)
+    expected.seek(0)
+    with tarfile.open(fileobj=buffer) as ours, tarfile.open(fileobj=expected) as theirs:
+        described = [[(m.name, m.type, m.size, m.linkname, m.mode) for m in tar.getmembers()] for tar in (ours, theirs)]
+        assert described[0] == described[1]
+        assert ours.extractfile('dane/c.txt').read() == b'c' * 3000
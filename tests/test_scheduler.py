@@ -0,0 +1,65 @@
+import json
+import os
+from datetime import datetime
+import pytest
+from scheduler import RunLock, Scheduler, next_run
+
+NOW = datetime(2024, 1, 10, 14, 30, 15)  # środa
+
+
+@pytest.mark.parametrize('schedule, expected', [
+    ('30m', datetime(2024, 1, 10, 15, 0, 15)),
+    ('6h', datetime(2024, 1, 10, 20, 30, 15)),
+    ('hourly', datetime(2024, 1, 10, 15, 0)),
+    ('hourly@45', datetime(2024, 1, 10, 14, 45)),
+    ('daily', datetime(2024, 1, 11, 0, 0)),
+    ('daily@18:00', datetime(2024, 1, 10, 18, 0)),
+    ('daily@02:00', datetime(2024, 1, 11, 2, 0)),
+    ('weekly@03:00', datetime(2024, 1, 15, 3, 0)),
+    ('monthly', datetime(2024, 2, 1, 0, 0)),
+    ('Monthly@01:30', datetime(2024, 2, 1, 1, 30)),
+])
+def test_next_run(schedule, expected):
+    assert next_run(schedule, NOW) == expected
+
+
+def test_next_run_is_strictly_after_now():
+    assert next_run('daily@14:30', datetime(2024, 1, 10, 14, 30)) == datetime(2024, 1, 11, 14, 30)
+    assert next_run('monthly', datetime(2024, 12, 1)) == datetime(2025, 1, 1)
+
+
+def test_unknown_schedule():
+    with pytest.raises(ValueError):
+        next_run('yearly', NOW)
+
+
+def test_run_lock_skips_overlapping_run(tmp_path):
+    path = str(tmp_path / 'backup.lock')
+    held = RunLock(path)
+    assert held.acquire()
+    runs = []
+    assert Scheduler('daily', lambda: runs.append(1), path).run_once() is None
+    held.release()
+    Scheduler('daily', lambda: runs.append(1), path).run_once()
+    assert runs == [1]
+
+
+def test_cli_backup_and_list(make_config, tmp_path, capsys):
+    from backup_manager import EXIT_LOCKED, EXIT_SUCCESS, BackupManager, lock_path, parse_args, run_command
+
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.txt').write_text('dane')
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps(make_config(source)))
+    manager = BackupManager(str(config_file))
+    assert run_command(manager, parse_args(['--config', str(config_file), 'backup'])) == EXIT_SUCCESS
+    capsys.readouterr()
+    assert run_command(manager, parse_args(['--config', str(config_file), 'list'])) == EXIT_SUCCESS
+    assert capsys.readouterr().out.strip() in os.listdir(tmp_path / 'backups')
+
+    # Uruchomienie z crona w trakcie trwającej kopii kończy się kodem EXIT_LOCKED
+    held = RunLock(lock_path(manager.config))
+    assert held.acquire()
+    assert run_command(manager, parse_args(['--config', str(config_file), 'backup'])) == EXIT_LOCKED
+    held.release()
@@ -0,0 +1,106 @@
+import io
+import os
+import tarfile
+from file_handler import FileHandler
+from mirror import clone_file, is_mirror_name
+from sparse import SPARSE_MIN_SIZE, data_segments, sparse_member
+
+
+def make_sparse(path):
+    # Dane na początku i w środku, dziura na końcu pliku
+    with open(path, 'wb') as f:
+        f.write(b'a' * 4096)
+        f.seek(2 * SPARSE_MIN_SIZE)
+        f.write(b'b' * 4096)
+        f.truncate(4 * SPARSE_MIN_SIZE)
+    return path
+
+
+def read_sparse(path):
+    with open(path, 'rb') as f:
+        return data_segments(f.fileno(), os.fstat(f.fileno()).st_size)
+
+
+def expected_content():
+    return (b'a' * 4096 + bytes(2 * SPARSE_MIN_SIZE - 4096) + b'b' * 4096
+            + bytes(2 * SPARSE_MIN_SIZE - 4096))
+
+
+def test_sparse_member_round_trip(tmp_path):
+    path = make_sparse(tmp_path / 'obraz.img')
+    segments = read_sparse(path)
+    if segments is None or len(segments) < 2:
+        # System plików nie zgłasza dziur
+        return
+    assert segments[-1] == (4 * SPARSE_MIN_SIZE, 0)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.PAX_FORMAT) as tar, open(path, 'rb') as f:
+        info = tar.gettarinfo(str(path), 'obraz.img')
+        reader = sparse_member(info, f)
+        assert reader is not None and info.size < SPARSE_MIN_SIZE
+        tar.addfile(info, reader)
+    assert len(buffer.getvalue()) < SPARSE_MIN_SIZE
+    buffer.seek(0)
+    with tarfile.open(fileobj=buffer) as tar:
+        assert tar.extractfile('obraz.img').read() == expected_content()
+
+
+def test_dense_file_is_not_sparse(tmp_path):
+    path = tmp_path / 'gesty.bin'
+    path.write_bytes(b'x' * SPARSE_MIN_SIZE)
+    with open(path, 'rb') as f:
+        info = tarfile.TarInfo('gesty.bin')
+        info.size = SPARSE_MIN_SIZE
+        assert sparse_member(info, f) is None
+        assert info.size == SPARSE_MIN_SIZE and not info.pax_headers
+
+
+def test_clone_file_keeps_holes(tmp_path):
+    path = make_sparse(tmp_path / 'obraz.img')
+    method = clone_file(path, tmp_path / 'kopia.img')
+    assert method in ('reflink', 'copy_file_range', 'copy')
+    assert (tmp_path / 'kopia.img').read_bytes() == expected_content()
+    if method != 'reflink' and read_sparse(path) is not None:
+        assert os.stat(tmp_path / 'kopia.img').st_blocks <= os.stat(path).st_blocks
+
+
+def test_sparse_file_backup_and_restore(make_config, tmp_path):
+    source = tmp_path / 'dane'
+    source.mkdir()
+    make_sparse(source / 'obraz.img')
+    handler = FileHandler(make_config(source))
+    success, message = handler.backup(str(source), str(tmp_path / 'backups'))
+    assert success, message
+    archive = handler.list_backups('local')[0]
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_local(str(tmp_path / 'backups' / archive), str(restored))
+    assert success, message
+    assert (restored / 'dane' / 'obraz.img').read_bytes() == expected_content()
+
+
+def test_mirror_backup_reuses_unchanged_files(make_config, tmp_path, monkeypatch):
+    source = tmp_path / 'dane'
+    (source / 'katalog').mkdir(parents=True)
+    (source / 'stały.txt').write_text('bez zmian')
+    (source / 'katalog' / 'zmienny.txt').write_text('wersja 1')
+    os.symlink('stały.txt', source / 'link')
+    names = iter(['backup_local_20240101_000001', 'backup_local_20240101_000002'])
+    monkeypatch.setattr(FileHandler, 'create_backup_name', lambda self, backup_type: next(names))
+    handler = FileHandler(make_config(source, local_mode='mirror'))
+    backups = tmp_path / 'backups'
+    success, message = handler.backup(str(source), str(backups))
+    assert success, message
+
+    (source / 'katalog' / 'zmienny.txt').write_text('wersja 2')
+    success, message = handler.backup(str(source), str(backups))
+    assert success, message
+    assert 'z poprzedniej kopii: 1' in message
+    mirrors = handler.list_backups('local')
+    assert len(mirrors) == 2 and all(is_mirror_name(name) for name in mirrors)
+    assert (backups / mirrors[-1] / 'dane' / 'katalog' / 'zmienny.txt').read_text() == 'wersja 2'
+
+    restored = tmp_path / 'restored'
+    success, message = handler.restore_local(str(backups / mirrors[-1]), str(restored), ['dane/katalog/*'])
+    assert success, message
+    assert os.listdir(restored / 'dane') == ['katalog']
+    assert (restored / 'dane' / 'katalog' / 'zmienny.txt').read_text() == 'wersja 2'
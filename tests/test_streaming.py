@@ -0,0 +1,67 @@
+import os
+import pytest
+from streaming import BoundedPipe, consumer_stream, producer_stream
+
+
+def read_all(reader):
+    return b''.join(iter(lambda: reader.read(64 * 1024), b''))
+
+
+def test_producer_stream_round_trip():
+    data = os.urandom(1024 * 1024 + 17)
+
+    def produce(pipe):
+        for offset in range(0, len(data), 10000):
+            pipe.write(data[offset:offset + 10000])
+
+    with producer_stream(produce, capacity=32 * 1024) as stream:
+        assert read_all(stream) == data
+
+
+def test_consumer_stream_round_trip():
+    data = os.urandom(512 * 1024)
+    received = []
+
+    with consumer_stream(lambda pipe: received.append(read_all(pipe)), capacity=16 * 1024) as pipe:
+        for offset in range(0, len(data), 7000):
+            pipe.write(data[offset:offset + 7000])
+    assert received == [data]
+
+
+def test_producer_error_reaches_reader():
+    def produce(pipe):
+        pipe.write(b'abc')
+        raise ValueError('błąd producenta')
+
+    with pytest.raises(ValueError):
+        with producer_stream(produce) as stream:
+            read_all(stream)
+
+
+def test_full_pipe_write_times_out():
+    pipe = BoundedPipe(4)
+    pipe.write(b'abcd')
+    with pytest.raises(TimeoutError):
+        pipe.write(b'e', timeout=0.05)
+
+
+def test_streamed_upload_renamed_after_transfer(server, make_config, tmp_path):
+    from file_handler import FileHandler
+    from transport import ConnectionPool
+
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(tmp_path, server), pool)
+    data = os.urandom(300 * 1024)
+    handler.upload_stream(server.kind, 'kopia.tar.gz', lambda f: f.write(data))
+    assert sorted(os.listdir(tmp_path / 'remote')) == ['kopia.tar.gz']
+    assert (tmp_path / 'remote' / 'kopia.tar.gz').read_bytes() == data
+
+    def fail(f):
+        f.write(data)
+        raise ValueError('błąd producenta')
+
+    with pytest.raises(ValueError):
+        handler.upload_stream(server.kind, 'przerwana.tar.gz', fail)
+    # Przerwana kopia nie zostawia pliku pod nazwą docelową ani tymczasową
+    assert sorted(os.listdir(tmp_path / 'remote')) == ['kopia.tar.gz']
+    pool.close_all()
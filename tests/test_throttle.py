@@ -0,0 +1,65 @@
+import io
+import json
+import os
+import time
+from datetime import datetime
+from throttle import Throttle, ThrottledReader, TokenBucket, current_limits, in_window
+
+
+def test_windows_cross_midnight_and_first_match_wins():
+    assert in_window('22:00-06:00', datetime(2024, 1, 1, 23, 30))
+    assert in_window('22:00-06:00', datetime(2024, 1, 1, 5, 59))
+    assert not in_window('22:00-06:00', datetime(2024, 1, 1, 6, 0))
+    settings = {'upload_kbps': 100, 'read_kbps': 0, 'windows': [
+        {'hours': '08:00-20:00', 'upload_kbps': 2000},
+        {'hours': '00:00-23:59', 'upload_kbps': 1, 'read_kbps': 5}]}
+    assert current_limits(settings, datetime(2024, 1, 1, 12, 0)) == {'upload_kbps': 2000, 'read_kbps': 0}
+    assert current_limits(settings, datetime(2024, 1, 1, 21, 0)) == {'upload_kbps': 1, 'read_kbps': 5}
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(1024 * 1024)
+    start = time.monotonic()
+    # Kubełek startuje pusty - 1 MB przy 1 MB/s to około sekundy
+    for _ in range(4):
+        bucket.consume(256 * 1024)
+    assert time.monotonic() - start >= 0.4
+    bucket.set_rate(0)
+    start = time.monotonic()
+    bucket.consume(100 * 1024 * 1024)
+    assert time.monotonic() - start < 0.1
+
+
+def test_throttled_reader_consumes_bucket():
+    throttle = Throttle()
+    throttle.configure({'read_kbps': 512})
+    reader = ThrottledReader(io.BytesIO(b'x' * 512 * 1024), 'read_kbps', throttle)
+    start = time.monotonic()
+    while reader.read(64 * 1024):
+        pass
+    assert time.monotonic() - start >= 0.4
+
+
+def test_config_file_reload(tmp_path):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'backup_settings': {'throttle': {'upload_kbps': 100}}}))
+    throttle = Throttle()
+    throttle.watch(str(config_file))
+    assert throttle.limits['upload_kbps'] == 100 and throttle.buckets['upload_kbps'].rate == 100 * 1024
+
+    config_file.write_text(json.dumps({'backup_settings': {'throttle': {'upload_kbps': 300}}}))
+    os.utime(config_file, ns=(0, time.time_ns() + 10 ** 9))
+    throttle.hangup()
+    throttle.refresh()
+    assert throttle.limits['upload_kbps'] == 300
+
+
+def test_priority_command_prefix(monkeypatch):
+    monkeypatch.setattr('shutil.which', lambda name: f'/usr/bin/{name}')
+    throttle = Throttle()
+    throttle.configure({'nice': 10, 'ionice_class': 'best-effort', 'ionice_level': 9})
+    assert throttle.priority_command(['pg_dump']) == ['nice', '-n', '10', 'ionice', '-c', '2', '-n', '7', 'pg_dump']
+    throttle.configure({'ionice_class': 'idle'})
+    assert throttle.priority_command(['mysqldump']) == ['ionice', '-c', '3', 'mysqldump']
+    throttle.configure({'ionice_class': 'realtime'})
+    assert throttle.priority_command(['tar']) == ['tar']
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import pytest
+from integrity import ChecksumMismatch
+from parallel_transfer import ParallelTransfer, find_volumes, group_volumes
+from transport import ConnectionPool
+
+servers = pytest.importorskip('servers')
+DATA = os.urandom(17 * 1024 * 1024 + 123)
+
+
+@pytest.fixture(params=['ftp', 'ssh'])
+def remote(request, tmp_path):
+    if request.param == 'ftp':
+        pytest.importorskip('pyftpdlib')
+        server = servers.FTPServer(str(tmp_path / 'remote')).start()
+    else:
+        server = servers.SFTPServer(str(tmp_path / 'remote'), str(tmp_path / 'keys')).start()
+    pool = ConnectionPool()
+    yield request.param, server.settings(), pool, tmp_path / 'remote'
+    pool.close_all()
+    server.stop()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / 'archive.tar.gz'
+    path.write_bytes(DATA)
+    return path
+
+
+def test_parallel_round_trip(remote, archive, tmp_path):
+    kind, settings, pool, root = remote
+    transfer = ParallelTransfer(pool, kind, settings, streams=3)
+    stats = transfer.upload(str(archive), 'archive.tar.gz')
+    assert stats['streams'] == 3 and stats['bytes'] == len(DATA)
+
+    names = os.listdir(root)
+    volumes = find_volumes(names, 'archive.tar.gz')
+    # FTP wysyła woluminy, SFTP zapisuje segmenty w jednym pliku
+    assert group_volumes(names) == ['archive.tar.gz']
+    assert len(volumes) == (3 if kind == 'ftp' else 0)
+
+    local_path = tmp_path / 'downloaded'
+    transfer.download('archive.tar.gz', str(local_path), volumes)
+    assert local_path.read_bytes() == DATA
+
+
+def test_reassembled_file_is_checked_against_sha256(remote, archive, tmp_path):
+    kind, settings, pool, root = remote
+    checksum = hashlib.sha256(DATA).hexdigest()
+    transfer = ParallelTransfer(pool, kind, settings, streams=3)
+    with pytest.raises(ChecksumMismatch):
+        transfer.upload(str(archive), 'archive.tar.gz', '0' * 64)
+    transfer.upload(str(archive), 'archive.tar.gz', checksum)
+
+    # Uszkodzony bajt w środkowym segmencie (woluminie) na serwerze
+    volumes = find_volumes(os.listdir(root), 'archive.tar.gz')
+    name = volumes[1] if volumes else 'archive.tar.gz'
+    data = bytearray((root / name).read_bytes())
+    data[len(data) // 2] ^= 0xff
+    (root / name).write_bytes(bytes(data))
+    with pytest.raises(ChecksumMismatch):
+        transfer.download('archive.tar.gz', str(tmp_path / 'downloaded'), volumes, checksum)
+    # Bez sumy z katalogu sprawdzany jest tylko rozmiar
+    transfer.download('archive.tar.gz', str(tmp_path / 'downloaded'), volumes)
+    assert (tmp_path / 'downloaded').read_bytes() != DATA
+
+
+def test_parallel_restore_fails_on_corrupted_segment(server, make_config, tmp_path):
+    from file_handler import FileHandler
+
+    source = tmp_path / 'dane'
+    source.mkdir()
+    (source / 'plik.bin').write_bytes(DATA)
+    pool = ConnectionPool()
+    handler = FileHandler(make_config(source, server, transfer_streams=3, parallel_threshold_mb=1), pool)
+    success, message = handler.backup(str(source))
+    assert success and 'strumienie: 3' in message, message
+    backup_name = handler.list_backups(server.kind)[0]
+    name = (find_volumes(os.listdir(tmp_path / 'remote'), backup_name) or [backup_name])[-1]
+    data = bytearray((tmp_path / 'remote' / name).read_bytes())
+    data[-1000] ^= 0xff
+    (tmp_path / 'remote' / name).write_bytes(bytes(data))
+
+    success, message = getattr(handler, f'restore_{server.kind}')(backup_name, str(tmp_path / 'restored'))
+    # Błąd zgłasza już pobieranie, przed rozpakowaniem archiwum
+    assert not success and f'{server.kind.upper()}: Suma kontrolna' in message
+    assert not os.path.exists(os.path.join('/tmp', backup_name))
+    assert not (tmp_path / 'restored').exists()
+    pool.close_all()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import ctypes
+import json
+import os
+import platform
+import shutil
+import threading
+import time
+from datetime import datetime
+
+RELOAD_INTERVAL = 5
+BURST_SECONDS = 0.5
+MIN_BURST = 64 * 1024
+MAX_SLEEP = 1.0
+LIMITS = ('upload_kbps', 'read_kbps')
+
+# Tylko klasy obniżające priorytet; realtime wymaga uprawnień administratora
+IOPRIO_CLASSES = {
+    'best-effort': 2,
+    'idle': 3
+}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# Numer wywołania systemowego ioprio_set zależy od architektury
+SYS_IOPRIO_SET = {
+    'x86_64': 251,
+    'aarch64': 30,
+    'i386': 289,
+    'i686': 289,
+    'armv7l': 314,
+    'ppc64le': 273,
+    's390x': 282
+}
+
+
+def parse_hours(text):
+    start, _, end = text.partition('-')
+    minutes = []
+    for value in (start, end):
+        hour, minute = value.strip().split(':')
+        minutes.append(int(hour) * 60 + int(minute))
+    return minutes
+
+
+def in_window(hours, now):
+    # Okno '22:00-06:00' obejmuje północ
+    start, end = parse_hours(hours)
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def current_limits(settings, now=None):
+    # Limity domyślne nadpisane przez pierwsze okno czasowe obejmujące
+    # bieżącą godzinę, np. {"hours": "08:00-20:00", "upload_kbps": 2000}
+    now = now or datetime.now()
+    limits = {name: settings.get(name, 0) for name in LIMITS}
+    for window in settings.get('windows', []):
+        if in_window(window['hours'], now):
+            limits.update({name: window[name] for name in LIMITS if name in window})
+            break
+    return limits
+
+
+def set_io_priority(tid, value):
+    number = SYS_IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, tid, value) == 0
+
+
+class TokenBucket:
+    # Kubełek żetonów współdzielony przez wątki: pobranie większe niż stan
+    # kubełka zadłuża go, a kolejne pobrania czekają na spłatę długu.
+    # Limit można zmienić w trakcie transferu; 0 - bez limitu.
+    def __init__(self, bytes_per_second=0):
+        self.rate = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.set_rate(bytes_per_second)
+
+    def capacity(self):
+        return max(self.rate * BURST_SECONDS, MIN_BURST)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.capacity(), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, bytes_per_second):
+        with self._lock:
+            self._refill()
+            if bytes_per_second != self.rate:
+                self.rate = bytes_per_second
+                self.tokens = min(self.tokens, self.capacity()) if bytes_per_second > 0 else 0.0
+
+    def consume(self, size):
+        with self._lock:
+            self._refill()
+            if self.rate <= 0:
+                return
+            self.tokens -= size
+        while True:
+            with self._lock:
+                self._refill()
+                if self.rate <= 0 or self.tokens >= 0:
+                    return
+                delay = -self.tokens / self.rate
+            # Krótkie odcinki snu, aby zmiana limitu działała od razu
+            time.sleep(min(delay, MAX_SLEEP))
+
+
+class Throttle:
+    # Ograniczenia wspólne dla całego procesu (wszystkich zadań): limity
+    # przepustowości wysyłania i odczytu źródła oraz priorytet CPU/IO
+    # wątków kompresji i narzędzi zrzutu bazy. Ustawienia
+    # backup_settings.throttle są ponownie wczytywane z pliku konfiguracyjnego
+    # po jego zmianie, więc działający demon nie wymaga restartu.
+    def __init__(self):
+        self.settings = {}
+        self.config_file = None
+        self.mtime = None
+        self.checked = 0.0
+        self.limits = None
+        self.forced = False
+        self.buckets = {'upload_kbps': TokenBucket(), 'read_kbps': TokenBucket()}
+        self._lock = threading.Lock()
+
+    def configure(self, settings):
+        self.settings = dict(settings or {})
+        self.apply()
+
+    def watch(self, config_file, config=None):
+        self.config_file = config_file
+        self.mtime = None
+        if not self.reload() and config is not None:
+            self.configure(config.get('backup_settings', {}).get('throttle', {}))
+
+    def reload(self, force=False):
+        if self.config_file is None:
+            return False
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.mtime and not force:
+            return False
+        try:
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # Plik w trakcie zapisu - zostają dotychczasowe limity
+            return False
+        self.mtime = mtime
+        self.configure(config.get('backup_settings', {}).get('throttle', {}))
+        return True
+
+    def hangup(self, *args):
+        # SIGHUP w trybie demona: limity wczytywane są przy najbliższym
+        # odczycie lub zapisie (bez blokady - sygnał może przerwać wątek,
+        # który ją trzyma)
+        self.forced = True
+        self.checked = 0.0
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.checked < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if now - self.checked < RELOAD_INTERVAL:
+                return
+            self.checked = now
+            forced, self.forced = self.forced, False
+            if not self.reload(forced):
+                # Okna czasowe zmieniają limity także bez zmiany pliku
+                self.apply()
+
+    def apply(self):
+        limits = current_limits(self.settings)
+        if self.limits is not None and limits != self.limits:
+            print(f"Zmieniono limity przepustowości: wysyłanie {format_limit(limits['upload_kbps'])}, "
+                  f"odczyt źródła {format_limit(limits['read_kbps'])}")
+        self.limits = limits
+        for name, bucket in self.buckets.items():
+            bucket.set_rate(max(0, limits[name]) * 1024)
+
+    def consume(self, name, size):
+        self.refresh()
+        self.buckets[name].consume(size)
+
+    def io_priority(self):
+        io_class = self.settings.get('ionice_class', '')
+        if io_class not in IOPRIO_CLASSES:
+            return None
+        level = 0 if io_class == 'idle' else min(7, max(0, self.settings.get('ionice_level', 7)))
+        return IOPRIO_CLASSES[io_class] << IOPRIO_CLASS_SHIFT | level
+
+    def lower_thread_priority(self):
+        # Inicjalizator wątków puli: w Linuksie nice i ionice dotyczą
+        # pojedynczego wątku, więc wątek główny zachowuje swój priorytet
+        self.refresh()
+        tid = threading.get_native_id()
+        nice = self.settings.get('nice', 0)
+        if nice > 0:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, max(nice, os.getpriority(os.PRIO_PROCESS, tid)))
+            except OSError:
+                pass
+        io_priority = self.io_priority()
+        if io_priority is not None:
+            set_io_priority(tid, io_priority)
+
+    def priority_command(self, command):
+        # Polecenie poprzedzone nice/ionice (jeśli są dostępne w systemie)
+        self.refresh()
+        prefix = []
+        nice = self.settings.get('nice', 0)
+        if nice > 0 and shutil.which('nice'):
+            prefix += ['nice', '-n', str(nice)]
+        io_class = self.settings.get('ionice_class', '')
+        if io_class in IOPRIO_CLASSES and shutil.which('ionice'):
+            prefix += ['ionice', '-c', str(IOPRIO_CLASSES[io_class])]
+            if io_class != 'idle':
+                prefix += ['-n', str(min(7, max(0, self.settings.get('ionice_level', 7))))]
+        return prefix + command
+
+
+class ThrottledReader:
+    # Plik do odczytu ograniczony kubełkiem name (upload_kbps lub read_kbps)
+    def __init__(self, fileobj, name, throttle=None):
+        self.fileobj = fileobj
+        self.name = name
+        self.throttle = throttle or default_throttle
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if data:
+            self.throttle.consume(self.name, len(data))
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+def format_limit(kbps):
+    return f'{kbps} KB/s' if kbps > 0 else 'bez limitu'
+
+
+default_throttle = Throttle()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import atexit
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from ftplib import FTP
+import paramiko
+
+KEEPALIVE_INTERVAL = 30
+HEALTH_CHECK_AFTER = 5
+IDLE_TIMEOUT = 300
+MAX_IDLE = 4
+
+
+def connect_ftp(settings):
+    ftp = FTP()
+    ftp.connect(host=settings['host'], port=settings['port'])
+    ftp.login(user=settings['username'], passwd=settings['password'])
+    return ftp
+
+
+def connect_ssh(settings):
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(
+        hostname=settings['host'],
+        port=settings['port'],
+        username=settings['username'],
+        key_filename=settings['key_path']
+    )
+    return ssh
+
+
+class FTPConnection:
+    def __init__(self, settings):
+        self.ftp = connect_ftp(settings)
+        self.last_used = time.monotonic()
+
+    def is_healthy(self):
+        try:
+            self.ftp.voidcmd('NOOP')
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.ftp.quit()
+        except Exception:
+            self.ftp.close()
+
+
+class SSHConnection:
+    def __init__(self, settings):
+        self.ssh = connect_ssh(settings)
+        # Pakiety keepalive utrzymują sesję przy życiu między operacjami
+        self.ssh.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+        self.sftp = self.ssh.open_sftp()
+        self.last_used = time.monotonic()
+
+    def is_healthy(self):
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            self.sftp.normalize('.')
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.sftp.close()
+        finally:
+            self.ssh.close()
+
+
+CONNECTION_TYPES = {
+    'ftp': FTPConnection,
+    'ssh': SSHConnection
+}
+
+
+class ConnectionPool:
+    # Pula połączeń kluczowana (typ, host, port, użytkownik, skrót danych
+    # uwierzytelniających). Wszystkie operacje w procesie współdzielą
+    # rozgrzane sesje zamiast ponawiać połączenie TCP, logowanie i wymianę
+    # kluczy SSH dla każdej operacji.
+    def __init__(self, max_idle=MAX_IDLE, idle_timeout=IDLE_TIMEOUT, health_check_after=HEALTH_CHECK_AFTER):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'connects': 0,
+            'reuses': 0,
+            'reconnects': 0,
+            'connect_seconds_total': 0.0,
+            'connect_seconds_last': 0.0
+        }
+
+    @staticmethod
+    def key(kind, settings):
+        # Skrót danych uwierzytelniających, aby zmiana hasła lub klucza (np.
+        # inne ustawienia zadania) nie wydała sesji otwartej na stare dane
+        credentials = repr((settings.get('password'), settings.get('key_path'))).encode()
+        return kind, settings['host'], settings['port'], settings['username'], hashlib.sha256(credentials).hexdigest()
+
+    def _connect(self, kind, settings):
+        started = time.monotonic()
+        connection = CONNECTION_TYPES[kind](settings)
+        elapsed = time.monotonic() - started
+        connection.pool_key = self.key(kind, settings)
+        with self._lock:
+            self._metrics['connects'] += 1
+            self._metrics['connect_seconds_total'] += elapsed
+            self._metrics['connect_seconds_last'] = elapsed
+        return connection
+
+    def acquire(self, kind, settings):
+        key = self.key(kind, settings)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                connection = idle.pop() if idle else None
+            if connection is None:
+                return self._connect(kind, settings)
+            # Sprawdzenie stanu tylko dla sesji, które dłużej czekały w puli
+            if time.monotonic() - connection.last_used < self.health_check_after or connection.is_healthy():
+                with self._lock:
+                    self._metrics['reuses'] += 1
+                return connection
+            self.discard(connection)
+            with self._lock:
+                self._metrics['reconnects'] += 1
+
+    def release(self, connection):
+        connection.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(connection.pool_key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, kind, settings):
+        connection = self.acquire(kind, settings)
+        try:
+            yield connection
+        except BaseException:
+            # Stan sesji po błędzie jest nieznany - nie wraca do puli
+            self.discard(connection)
+            raise
+        self.release(connection)
+
+    def keepalive(self):
+        # Wywoływane między zadaniami: zamyka zbyt długo bezczynne sesje,
+        # a pozostałe odświeża, aby serwer ich nie rozłączył
+        now = time.monotonic()
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle = {}
+        for connection in connections:
+            if now - connection.last_used > self.idle_timeout or not connection.is_healthy():
+                self.discard(connection)
+                continue
+            with self._lock:
+                self._idle.setdefault(connection.pool_key, []).append(connection)
+
+    def close_all(self):
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle = {}
+        for connection in connections:
+            self.discard(connection)
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['idle'] = sum(len(idle) for idle in self._idle.values())
+        return metrics
+
+
+default_pool = ConnectionPool()
+atexit.register(default_pool.close_all)